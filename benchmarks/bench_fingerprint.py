@@ -0,0 +1,94 @@
+"""
+Compare the buffer-based dataset fingerprint against the former
+``hashlib.sha256(str(dict))`` approach.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_fingerprint
+
+"""
+import hashlib
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from gstat_classroom.fingerprint import dataset_fingerprint
+
+SIZES = [1_000, 100_000, 1_000_000]
+REPEAT = 5
+
+# the unsummarized repr takes minutes at 1M points, skip it above this size
+FULL_STR_MAX = 100_000
+
+
+def str_hash(data: dict) -> str:
+    return hashlib.sha256(str(data).encode()).hexdigest()
+
+
+def full_str_hash(data: dict) -> str:
+    # what str() would have to do to avoid collisions
+    with np.printoptions(threshold=sys.maxsize):
+        return str_hash(data)
+
+
+def measure(func, data, repeat=REPEAT):
+    # best of repeat wall time
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(data)
+        best = min(best, time.perf_counter() - t0)
+
+    # peak memory of a single call
+    tracemalloc.start()
+    func(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return best, peak
+
+
+def make_dataset(n, seed=42):
+    rng = np.random.default_rng(seed)
+    return dict(
+        coordinates=rng.gamma(14, 6, size=(n, 2)),
+        values=rng.gamma(150, 2, size=n)
+    )
+
+
+def collisions(n):
+    # change a single value in the middle of the array
+    a = make_dataset(n)
+    b = make_dataset(n)
+    b['values'][n // 2] += 1.0
+
+    return str_hash(a) == str_hash(b), dataset_fingerprint(a) == dataset_fingerprint(b)
+
+
+def main():
+    header = '%10s | %10s %10s | %10s %10s | %10s %10s | %s'
+    print(header % (
+        'n', 'str [s]', 'str [MiB]', 'full [s]', 'full [MiB]', 'buffer [s]', 'buffer [MiB]', 'collision (str / buffer)'
+    ))
+    print('-' * 120)
+    for n in SIZES:
+        data = make_dataset(n)
+        t_str, m_str = measure(str_hash, data)
+        if n <= FULL_STR_MAX:
+            t_full, m_full = measure(full_str_hash, data, repeat=1)
+            full = '%10.5f %10.2f' % (t_full, m_full / 2**20)
+        else:
+            full = '%10s %10s' % ('-', '-')
+        t_buf, m_buf = measure(dataset_fingerprint, data)
+        col_str, col_buf = collisions(n)
+
+        print('%10d | %10.5f %10.2f | %s | %10.5f %10.2f | %s / %s' % (
+            n, t_str, m_str / 2**20, full, t_buf, m_buf / 2**20, col_str, col_buf
+        ), flush=True)
+    print('\nstr: former summarized repr, full: repr without summarization, buffer: dataset_fingerprint')
+
+
+if __name__ == '__main__':
+    main()
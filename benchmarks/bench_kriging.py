@@ -0,0 +1,52 @@
+"""
+Wall time of the kriging grid interpolation, serial and tiled across
+the worker pool. The pool is started before the timing, as the app keeps
+it running.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_kriging
+
+"""
+import os
+import time
+
+import numpy as np
+
+from gstat_classroom import settings
+from gstat_classroom.datasets import pancake
+from gstat_classroom.estimation import Variogram
+from gstat_classroom.kriging import krige
+
+GRID_SIZES = [50, 100, 200]
+N_JOBS = sorted(n for n in {1, 2, 4, settings.POOL_PROCESSES} if n <= settings.POOL_PROCESSES)
+
+
+def main():
+    data = pancake(seed=42)
+    V = Variogram(data['coordinates'], data['values'], n_lags=15)
+
+    # start the workers of the pool
+    krige(V, 20, min_points=5, max_points=15, chunk_size=10, n_jobs=settings.POOL_PROCESSES)
+
+    print('%d CPU cores, %d pool processes' % (os.cpu_count() or 1, settings.POOL_PROCESSES))
+    print('%10s | %s' % ('grid', ' | '.join('%6d jobs [s]' % n for n in N_JOBS)))
+    print('-' * (13 + 17 * len(N_JOBS)))
+    for grid_size in GRID_SIZES:
+        times = []
+        reference = None
+        for n_jobs in N_JOBS:
+            t0 = time.perf_counter()
+            field, _ = krige(V, grid_size, min_points=5, max_points=15, n_jobs=n_jobs)
+            times.append(time.perf_counter() - t0)
+
+            # tiles have to be stitched back into the same field
+            if reference is None:
+                reference = field
+            assert np.array_equal(reference, field, equal_nan=True)
+
+        print('%10s | %s' % ('%dx%d' % (grid_size, grid_size), ' | '.join('%15.3f' % t for t in times)), flush=True)
+
+
+if __name__ == '__main__':
+    main()
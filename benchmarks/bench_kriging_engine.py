@@ -0,0 +1,121 @@
+"""
+Wall time of the kriging engines on one grid, and the reuse of kriging
+matrices by the 'grouped' engine.
+
+    skgstat   skgstat.OrdinaryKriging, one system per grid point
+    batched   cached grid neighbors, systems solved batched per chunk
+    grouped   cached grid neighbors, one inverted matrix per neighbor set
+
+Scenarios follow the chapter3 usage: a single kriging with an empty
+matrix cache, a progressive kriging with previews, and the same grid
+kriged again after changing min_points, which keeps the neighbor sets.
+The grid neighbors are queried before the timing starts, as the
+DataManager caches them per dataset. skgstat runs with the default
+settings.KRIGING_N_JOBS of the app. The other engines krige in the
+calling process by default, as the matrix caches of the pool workers can
+not be emptied between the scenarios. Use --jobs to krige them in the
+worker pool as well.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_kriging_engine
+    python -m benchmarks.bench_kriging_engine --grid-size 200 --points 10 30
+
+"""
+import time
+import argparse
+
+import numpy as np
+
+from gstat_classroom.datasets import DataManager
+from gstat_classroom import estimation, settings
+from gstat_classroom.kriging import krige, preview_levels, nests, MATRICES, GROUPING
+
+ENGINES = ('skgstat', 'batched', 'grouped')
+
+
+def progressive(V, grid_size, min_points, max_points, **kwargs):
+    # the levels of chapter3's run_kriging, coarser points are copied
+    coarse = None
+    for size in preview_levels(grid_size):
+        neighbors = kwargs.get('neighbors')
+        kw = dict(kwargs, neighbors=neighbors(size)) if neighbors is not None else kwargs
+        coarse = krige(V, size, min_points, max_points, coarse=coarse if coarse is not None and nests(coarse[0].shape[0], size) else None, **kw)
+    return coarse
+
+
+def run(V, dm, dataset, grid_size, min_points, max_points, mode, engine, n_jobs=1):
+    kwargs = dict(mode=mode)
+    if engine != 'skgstat':
+        kwargs.update(engine=engine, n_jobs=n_jobs, neighbors=lambda size: dm.get_grid_neighbors(dataset, size))
+
+    def krige_once(min_p):
+        kw = dict(kwargs, neighbors=kwargs['neighbors'](grid_size)) if 'neighbors' in kwargs else kwargs
+        return krige(V, grid_size, min_p, max_points, **kw)
+
+    results = {}
+    for scenario, func in (
+        ('single', lambda: krige_once(min_points)),
+        ('progressive', lambda: progressive(V, grid_size, min_points, max_points, **kwargs)),
+        ('min_points changed', lambda: krige_once(max(1, min_points - 2)))
+    ):
+        # the last scenario reuses the matrices of the first one
+        if scenario == 'min_points changed':
+            krige_once(min_points)
+        else:
+            MATRICES.clear()
+        MATRICES.hits = MATRICES.misses = 0
+        GROUPING.update(points=0, groups=0)
+
+        t0 = time.perf_counter()
+        field, _ = func()
+        results[scenario] = dict(
+            time=time.perf_counter() - t0,
+            field=field,
+            hits=MATRICES.hits,
+            misses=MATRICES.misses,
+            points=GROUPING['points'],
+            groups=GROUPING['groups']
+        )
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--dataset', default='pancake')
+    parser.add_argument('--grid-size', type=int, default=100)
+    parser.add_argument('--points', type=int, nargs=2, default=[5, 15], metavar=('MIN', 'MAX'))
+    parser.add_argument('--mode', default='exact', choices=['exact', 'estimate'])
+    parser.add_argument('--jobs', type=int, default=1, help='tiles kriged at the same time by the batched and grouped engines')
+    args = parser.parse_args()
+
+    dm = DataManager(backend='memory')
+    data = dm.get_data(args.dataset)
+    V = estimation.estimate(data['coordinates'], data['values'], estimation.variogram_settings(args.dataset, n_lags=15))
+
+    # compile the model, query the neighbors of all levels
+    krige(V, 10, *args.points)
+    for size in preview_levels(args.grid_size):
+        dm.get_grid_neighbors(args.dataset, size)
+
+    results = {engine: run(V, dm, args.dataset, args.grid_size, *args.points, args.mode, engine=engine, n_jobs=args.jobs) for engine in ENGINES}
+
+    print('%s, %dx%d grid, %d-%d neighbors, %s mode, %d skgstat jobs, %d jobs\n' % (args.dataset, args.grid_size, args.grid_size, args.points[0], args.points[1], args.mode, settings.KRIGING_N_JOBS, args.jobs))
+    print('%-20s %-8s %9s %9s %9s %12s %9s' % ('scenario', 'engine', 'time [s]', 'speedup', 'max diff', 'points/set', 'hit rate'))
+    print('-' * 82)
+    for scenario in results['skgstat']:
+        reference = results['skgstat'][scenario]
+        for engine in ENGINES:
+            r = results[engine][scenario]
+            lookups = r['hits'] + r['misses']
+            print('%-20s %-8s %9.3f %8.1fx %9.2g %12s %9s' % (
+                scenario, engine, r['time'], reference['time'] / r['time'],
+                np.nanmax(np.abs(r['field'] - reference['field'])),
+                '%.2f' % (r['points'] / r['groups']) if r['groups'] else '-',
+                '%.1f%%' % (100 * r['hits'] / lookups) if lookups else '-'
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+"""
+Wall time and peak memory of variogram estimation and kriging across the
+settings offered in the app.
+
+The variograms are estimated by gstat_classroom.estimation.estimate, with
+the pairwise distances of the DataManager, and kriged by
+gstat_classroom.kriging.krige, like the chapter callbacks do. The
+distances are calculated and skgstat is compiled once per dataset,
+before the timing starts. The neighbor search of a kriging grid is cached
+by the DataManager, so that only the first run of a grid size includes
+it. Models are compiled on their first use, the best time of
+``--repeat 2`` or more runs excludes that.
+Datasets are the built-in ``random_3d`` and ``pancake`` and synthetic 2D
+fields of growing size. The 3D dataset is not kriged, as the kriging grid
+is 2D.
+
+By default, every setting is varied on its own, starting from the
+defaults of the app. ``--full`` runs all combinations instead. Peak memory
+is measured by tracemalloc in a separate run, so that the timings are not
+affected. Configurations running longer than ``--timeout`` seconds are
+stopped and reported as timeout, ie. the Genton estimator, which is
+quadratic in the number of point pairs. The address space of the process
+is limited to ``--max-memory`` GiB, so that configurations exceeding it
+fail with a MemoryError instead of being killed by the OS, ie. the ward
+binning, which is quadratic in the number of point pairs as well. The
+results are written to a JSON file, ``--compare`` prints the time ratio
+to an earlier result file.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_suite --output results.json
+    python -m benchmarks.bench_suite --sizes 250 1000 --compare results.json
+
+"""
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import platform
+import itertools
+import tracemalloc
+try:
+    import resource
+except ImportError:
+    resource = None
+from datetime import datetime
+
+import numpy as np
+import skgstat
+
+from gstat_classroom import settings, estimation
+from gstat_classroom.datasets import DataManager
+from gstat_classroom.kriging import krige
+
+# defaults of the chapter2 and chapter3 controls
+VARIOGRAM_DEFAULTS = dict(model='spherical', estimator='matheron', bin_func='even', fit_method='trf', fit_sigma='none', n_lags=10)
+VARIOGRAM_MATRIX = dict(
+    model=list(settings.MODELS),
+    estimator=list(settings.ESTIMATORS),
+    bin_func=list(settings.BINNING),
+    fit_method=list(settings.FITTING),
+    fit_sigma=list(settings.FITTING_WEIGHTS)
+)
+KRIGING_DEFAULTS = dict(grid_size=50, mode='exact', points=(5, 15))
+KRIGING_MATRIX = dict(
+    grid_size=[25, 50, 75, 100],
+    mode=['exact', 'estimate'],
+    points=[(3, 10), (5, 15), (10, 30)]
+)
+SIZES = [250, 500, 1000, 2000]
+
+
+def synthetic(n, seed=42) -> dict:
+    """Smooth 2D field with noise, sampled at n random locations"""
+    rng = np.random.default_rng(seed)
+    coords = rng.uniform(0, 100, size=(n, 2))
+    values = 50 + 20 * np.sin(coords[:, 0] / 15) * np.cos(coords[:, 1] / 20) + rng.normal(0, 2, n)
+    return dict(coordinates=coords, values=values)
+
+
+def configurations(defaults: dict, matrix: dict, full=False):
+    """Setting dicts: the defaults with one setting changed, or all combinations"""
+    if full:
+        for combination in itertools.product(*matrix.values()):
+            yield dict(defaults, **dict(zip(matrix.keys(), combination)))
+        return
+
+    yield dict(defaults)
+    for name, options in matrix.items():
+        for option in options:
+            if option != defaults[name]:
+                yield dict(defaults, **{name: option})
+
+
+def _timeout(signum, frame):
+    raise TimeoutError('stopped after the time limit')
+
+
+def limited(func, timeout=None):
+    """Call func, raise TimeoutError after timeout seconds, if supported by the OS"""
+    if timeout is None or not hasattr(signal, 'setitimer'):
+        return func()
+
+    previous = signal.signal(signal.SIGALRM, _timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return func()
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def measure(func, repeat=1, memory=True, timeout=None) -> dict:
+    """Best wall time of repeat runs and peak traced memory of one more run"""
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        limited(func, timeout=timeout)
+        best = min(best, time.perf_counter() - t0)
+
+    result = dict(time=best)
+    if memory:
+        tracemalloc.start()
+        try:
+            limited(func, timeout=timeout)
+            result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        except TimeoutError:
+            # tracemalloc slows down Python code
+            pass
+        finally:
+            tracemalloc.stop()
+
+    return result
+
+
+def error(e) -> str:
+    # first line only, some errors print whole matrices
+    return ('%s: %s' % (type(e).__name__, str(e).strip().split('\n')[0]))[:200]
+
+
+def estimate(dm, name, params):
+    data = dm.get_data(name)
+    p = estimation.variogram_settings(name, dist_func='euclidean', **params)
+    return estimation.estimate(
+        data['coordinates'], data['values'], p,
+        distance_index=lambda: dm.get_distance_index(name, 'euclidean')
+    )
+
+
+def run(datasets, sizes, full=False, repeat=1, memory=True, kriging=True, timeout=None):
+    dm = DataManager(backend='memory')
+    for n in sizes:
+        dm.register('synthetic_%d' % n, synthetic, label='Synthetic field of %d points' % n, n=n)
+    names = list(datasets) + ['synthetic_%d' % n for n in sizes]
+
+    results = []
+    for name in names:
+        data = dm.get_data(name)
+        n, dims = data['coordinates'].shape
+        dm.get_distance_index(name, 'euclidean')
+
+        # skgstat compiles its estimators on first use
+        V = estimate(dm, name, VARIOGRAM_DEFAULTS)
+
+        for params in configurations(VARIOGRAM_DEFAULTS, VARIOGRAM_MATRIX, full=full):
+            record = dict(kind='variogram', dataset=name, n=n, params=params)
+            try:
+                record.update(measure(lambda: estimate(dm, name, params), repeat=repeat, memory=memory, timeout=timeout))
+            except Exception as e:
+                record['error'] = error(e)
+            results.append(record)
+            report(record)
+
+        if not kriging or dims != 2:
+            continue
+
+        for params in configurations(KRIGING_DEFAULTS, KRIGING_MATRIX, full=full):
+            min_points, max_points = params['points']
+            record = dict(kind='kriging', dataset=name, n=n, params=dict(params, points=list(params['points'])))
+
+            def func():
+                neighbors = dm.get_grid_neighbors(name, params['grid_size'])
+                return krige(V, params['grid_size'], min_points, max_points, mode=params['mode'], neighbors=neighbors)
+            try:
+                record.update(measure(func, repeat=repeat, memory=memory, timeout=timeout))
+            except Exception as e:
+                record['error'] = error(e)
+            results.append(record)
+            report(record)
+
+    return results
+
+
+def label(record) -> str:
+    return '%s %s %s' % (record['kind'], record['dataset'], ' '.join('%s=%s' % kv for kv in sorted(record['params'].items())))
+
+
+def report(record):
+    if 'error' in record:
+        print('%-110s %s' % (label(record), record['error']), flush=True)
+    else:
+        peak = '%8.1f MB' % (record['peak_bytes'] / 2**20) if 'peak_bytes' in record else ''
+        print('%-110s %8.3f s %s' % (label(record), record['time'], peak), flush=True)
+
+
+def compare(results, path):
+    with open(path) as f:
+        previous = {label(r): r for r in json.load(f)['results'] if 'time' in r}
+
+    print('\n%-110s %10s %10s %8s' % ('configuration', 'before [s]', 'now [s]', 'ratio'))
+    for r in results:
+        before = previous.get(label(r))
+        if before is not None and 'time' in r:
+            print('%-110s %10.3f %10.3f %8.2f' % (label(r), before['time'], r['time'], r['time'] / before['time']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--datasets', nargs='*', default=['random_3d', 'pancake'], help='built-in datasets')
+    parser.add_argument('--sizes', nargs='*', type=int, default=SIZES, help='sizes of the synthetic datasets')
+    parser.add_argument('--full', action='store_true', help='run all combinations of the settings')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per configuration, the best time is reported')
+    parser.add_argument('--no-memory', action='store_true', help='do not measure the peak memory')
+    parser.add_argument('--no-kriging', action='store_true', help='only estimate variograms')
+    parser.add_argument('--timeout', type=float, default=60, help='time limit per configuration in seconds')
+    parser.add_argument('--max-memory', type=float, default=None, help='address space limit in GiB, defaults to the physical memory')
+    parser.add_argument('--output', default='bench_suite.json', help='JSON result file')
+    parser.add_argument('--compare', help='JSON result file of an earlier run')
+    args = parser.parse_args()
+
+    with open(os.path.join(os.path.dirname(settings.__file__), 'VERSION')) as f:
+        version = f.read().strip()
+
+    # large allocations fail with MemoryError, instead of the OS killing the process
+    if resource is not None:
+        max_memory = args.max_memory * 2**30 if args.max_memory else os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+        resource.setrlimit(resource.RLIMIT_AS, (int(max_memory), resource.RLIM_INFINITY))
+
+    t0 = time.perf_counter()
+    results = run(args.datasets, args.sizes, full=args.full, repeat=args.repeat, memory=not args.no_memory, kriging=not args.no_kriging, timeout=args.timeout)
+
+    meta = dict(
+        version=version,
+        date=datetime.utcnow().isoformat(),
+        python=sys.version.split()[0],
+        numpy=np.__version__,
+        skgstat=skgstat.__version__,
+        platform=platform.platform(),
+        cpu_count=os.cpu_count(),
+        kriging_n_jobs=settings.KRIGING_N_JOBS,
+        args=vars(args),
+        duration=time.perf_counter() - t0
+    )
+    with open(args.output, 'w') as f:
+        json.dump(dict(meta=meta, results=results), f, indent=2)
+    print('\n%d configurations in %.1f s, written to %s' % (len(results), meta['duration'], args.output))
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
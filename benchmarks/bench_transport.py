@@ -0,0 +1,74 @@
+"""
+Payload size and server-side serialization time of the kriging surfaces,
+sent as JSON float lists or as encoded arrays.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_transport
+
+"""
+import json
+import time
+
+import numpy as np
+import plotly
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+from gstat_classroom.transport import ENCODINGS, figure_payload, decode_array
+
+GRID_SIZES = [100, 250, 500]
+REPEAT = 3
+
+
+def make_figure(grid_size, seed=42):
+    # smooth field with NaN at the border, like a kriging result
+    rng = np.random.default_rng(seed)
+    xx, yy = np.mgrid[0:1:grid_size * 1j, 0:1:grid_size * 1j]
+    field = 200 + 50 * np.sin(6 * xx) * np.cos(4 * yy) + rng.normal(0, 1, xx.shape)
+    sigma = 1 + 10 * (xx - 0.5)**2 + 10 * (yy - 0.5)**2
+    field[0, :] = np.nan
+
+    fig = make_subplots(rows=1, cols=2, specs=[[{'type': 'surface'}, {'type': 'surface'}]])
+    fig.add_trace(go.Surface(z=field, colorscale='Earth_r'), row=1, col=1)
+    fig.add_trace(go.Surface(z=np.log(sigma), colorscale='thermal', showscale=False), row=1, col=2)
+
+    return fig, field
+
+
+def measure(func):
+    best = float('inf')
+    for _ in range(REPEAT):
+        t0 = time.perf_counter()
+        out = func()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def main():
+    # this is how Dash serializes callback outputs
+    def dumps(obj):
+        return json.dumps(obj, cls=plotly.utils.PlotlyJSONEncoder)
+
+    print('%10s | %10s | %10s %10s %10s | %s' % ('grid', 'encoding', 'size [kB]', 'time [ms]', 'ratio', 'max. error'))
+    print('-' * 80)
+    for grid_size in GRID_SIZES:
+        fig, field = make_figure(grid_size)
+
+        t_json, body = measure(lambda: dumps(fig))
+        size_json = len(body)
+        print('%10s | %10s | %10.1f %10.1f %10s | %s' % (
+            '%dx%d' % (grid_size, grid_size), 'json', size_json / 1e3, t_json * 1e3, '1.0', '-'
+        ))
+
+        for encoding in ENCODINGS:
+            t, body = measure(lambda: dumps(figure_payload(fig, encoding=encoding)))
+            z = decode_array(json.loads(body)['encoded'][0]['z'])
+            error = np.nanmax(np.abs(z - field))
+            print('%10s | %10s | %10.1f %10.1f %10.1f | %.2g' % (
+                '', encoding, len(body) / 1e3, t * 1e3, size_json / len(body), error
+            ), flush=True)
+
+
+if __name__ == '__main__':
+    main()
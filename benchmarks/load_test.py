@@ -0,0 +1,333 @@
+"""
+Load test simulating a classroom of students working on the app at once.
+
+Every simulated student is a thread running sessions of the callback
+requests the browser sends to ``/_dash-update-component``:
+
+    estimate   chapter2: move a slider, estimate the variogram, then update
+               the variogram plot and the description
+    kriging    chapter3: click the kriging button, poll the job every
+               500 ms like dcc.Interval until it is done, then load the
+               surfaces
+
+Each student picks random settings, so that some requests hit the caches
+and others do not. Reported are the latency percentiles per callback, the
+throughput, the error rate, and the time from the kriging click to the
+finished field.
+
+By default, the app is started in a subprocess on a free local port,
+served by the threaded werkzeug server. To test a multi-worker setup,
+start it yourself and pass its URL, ie.
+
+    GSTAT_CLASSROOM_CACHE=sqlite:////tmp/load.db gunicorn -w 4 -b 127.0.0.1:8050 gstat_classroom.index:server
+    python -m benchmarks.load_test --url http://127.0.0.1:8050 --students 60
+
+Run from the repository root:
+
+    python -m benchmarks.load_test --students 30 --duration 60
+
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import threading
+import subprocess
+import urllib.request
+import urllib.error
+from collections import defaultdict
+
+import numpy as np
+
+from gstat_classroom import settings
+
+SCENARIOS = ('estimate', 'kriging')
+PERCENTILES = (50, 90, 95, 99)
+
+# interval of the kriging job polling, see chapter3
+POLL_INTERVAL = 0.5
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int, timeout=120):
+    """Serve the app in a subprocess, returns it once the app responds"""
+    code = 'from werkzeug.serving import run_simple; from gstat_classroom.index import server; ' \
+           'run_simple("127.0.0.1", %d, server, threaded=True)' % port
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.getcwd(), os.environ.get('PYTHONPATH')])))
+    proc = subprocess.Popen([sys.executable, '-W', 'ignore', '-c', code], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    url = 'http://127.0.0.1:%d' % port
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError('The server exited with code %d' % proc.returncode)
+        try:
+            urllib.request.urlopen(url + '/', timeout=5).read()
+            return proc, url
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.5)
+
+    proc.terminate()
+    raise RuntimeError('The server did not start within %d seconds' % timeout)
+
+
+def payload(outputs, inputs, state=(), changed=()) -> dict:
+    """Request body of a callback, as sent by the Dash renderer
+
+    outputs, inputs and state are lists of (id, property, value) tuples,
+    outputs without value.
+    """
+    spec = [dict(id=i, property=p) for i, p in outputs]
+    if len(outputs) == 1:
+        output, spec = '%s.%s' % outputs[0], spec[0]
+    else:
+        output = '..%s..' % '...'.join('%s.%s' % o for o in outputs)
+
+    return dict(
+        output=output,
+        outputs=spec,
+        inputs=[dict(id=i, property=p, value=v) for i, p, v in inputs],
+        state=[dict(id=i, property=p, value=v) for i, p, v in state],
+        changedPropIds=['%s.%s' % c for c in changed]
+    )
+
+
+class Student:
+    """One simulated browser session"""
+    def __init__(self, url, stats, rng, dataset, grid_size, think_time):
+        self.url = url
+        self.stats = stats
+        self.rng = rng
+        self.dataset = dataset
+        self.grid_size = grid_size
+        self.think_time = think_time
+        self.session_id = '%032x' % rng.getrandbits(128)
+        self.variogram_id = None
+        self.kriging_id = None
+        self.n_clicks = 0
+
+    def post(self, name, body):
+        """Send a callback request, returns the response or None"""
+        req = urllib.request.Request(
+            self.url + '/_dash-update-component',
+            data=json.dumps(body).encode(),
+            headers={'Content-Type': 'application/json'}
+        )
+        t0 = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=120) as r:
+                status, content = r.status, r.read()
+        except urllib.error.HTTPError as e:
+            status, content = e.code, b''
+        except (urllib.error.URLError, ConnectionError, socket.timeout):
+            status, content = None, b''
+        self.stats.record(name, time.perf_counter() - t0, status, len(content))
+
+        # 204 is sent, if the callback prevented the update
+        if status == 200:
+            return json.loads(content)['response']
+        return None
+
+    def think(self):
+        time.sleep(self.rng.uniform(0.5, 1.5) * self.think_time)
+
+    def estimate(self):
+        # a random slider position and model
+        inputs = [
+            ('data-store', 'data', self.dataset),
+            ('select-model', 'value', self.rng.choice(list(settings.MODELS))),
+            ('select-estimator', 'value', 'matheron'),
+            ('bin-function', 'value', 'even'),
+            ('dist-function', 'value', 'euclidean'),
+            ('n-lags', 'value', self.rng.randint(5, 30)),
+            ('fit-function', 'value', 'trf'),
+            ('fit-sigma', 'value', 'none'),
+            ('maxlag', 'data', None)
+        ]
+        res = self.post('estimate_variogram', payload(
+            [('current-variogram-id', 'data'), ('variogram-plot-loading', 'is_loading')],
+            inputs,
+            state=[('current-variogram-id', 'data', self.variogram_id), ('session-id', 'data', self.session_id)],
+            changed=[('n-lags', 'value')]
+        ))
+        if res is None:
+            return
+        self.variogram_id = res['current-variogram-id']['data']
+
+        # the components depending on the variogram
+        self.post('update_main_variogram_plot', payload(
+            [('variogram-plot', 'figure')], [('current-variogram-id', 'data', self.variogram_id)],
+            changed=[('current-variogram-id', 'data')]
+        ))
+        self.post('update_variogram_description', payload(
+            [('variogram-description', 'children')], [('current-variogram-id', 'data', self.variogram_id)],
+            changed=[('current-variogram-id', 'data')]
+        ))
+
+    def kriging(self):
+        if self.variogram_id is None:
+            self.estimate()
+        if self.variogram_id is None:
+            return
+
+        outputs = [
+            ('kriging-job-id', 'data'),
+            ('kriging-job-interval', 'disabled'),
+            ('kriging-progress', 'value'),
+            ('kriging-job-status', 'children'),
+            ('current-kriging-id', 'data')
+        ]
+
+        def body(trigger, job_id, n_intervals):
+            return payload(outputs, [
+                ('start-button', 'n_clicks', self.n_clicks),
+                ('kriging-job-interval', 'n_intervals', n_intervals)
+            ], state=[
+                ('kriging-job-id', 'data', job_id),
+                ('current-kriging-id', 'data', self.kriging_id),
+                ('current-variogram-id', 'data', self.variogram_id),
+                ('grid-size', 'value', self.grid_size),
+                ('points', 'value', [5, 15]),
+                ('mode-select', 'value', 'exact'),
+                ('progressive-select', 'value', ['progressive'])
+            ], changed=[trigger])
+
+        self.n_clicks += 1
+        t0 = time.perf_counter()
+        res = self.post('kriging', body(('start-button', 'n_clicks'), None, None))
+        if res is None:
+            return
+
+        # poll like dcc.Interval, until the interval is disabled
+        job_id = res.get('kriging-job-id', {}).get('data')
+        n_intervals = 0
+        while not res['kriging-job-interval']['disabled']:
+            time.sleep(POLL_INTERVAL)
+            n_intervals += 1
+            res = self.post('kriging', body(('kriging-job-interval', 'n_intervals'), job_id, n_intervals))
+            if res is None:
+                return
+            self.load_field(res)
+
+        self.load_field(res)
+        if 'finished' in res['kriging-job-status']['children'] or 'cache' in res['kriging-job-status']['children']:
+            self.stats.record('kriging (click to field)', time.perf_counter() - t0, 200, 0)
+        else:
+            self.stats.record('kriging (click to field)', time.perf_counter() - t0, 500, 0)
+
+    def load_field(self, res):
+        # a new preview or the final field
+        kriging_id = res.get('current-kriging-id', {}).get('data')
+        if kriging_id is None or kriging_id == self.kriging_id:
+            return
+        self.kriging_id = kriging_id
+        self.post('update_fields_figure', payload(
+            [('kriging-surfaces', 'data')], [('current-kriging-id', 'data', kriging_id)],
+            changed=[('current-kriging-id', 'data')]
+        ))
+
+    def run(self, scenarios, until):
+        while time.time() < until:
+            getattr(self, self.rng.choice(scenarios))()
+            self.think()
+
+
+class Stats:
+    """Thread-safe request latencies and outcomes"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.bytes = defaultdict(int)
+
+    def record(self, name, seconds, status, size):
+        with self._lock:
+            self.latency[name].append(seconds)
+            self.bytes[name] += size
+            if status not in (200, 204):
+                self.errors[name] += 1
+
+    def summary(self, elapsed) -> dict:
+        result = {}
+        for name, lat in sorted(self.latency.items()):
+            lat = np.array(lat)
+            result[name] = dict(
+                requests=len(lat),
+                throughput=len(lat) / elapsed,
+                error_rate=self.errors[name] / len(lat),
+                mean_bytes=self.bytes[name] / len(lat),
+                max=float(lat.max()),
+                **{'p%d' % p: float(np.percentile(lat, p)) for p in PERCENTILES}
+            )
+        return result
+
+
+def report(summary, elapsed, students):
+    print('\n%d students, %.1f s' % (students, elapsed))
+    print('%-28s %8s %8s %8s | %s %8s' % ('callback', 'requests', 'req/s', 'errors', ' '.join('%8s' % ('p%d [s]' % p) for p in PERCENTILES), 'max [s]'))
+    print('-' * 110)
+    for name, s in summary.items():
+        print('%-28s %8d %8.2f %7.1f%% | %s %8.3f' % (
+            name, s['requests'], s['throughput'], 100 * s['error_rate'],
+            ' '.join('%8.3f' % s['p%d' % p] for p in PERCENTILES), s['max']
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--url', help='URL of a running app, by default the app is started locally')
+    parser.add_argument('--students', type=int, default=30, help='number of concurrent sessions')
+    parser.add_argument('--duration', type=float, default=60, help='seconds of load')
+    parser.add_argument('--scenarios', nargs='*', default=list(SCENARIOS), choices=SCENARIOS)
+    parser.add_argument('--dataset', default='pancake', help='dataset of all sessions')
+    parser.add_argument('--grid-size', type=int, default=50, help='kriging grid size')
+    parser.add_argument('--think-time', type=float, default=1.0, help='mean pause between two actions in seconds')
+    parser.add_argument('--ramp-up', type=float, default=5.0, help='seconds until all students started')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='JSON result file')
+    args = parser.parse_args()
+
+    proc = None
+    url = args.url
+    if url is None:
+        proc, url = start_server(free_port())
+        print('Started the app at %s' % url)
+
+    try:
+        stats = Stats()
+        start = time.time()
+        until = start + args.duration
+        threads = []
+        for i in range(args.students):
+            student = Student(url.rstrip('/'), stats, random.Random(args.seed + i), args.dataset, args.grid_size, args.think_time)
+            t = threading.Thread(target=student.run, args=(args.scenarios, until), daemon=True)
+            threads.append(t)
+            t.start()
+            time.sleep(args.ramp_up / args.students)
+
+        for t in threads:
+            t.join()
+        elapsed = time.time() - start
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+    summary = stats.summary(elapsed)
+    report(summary, elapsed, args.students)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(dict(args=vars(args), elapsed=elapsed, callbacks=summary), f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,10 @@
 import dash
+import flask
 import dash_bootstrap_components as dbc
 
+from gstat_classroom import settings
+from gstat_classroom.metrics import instrument
+
 # build the main dash app
 # this instance will be served to all the child pages
 app = dash.Dash(
@@ -9,3 +13,19 @@ app = dash.Dash(
     suppress_callback_exceptions=True
 )
 server = app.server
+
+# the upload size limit of the browser is enforced by the server as well
+server.config['MAX_CONTENT_LENGTH'] = settings.REQUEST_MAX_BYTES
+
+
+@server.before_request
+def limit_request_size():
+    # werkzeug only checks MAX_CONTENT_LENGTH for form data, not for the
+    # JSON body of a callback
+    length = flask.request.content_length
+    if length is not None and length > server.config['MAX_CONTENT_LENGTH']:
+        flask.abort(413)
+
+
+# record the performance of all callbacks, served at /metrics
+instrument(app)
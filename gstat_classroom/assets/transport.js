@@ -0,0 +1,54 @@
+/*
+ * Decode arrays encoded by gstat_classroom/transport.py and build figures
+ * from them in the browser.
+ */
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    transport: {
+        // decode to an array of rows (2D) or a flat array (1D)
+        decodeArray: function(encoded) {
+            var raw = atob(encoded.data);
+            var bytes = new Uint8Array(raw.length);
+            for (var i = 0; i < raw.length; i++) {
+                bytes[i] = raw.charCodeAt(i);
+            }
+
+            var values;
+            if (encoded.encoding === 'float32') {
+                values = new Float32Array(bytes.buffer);
+            } else {
+                var quantized = encoded.encoding === 'uint16' ? new Uint16Array(bytes.buffer) : bytes;
+                var nan = encoded.encoding === 'uint16' ? 65535 : 255;
+                values = new Float64Array(quantized.length);
+                for (var j = 0; j < quantized.length; j++) {
+                    values[j] = quantized[j] === nan ? NaN : encoded.offset + quantized[j] * encoded.scale;
+                }
+            }
+
+            if (encoded.shape.length === 1) {
+                return Array.from(values);
+            }
+            var cols = encoded.shape[1];
+            var rows = [];
+            for (var r = 0; r < encoded.shape[0]; r++) {
+                rows.push(Array.from(values.subarray(r * cols, (r + 1) * cols)));
+            }
+            return rows;
+        },
+
+        // figure with encoded trace attributes, ie. {z: {...encoded}}
+        decodeFigure: function(payload) {
+            if (!payload) {
+                throw window.dash_clientside.PreventUpdate;
+            }
+            var decode = window.dash_clientside.transport.decodeArray;
+            var figure = payload.figure;
+
+            payload.encoded.forEach(function(attrs, idx) {
+                Object.keys(attrs).forEach(function(name) {
+                    figure.data[idx][name] = decode(attrs[name]);
+                });
+            });
+            return figure;
+        }
+    }
+});
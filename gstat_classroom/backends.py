@@ -0,0 +1,617 @@
+"""
+Storage backends for the DataManager.
+
+The default ``memory`` backend is a :class:`CacheStore` private to each
+process. Under gunicorn, every worker has its own DataManager, so the
+variogram hash stored in the browser session may point to a worker that
+never saw it. The ``sqlite`` backend stores serialized entries in a
+database file shared by all workers on the same host. The ``disk``
+backend stores one compressed file per entry in a directory. Entries of
+both survive a restart of the app.
+
+Backends are selected by URL:
+
+    memory
+    sqlite:///relative/path/cache.db
+    sqlite:////absolute/path/cache.db
+    disk:///relative/path
+    disk:////absolute/path
+
+"""
+import io
+import os
+import re
+import time
+import uuid
+import pickle
+import sqlite3
+import threading
+import zlib
+
+from skgstat import Variogram
+
+from gstat_classroom.cache import CacheStore
+from gstat_classroom.fingerprint import fingerprint
+
+
+# Variograms are stored without these attributes. Callables may be local
+# closures which can't be pickled, the arrays can be rebuilt from the data.
+_VARIOGRAM_SKIP = (
+    '_estimator', '_model', '_bin_func', '_diff', '_diff_pending', '_groups',
+    '_sorted_pairs_cache', '_experimental_cache', '_distance_index'
+)
+
+
+def _variogram_state(variogram: Variogram) -> dict:
+    state = {k: v for k, v in vars(variogram).items() if k not in _VARIOGRAM_SKIP}
+    params = variogram.describe()['params']
+    state['__class__'] = type(variogram)
+    state['__names__'] = dict(
+        estimator=params['estimator'],
+        model=params['model'],
+        bin_func=variogram._bin_func_name
+    )
+    return state
+
+
+def _load_variogram(state: dict) -> Variogram:
+    state = dict(state)
+    names = state.pop('__names__')
+    cls = state.pop('__class__', Variogram)
+
+    V = cls.__new__(cls)
+    V.__dict__.update(state)
+
+    # the setters restore the functions, but reset the fit
+    V.set_bin_func(names['bin_func'])
+    V.set_estimator(names['estimator'])
+    V.set_model(names['model'])
+
+    # restore the fitted state. Classes with a _diff property, like
+    # gstat_classroom.estimation.Variogram, build the pairwise differences
+    # on first access
+    V.__dict__.update(state)
+    V._diff = None
+    V._groups = None
+    if isinstance(getattr(cls, '_diff', None), property):
+        V._diff_pending = True
+    else:
+        V._calc_diff()
+
+    return V
+
+
+class _Pickler(pickle.Pickler):
+    def reducer_override(self, obj):
+        if isinstance(obj, Variogram):
+            return _load_variogram, (_variogram_state(obj), )
+        return NotImplemented
+
+
+def dumps(obj, level=1) -> bytes:
+    """Serialize and compress obj, Variograms are stored compactly"""
+    buf = io.BytesIO()
+    _Pickler(buf, protocol=pickle.HIGHEST_PROTOCOL).dump(obj)
+    return zlib.compress(buf.getvalue(), level)
+
+
+def loads(blob: bytes):
+    """Inverse of dumps"""
+    return pickle.loads(zlib.decompress(blob))
+
+
+class SQLiteBackend:
+    """Cache store backed by a SQLite database shared between processes
+
+    Implements the same interface as :class:`CacheStore`. The size of an
+    entry is the length of its serialized form. Expired and least recently
+    used entries are only evicted, once a set exceeds a limit, down to
+    EVICT_TO of the limits. Hit, miss and eviction counters are tracked
+    per process.
+
+    Parameters
+    ----------
+    path : str
+        Path to the database file. Created if it does not exist.
+    table : str
+        Table name, use one table per kind of entry.
+    max_entries : int
+        Maximum number of entries. None disables the limit.
+    max_bytes : int
+        Maximum total size of the serialized entries. None disables the limit.
+    ttl : float
+        Seconds after which an entry expires. None disables expiry.
+    local_entries : int
+        Number of deserialized entries additionally kept in process memory.
+        Entries are immutable, as they are content addressed.
+    touch_interval : float
+        The access time of an entry is updated on a hit, if it is older
+        than touch_interval seconds. Least recently used entries are
+        evicted first, at this resolution.
+
+    """
+    EVICT_TO = 0.9
+
+    def __init__(self, path, table='cache', max_entries=None, max_bytes=None, ttl=None, local_entries=8, touch_interval=60):
+        if not table.isidentifier():
+            raise ValueError('table has to be a valid identifier')
+
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.touch_interval = touch_interval
+
+        # small in-process cache of deserialized entries
+        self._local = CacheStore(max_entries=local_entries, ttl=ttl) if local_entries else None
+
+        # sqlite connections can't be shared between threads
+        self._conn = threading.local()
+
+        # counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        # create the table
+        dirname = os.path.dirname(os.path.abspath(path))
+        os.makedirs(dirname, exist_ok=True)
+        self._db.execute(
+            f'CREATE TABLE IF NOT EXISTS {table} ('
+            'key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+            'stime REAL NOT NULL, atime REAL NOT NULL, size INTEGER NOT NULL)'
+        )
+        self._db.execute(f'CREATE INDEX IF NOT EXISTS {table}_atime ON {table} (atime)')
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        # never reuse a connection inherited from a forked parent process
+        if getattr(self._conn, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.conn = conn
+            self._conn.pid = os.getpid()
+        return self._conn.conn
+
+    def __len__(self):
+        return self._db.execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+
+    def __contains__(self, key):
+        row = self._db.execute(f'SELECT stime FROM {self.table} WHERE key=?', (key, )).fetchone()
+        return row is not None and not self._is_expired(row[0])
+
+    def keys(self) -> list:
+        return [r[0] for r in self._db.execute(f'SELECT key FROM {self.table} ORDER BY atime')]
+
+    @property
+    def total_bytes(self) -> int:
+        return self._db.execute(f'SELECT COALESCE(SUM(size), 0) FROM {self.table}').fetchone()[0]
+
+    def get(self, key, default=None):
+        if key is None:
+            self.misses += 1
+            return default
+
+        # check the local copy first
+        if self._local is not None:
+            value = self._local.get(key)
+            if value is not None and self._touch(key):
+                self.hits += 1
+                return value
+
+        row = self._db.execute(
+            f'SELECT value, stime, atime FROM {self.table} WHERE key=?', (key, )
+        ).fetchone()
+
+        if row is None:
+            self.misses += 1
+            return default
+
+        # expired entries are treated as misses
+        if self._is_expired(row[1]):
+            self.remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return default
+
+        self._touch(key, atime=row[2])
+        value = loads(row[0])
+        if self._local is not None:
+            self._local.set(key, value)
+
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        blob = dumps(value)
+        now = time.time()
+
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.execute(
+                f'INSERT OR REPLACE INTO {self.table} (key, value, stime, atime, size) VALUES (?, ?, ?, ?, ?)',
+                (key, blob, now, now, len(blob))
+            )
+            n_entries, n_bytes = db.execute(f'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}').fetchone()
+            if self._exceeds(n_entries, n_bytes):
+                self._evict(db, keep=key)
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+
+        if self._local is not None:
+            self._local.set(key, value)
+
+    def remove(self, key):
+        self._db.execute(f'DELETE FROM {self.table} WHERE key=?', (key, ))
+        if self._local is not None:
+            self._local.remove(key)
+
+    def expire(self, max_age=None) -> int:
+        """Remove all entries older than max_age seconds, defaults to ttl"""
+        max_age = self.ttl if max_age is None else max_age
+        if max_age is None:
+            return 0
+
+        n = self._db.execute(
+            f'DELETE FROM {self.table} WHERE stime < ?', (time.time() - max_age, )
+        ).rowcount
+        self.expirations += n
+
+        if self._local is not None:
+            self._local.expire(max_age=max_age)
+
+        return n
+
+    def clear(self):
+        self._db.execute(f'DELETE FROM {self.table}')
+        if self._local is not None:
+            self._local.clear()
+
+    def stats(self) -> dict:
+        return dict(
+            entries=len(self),
+            bytes=self.total_bytes,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            expirations=self.expirations
+        )
+
+    def _is_expired(self, stime) -> bool:
+        return self.ttl is not None and time.time() - stime > self.ttl
+
+    def _touch(self, key, atime=None) -> bool:
+        # mark as recently used, returns False if the entry is gone.
+        # Every update is a write transaction, hits mostly only read
+        if atime is None:
+            row = self._db.execute(f'SELECT atime FROM {self.table} WHERE key=?', (key, )).fetchone()
+            if row is None:
+                return False
+            atime = row[0]
+
+        now = time.time()
+        if now - atime >= self.touch_interval:
+            self._db.execute(f'UPDATE {self.table} SET atime=? WHERE key=?', (now, key))
+        return True
+
+    def _exceeds(self, n_entries, n_bytes, fraction=1) -> bool:
+        return (self.max_entries is not None and n_entries > fraction * self.max_entries) or \
+            (self.max_bytes is not None and n_bytes > fraction * self.max_bytes)
+
+    def _evict(self, db, keep):
+        # expired entries go first
+        if self.ttl is not None:
+            self.expirations += db.execute(
+                f'DELETE FROM {self.table} WHERE stime < ?', (time.time() - self.ttl, )
+            ).rowcount
+
+        # least recently used entries, the new one is never evicted. EVICT_TO
+        # of the limits is kept, so that the next sets do not evict again
+        rows = db.execute(
+            f'SELECT key, size FROM {self.table} WHERE key != ? ORDER BY atime DESC', (keep, )
+        ).fetchall()
+        n_entries = 1
+        n_bytes = db.execute(f'SELECT size FROM {self.table} WHERE key=?', (keep, )).fetchone()[0]
+
+        drop = []
+        for key, size in rows:
+            n_entries += 1
+            n_bytes += size
+            if self._exceeds(n_entries, n_bytes, self.EVICT_TO):
+                drop.append((key, ))
+                n_entries -= 1
+                n_bytes -= size
+
+        db.executemany(f'DELETE FROM {self.table} WHERE key=?', drop)
+        self.evictions += len(drop)
+
+
+class DiskBackend:
+    """Cache store keeping one file per entry in a directory
+
+    Implements the same interface as :class:`CacheStore`. Entries are
+    serialized by :func:`dumps` and written atomically, so several
+    processes can share the directory. Entries are read lazily on lookup.
+    The modification time of a file is the time the entry was set, its
+    access time is updated on every hit and used to evict the least
+    recently used entries. Hit, miss and eviction counters are tracked
+    per process.
+
+    Parameters
+    ----------
+    path : str
+        Directory of the entries. Created if it does not exist.
+    max_entries : int
+        Maximum number of entries. None disables the limit.
+    max_bytes : int
+        Disk quota of the entries in bytes. None disables the limit.
+    ttl : float
+        Seconds after which an entry expires. None disables expiry.
+    local_entries : int
+        Number of deserialized entries additionally kept in process memory.
+    scan_interval : float
+        The directory is scanned for expired and least recently used
+        entries, if the entries set since the last scan may exceed a limit,
+        or the last scan is older than scan_interval seconds. Entries set
+        by other processes are only noticed by a scan.
+
+    """
+    SUFFIX = '.bin'
+    EVICT_TO = 0.9
+
+    def __init__(self, path, max_entries=None, max_bytes=None, ttl=None, local_entries=8, scan_interval=60):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.scan_interval = scan_interval
+        os.makedirs(path, exist_ok=True)
+
+        # entries and bytes found by the last scan plus the ones set since,
+        # None until the first scan
+        self._usage = None
+        self._scanned = 0
+        self._usage_lock = threading.Lock()
+
+        # small in-process cache of deserialized entries
+        self._local = CacheStore(max_entries=local_entries, ttl=ttl) if local_entries else None
+
+        # counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _file(self, key) -> str:
+        # keys are used as file names, if they are safe to use
+        name = key if re.fullmatch(r'[A-Za-z0-9_\-]{1,128}', key) else fingerprint(key)
+        return os.path.join(self.path, name + self.SUFFIX)
+
+    def _entries(self) -> list:
+        # (name, set time, access time, size) of all entries
+        entries = []
+        with os.scandir(self.path) as it:
+            for e in it:
+                if e.name.endswith(self.SUFFIX):
+                    try:
+                        st = e.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((e.name[:-len(self.SUFFIX)], st.st_mtime, st.st_atime, st.st_size))
+        return entries
+
+    def __len__(self):
+        return len(self._entries())
+
+    def __contains__(self, key):
+        try:
+            return not self._is_expired(os.stat(self._file(key)).st_mtime)
+        except FileNotFoundError:
+            return False
+
+    def keys(self) -> list:
+        return [e[0] for e in sorted(self._entries(), key=lambda e: e[2])]
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(e[3] for e in self._entries())
+
+    def get(self, key, default=None):
+        if key is None:
+            self.misses += 1
+            return default
+
+        fname = self._file(key)
+        try:
+            stime = os.stat(fname).st_mtime
+        except FileNotFoundError:
+            self.misses += 1
+            return default
+
+        # expired entries are treated as misses
+        if self._is_expired(stime):
+            self.remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return default
+
+        value = self._local.get(key) if self._local is not None else None
+        if value is None:
+            try:
+                with open(fname, 'rb') as f:
+                    value = loads(f.read())
+            except FileNotFoundError:
+                # evicted by another process meanwhile
+                self.misses += 1
+                return default
+            if self._local is not None:
+                self._local.set(key, value)
+
+        self._touch(fname, stime)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        fname = self._file(key)
+        blob = dumps(value)
+        try:
+            replaced = os.stat(fname).st_size
+        except FileNotFoundError:
+            replaced = None
+
+        # write to a temporary file first, readers never see partial files
+        tmp = '%s.%s.tmp' % (fname, uuid.uuid4().hex)
+        with open(tmp, 'wb') as f:
+            f.write(blob)
+        os.replace(tmp, fname)
+
+        if self._local is not None:
+            self._local.set(key, value)
+
+        # the directory is only scanned, if a limit may be exceeded
+        with self._usage_lock:
+            usage = self._usage
+            if usage is not None:
+                usage[0] += replaced is None
+                usage[1] += len(blob) - (replaced or 0)
+        if usage is None or self._exceeds(*usage) or time.time() - self._scanned > self.scan_interval:
+            self._evict(keep=os.path.basename(fname)[:-len(self.SUFFIX)])
+
+    def remove(self, key):
+        try:
+            os.remove(self._file(key))
+        except FileNotFoundError:
+            pass
+        if self._local is not None:
+            self._local.remove(key)
+
+    def expire(self, max_age=None) -> int:
+        """Remove all entries older than max_age seconds, defaults to ttl"""
+        max_age = self.ttl if max_age is None else max_age
+        if max_age is None:
+            return 0
+
+        since = time.time() - max_age
+        n = 0
+        for name, stime, _, _ in self._entries():
+            if stime < since:
+                self._unlink(name)
+                n += 1
+        self.expirations += n
+
+        if self._local is not None:
+            self._local.expire(max_age=max_age)
+
+        return n
+
+    def gc(self) -> dict:
+        """Remove expired entries and enforce the limits"""
+        expired = self.expire()
+        evictions = self.evictions
+        self._evict(keep=None)
+        return dict(expired=expired, evicted=self.evictions - evictions)
+
+    def clear(self):
+        for name, _, _, _ in self._entries():
+            self._unlink(name)
+        if self._local is not None:
+            self._local.clear()
+
+    def stats(self) -> dict:
+        entries = self._entries()
+        return dict(
+            entries=len(entries),
+            bytes=sum(e[3] for e in entries),
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            expirations=self.expirations
+        )
+
+    def _is_expired(self, stime) -> bool:
+        return self.ttl is not None and time.time() - stime > self.ttl
+
+    def _touch(self, fname, stime):
+        # mark as recently used, the set time is kept
+        try:
+            os.utime(fname, (time.time(), stime))
+        except FileNotFoundError:
+            pass
+
+    def _unlink(self, name):
+        try:
+            os.remove(os.path.join(self.path, name + self.SUFFIX))
+        except FileNotFoundError:
+            pass
+        if self._local is not None:
+            self._local.remove(name)
+
+    def _exceeds(self, n_entries, n_bytes, fraction=1) -> bool:
+        return (self.max_entries is not None and n_entries > fraction * self.max_entries) or \
+            (self.max_bytes is not None and n_bytes > fraction * self.max_bytes)
+
+    def _evict(self, keep):
+        entries = self._entries()
+
+        # expired entries go first
+        if self.ttl is not None:
+            since = time.time() - self.ttl
+            for name, stime, _, _ in entries:
+                if stime < since:
+                    self._unlink(name)
+                    self.expirations += 1
+            entries = [e for e in entries if e[1] >= since]
+
+        # least recently used entries, the new one is never evicted. Once
+        # a limit is exceeded, EVICT_TO of it is kept, so that the next
+        # entries can be set without a scan
+        fraction = self.EVICT_TO if self._exceeds(len(entries), sum(e[3] for e in entries)) else 1
+        n_entries, n_bytes = 0, 0
+        for name, _, _, size in sorted(entries, key=lambda e: e[2], reverse=True):
+            n_entries += 1
+            n_bytes += size
+            if name == keep:
+                continue
+            if self._exceeds(n_entries, n_bytes, fraction):
+                self._unlink(name)
+                self.evictions += 1
+                n_entries -= 1
+                n_bytes -= size
+
+        # entries removed until the next scan are not subtracted, the usage is an upper bound
+        with self._usage_lock:
+            self._usage = [n_entries, n_bytes]
+            self._scanned = time.time()
+
+
+def create_backend(url: str, name: str, local_entries=8, **limits):
+    """Create a storage backend from its URL
+
+    Parameters
+    ----------
+    url : str
+        ``'memory'``, ``'sqlite:///path/to/file.db'`` or
+        ``'disk:///path/to/directory'``. Absolute paths need a fourth slash.
+    name : str
+        Name of the store, ie. ``'variogram'`` or ``'kriging'``.
+    local_entries : int
+        Number of deserialized entries kept in process memory by the
+        ``sqlite`` and ``disk`` backends. Use 0 for entries which are changed.
+    limits : dict
+        max_entries, max_bytes and ttl passed to the backend.
+
+    """
+    if url is None or url == 'memory':
+        return CacheStore(**limits)
+    elif url.startswith('sqlite:///'):
+        return SQLiteBackend(url[len('sqlite:///'):], table=name, local_entries=local_entries, **limits)
+    elif url.startswith('disk:///'):
+        return DiskBackend(os.path.join(url[len('disk:///'):], name), local_entries=local_entries, **limits)
+    else:
+        raise ValueError(f"Cache backend '{url}' is not supported. Use 'memory', 'sqlite:///path' or 'disk:///path'.")
@@ -0,0 +1,207 @@
+"""
+Thread-safe, size-bounded cache store used by the DataManager.
+
+Entries are evicted least-recently-used first as soon as either the
+number of entries or their estimated total size exceeds the limits.
+Additionally, every entry expires ``ttl`` seconds after it was set.
+
+"""
+import sys
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+# attributes holding data shared between cache entries, which is counted
+# once by its own cache: the distance index of a dataset in DISTANCES
+SHARED_ATTRIBUTES = ('_distance_index',)
+
+
+def nbytes(obj, _seen=None) -> int:
+    """Estimate the memory held by obj in bytes
+
+    NumPy arrays are counted by their buffer size. Containers and plain
+    objects, like a skgstat.Variogram, are traversed recursively, so that
+    the coordinates, values and distance matrix of a Variogram are counted.
+    Arrays reachable from one of the SHARED_ATTRIBUTES are not counted,
+    wherever else the object refers to them.
+    """
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    if isinstance(obj, np.ndarray):
+        # views do not own their memory
+        if obj.base is not None:
+            return nbytes(obj.base, _seen)
+        return obj.nbytes
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(nbytes(k, _seen) + nbytes(v, _seen) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(nbytes(v, _seen) for v in obj)
+    if isinstance(obj, (str, bytes, int, float, bool, type(None), np.generic)) or callable(obj):
+        return sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        attrs = vars(obj)
+        shared = [name for name in SHARED_ATTRIBUTES if name in attrs]
+        for name in shared:
+            # only marks the shared arrays as seen
+            nbytes(attrs[name], _seen)
+        if shared:
+            attrs = {k: v for k, v in attrs.items() if k not in shared}
+        return sys.getsizeof(obj) + nbytes(attrs, _seen)
+
+    return sys.getsizeof(obj)
+
+
+class CacheStore:
+    """LRU cache with TTL, bounded by entry count and total bytes
+
+    Parameters
+    ----------
+    max_entries : int
+        Maximum number of entries. None disables the limit.
+    max_bytes : int
+        Maximum total size of all entries as estimated by ``sizeof``.
+        None disables the limit.
+    ttl : float
+        Seconds after which an entry expires. None disables expiry.
+    sizeof : callable
+        Function to estimate the size of a value in bytes.
+
+    """
+    def __init__(self, max_entries=None, max_bytes=None, ttl=None, sizeof=nbytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+
+        # key -> (value, set time, size)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+        # counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries and not self._is_expired(key)
+
+    def keys(self) -> list:
+        with self._lock:
+            return list(self._entries.keys())
+
+    @property
+    def total_bytes(self) -> int:
+        return self._bytes
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+
+            # expired entries are treated as misses
+            if self._is_expired(key):
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            # mark as most recently used
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][0]
+
+    def set(self, key, value):
+        # estimate the size outside of the lock
+        size = self.sizeof(value)
+
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, time.monotonic(), size)
+            self._bytes += size
+
+            # make room, but always keep the new entry
+            self._evict()
+
+    def remove(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+
+    def expire(self, max_age=None) -> int:
+        """Remove all entries older than max_age seconds, defaults to ttl"""
+        max_age = self.ttl if max_age is None else max_age
+        if max_age is None:
+            return 0
+
+        with self._lock:
+            since = time.monotonic() - max_age
+            # build the list first, never delete while iterating
+            old = [k for k, (_, stime, _) in self._entries.items() if stime < since]
+            for key in old:
+                self._drop(key)
+            self.expirations += len(old)
+
+        return len(old)
+
+    def count(self, hits=0, misses=0):
+        """Add the hits and misses of lookups elsewhere, ie. in worker processes"""
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(
+                entries=len(self._entries),
+                bytes=self._bytes,
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                expirations=self.expirations
+            )
+
+    def _is_expired(self, key) -> bool:
+        if self.ttl is None:
+            return False
+        return time.monotonic() - self._entries[key][1] > self.ttl
+
+    def _drop(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _evict(self):
+        # expired entries go first
+        self.expire()
+
+        # the most recently set entry is last and never evicted
+        while len(self._entries) > 1 and self._over_limit():
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _over_limit(self) -> bool:
+        if self.max_entries is not None and len(self._entries) > self.max_entries:
+            return True
+        if self.max_bytes is not None and self._bytes > self.max_bytes:
+            return True
+        return False
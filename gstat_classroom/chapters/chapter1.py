@@ -1,8 +1,93 @@
+import os
+
+from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 import dash_html_components as html
+import dash_bootstrap_components as dbc
+import dash_core_components as dcc
 
 from gstat_classroom.app import app
+from gstat_classroom import settings
+from gstat_classroom import ingest
+from gstat_classroom.datasets import DATAMANAGER
+
 
+# ----------------------------------------------
+#                   LAYOUT
+# ----------------------------------------------
+# Headline Jumbotron
+header = dbc.Jumbotron([
+    dbc.Container([
+        html.H1('Datasets', className='display-3'),
+        html.P('Besides the example datasets, you can upload your own observations.'),
+    ])
+])
+
+upload = dbc.Container([
+    html.H3('Upload a dataset'),
+    html.P([
+        html.Span('Upload a '),
+        html.Code('.csv'),
+        html.Span(' or '),
+        html.Code('.npy'),
+        html.Span(' file with one row per observation. All columns but the last are coordinates, the last column holds the values. '),
+        html.Span('A header line in CSV files is skipped. '),
+        html.Span('Datasets of up to %d observations are supported.' % settings.MAX_OBSERVATIONS),
+    ]),
+    dbc.Input(id='upload-name', placeholder='Name of the dataset', type='text', className='mb-3'),
+    dcc.Upload(
+        id='upload-data',
+        children=html.Div([
+            html.Span('Drag and drop or '),
+            html.A('select a file')
+        ]),
+        max_size=settings.UPLOAD_MAX_BYTES,
+        multiple=False,
+        style=dict(
+            borderWidth='1px',
+            borderStyle='dashed',
+            borderRadius='5px',
+            textAlign='center',
+            padding='2rem'
+        )
+    ),
+    dcc.Loading(html.Div(id='upload-status', className='mt-3'), type='default')
+], className='p-5')
 
 LAYOUT = html.Div([
-    html.H1('CHAPTER ONE')
-])
\ No newline at end of file
+    header,
+    upload
+])
+
+
+# ----------------------------------------------
+#              Append Callbacks
+# ----------------------------------------------
+@app.callback(
+    Output('upload-status', 'children'),
+    Input('upload-data', 'contents'),
+    State('upload-data', 'filename'),
+    State('upload-name', 'value')
+)
+def upload_dataset(contents, filename, name):
+    if contents is None:
+        raise PreventUpdate
+
+    # the file is read from disk in chunks
+    path = ingest.save_upload(contents, filename)
+    try:
+        h = DATAMANAGER.add_data(name=name or filename, func=ingest.ingest_file, path=path)
+    except ValueError as e:
+        return dbc.Alert('%s could not be loaded. %s' % (filename, str(e)), color='danger')
+    finally:
+        os.remove(path)
+
+    # the dataset is listed again after a restart
+    ingest.write_label(h, name or filename)
+
+    data = DATAMANAGER.get_data(h)
+    n, dims = data['coordinates'].shape
+    return dbc.Alert([
+        html.Span('Loaded %d observations with %d coordinate dimensions. ' % (n, dims)),
+        html.A('Select it in Chapter 2', href='/chapter2', className='alert-link')
+    ], color='success')
@@ -1,17 +1,23 @@
 import json
-from dash.dependencies import Input, Output
+import dash
+from dash.dependencies import Input, Output, State
 from dash.exceptions import PreventUpdate
 import dash_html_components as html 
 import dash_core_components as dcc 
 import dash_bootstrap_components as dbc
 from skgstat import plotting
-from skgstat import Variogram
+import plotly
+import plotly.graph_objects as go
 
 from gstat_classroom.app import app
 
 from gstat_classroom import settings
+from gstat_classroom import estimation
+from gstat_classroom import diagnostics
 from gstat_classroom.datasets import DATAMANAGER
+from gstat_classroom.jobs import COALESCER, Superseded
 from gstat_classroom import components
+from gstat_classroom.metrics import timed
 
 # Set plotly as plotting backend
 plotting.backend('plotly')
@@ -110,11 +116,12 @@ maxlag_setter = dbc.Row([
         dcc.RadioItems(
             id='dist-function',
             options=[
-                {'label': 'Euklidean', 'value': 'euklidean'},
+                {'label': 'Euklidean', 'value': 'euclidean'},
                 {'label': 'Manhattan', 'value': 'cityblock'},
                 {'label': 'Cosine', 'value': 'cosine'},
                 {'label': 'Minkowski (2-p norm)', 'value': 'minkowski'}
-            ]
+            ],
+            value='euclidean'
         )
     ], xs=12, md=4),
     dbc.Col([
@@ -187,20 +194,65 @@ main_graph = dbc.Row(
 output_row = [
     html.H3('More Results'),
     html.P('Inspect your results, they are instantly updated'),
-    # Graph
+    dbc.Button(
+        'Show diagnostic plots',
+        id='diagnostics-toggle',
+        color='secondary',
+        outline=True,
+        className='mb-3'
+    ),
+    # Graph, only built while shown
+    dbc.Collapse(
+        id='diagnostics-collapse',
+        is_open=False,
+        children=dbc.Row([
+            dbc.Col(
+                [dcc.Loading(dcc.Graph(id='variogram-scattergram'), type='graph')],
+                width=12, lg=4
+            ),
+            dbc.Col(
+                [dcc.Loading(dcc.Graph(id='distance-difference'), type='graph')],
+                width=12, lg=4
+            ),
+            dbc.Col(
+                [dcc.Loading(dcc.Graph(id='location-trend'), type='graph')],
+                width=12, lg=4)
+        ])
+    ),
+
+    # Model and estimator comparison
+    html.H3('Compare models and estimators', className='mt-5'),
+    html.P('Fit the selected models with the selected estimators on the current lag classes at once'),
     dbc.Row([
-        dbc.Col(
-            [dcc.Loading(dcc.Graph(id='variogram-scattergram'), type='graph')],
-            width=12, lg=4
-        ),
-        dbc.Col(
-            [dcc.Loading(dcc.Graph(id='distance-difference'), type='graph')],
-            width=12, lg=4
-        ),
-        dbc.Col(
-            [dcc.Loading(dcc.Graph(id='location-trend'), type='graph')],
-            width=12, lg=4)
-    ])
+        dbc.Col([
+            html.H5('Models'),
+            dcc.Dropdown(
+                id='sweep-models',
+                options=[{'label': v, 'value': k} for k,v in settings.MODELS.items()],
+                value=list(settings.MODELS),
+                multi=True
+            )
+        ], xs=12, md=5),
+        dbc.Col([
+            html.H5('Estimators'),
+            dcc.Dropdown(
+                id='sweep-estimators',
+                options=[{'label': v, 'value': k} for k,v in settings.ESTIMATORS.items()],
+                value=['matheron'],
+                multi=True
+            )
+        ], xs=12, md=5),
+        dbc.Col([
+            dbc.Button('Compare', id='sweep-button', color='secondary', block=True, className='mt-4')
+        ], xs=12, md=2)
+    ], className=MY),
+    dcc.Loading(
+        dbc.Row([
+            dbc.Col(dcc.Graph(id='sweep-plot'), width=12, lg=7),
+            dbc.Col(html.Div(id='sweep-table'), width=12, lg=5)
+        ]),
+        type='graph'
+    )
 ]
 
 LAYOUT = html.Div([
@@ -257,10 +309,28 @@ def update_n_lags_output(n_lags):
 def disable_slider(func_name):
     return func_name in ['sturges', 'scott', 'fd', 'sqrt', 'doane']
 
+@timed('plotly')
+def scattergram(V):
+    fig = diagnostics.scattergram(V)
+    fig.update_layout(template='plotly_white')
+    return fig
+
+
+@timed('plotly')
+def distance_difference_plot(V):
+    fig = diagnostics.distance_difference_plot(V)
+    fig.update_layout(template='plotly_white')
+    return fig
+
+
+@timed('plotly')
+def location_trend(V):
+    fig = V.location_trend(show=False, add_trend_line=True)
+    fig.update_layout(template='plotly_white')
+    return fig
+
+
 @app.callback(
-    Output('variogram-scattergram', 'figure'),
-    Output('distance-difference', 'figure'),
-    Output('location-trend', 'figure'),
     Output('current-variogram-id', 'data'),
     Output('variogram-plot-loading', 'is_loading'),
     Input('data-store', 'data'),
@@ -271,26 +341,34 @@ def disable_slider(func_name):
     Input('n-lags', 'value'),
     Input('fit-function', 'value'),
     Input('fit-sigma', 'value'),
-    Input('maxlag', 'data')
+    Input('maxlag', 'data'),
+    State('current-variogram-id', 'data'),
+    State('session-id', 'data')
 )
-def estimate_variogram(data_name, model_name, estimator_name, bin_func, dist_func, n_lags, fit_func, fit_sigma, maxlag):
+def estimate_variogram(data_name, model_name, estimator_name, bin_func, dist_func, n_lags, fit_func, fit_sigma, maxlag, variogram_name, session_id):
     # if there is no data selected, prevent update
     if data_name is None: 
         raise PreventUpdate
+
+    # while a slider is moved, only the latest request of the session is estimated
+    triggered = [t['prop_id'] for t in dash.callback_context.triggered]
+    try:
+        ticket = COALESCER.begin(session_id, 'estimate_variogram', debounce='n-lags.value' in triggered)
+    except Superseded:
+        raise PreventUpdate
     
     # get the dataset
     data = DATAMANAGER.get_data(data_name)
+    if data is None:
+        raise PreventUpdate
 
     # get the data
     c = data.get('coordinates')
     v = data.get('values')
 
-    # fit_sigma string 'none' has to be converted to Python None
-    if fit_sigma == 'none':
-        fit_sigma = None
-    
-    # estimate the variogram
-    V = Variogram(c, v, 
+    # collect the settings
+    params = estimation.variogram_settings(
+        data_name,
         model=model_name,
         estimator=estimator_name,
         dist_func=dist_func,
@@ -299,24 +377,147 @@ def estimate_variogram(data_name, model_name, estimator_name, bin_func, dist_fun
         fit_sigma=fit_sigma,
         n_lags=n_lags,
         maxlag=maxlag
-    ) 
+    )
+
+    # load the last variogram of this session
+    previous = DATAMANAGER.get_variogram(variogram_name)
+    if previous is None:
+        previous = dict()
+
+    # estimate the variogram, only the changed stages are re-calculated.
+    # Outdated estimations are cancelled and never stored
+    try:
+        V = estimation.estimate(c, v, params, 
+            previous=previous.get('v'),
+            previous_settings=previous.get('settings'),
+            distance_index=lambda: DATAMANAGER.get_distance_index(data_name, dist_func),
+            check=ticket.check
+        )
+        ticket.check()
+    except Superseded:
+        raise PreventUpdate
 
     # development test
-    current_variogram = DATAMANAGER.add_variogram(V)
-    
-    # scattergram
-    scat = V.scattergram(show=False)
+    current_variogram = DATAMANAGER.add_variogram(V, settings=params)
 
-    # distance difference plot
-    diff = V.distance_difference_plot(show=False)
+    return current_variogram, True
 
-    # location trend plot
-    trend = V.location_trend(show=False, add_trend_line=True)
 
-    # update the layout
-    scat.update_layout(template='plotly_white')
-    diff.update_layout(template='plotly_white')
-    trend.update_layout(template='plotly_white')
-    
+@app.callback(
+    Output('diagnostics-collapse', 'is_open'),
+    Output('diagnostics-toggle', 'children'),
+    Input('diagnostics-toggle', 'n_clicks'),
+    State('diagnostics-collapse', 'is_open')
+)
+def toggle_diagnostics(n_clicks, is_open):
+    if n_clicks is None:
+        raise PreventUpdate
+    return not is_open, 'Hide diagnostic plots' if not is_open else 'Show diagnostic plots'
+
+
+def diagnostic_plot(variogram_name, is_open, kind, build):
+    # the O(n**2) diagnostic plots are only built while shown
+    if not is_open:
+        raise PreventUpdate
+
+    fig = DATAMANAGER.get_figure(variogram_name, kind, build)
+    if fig is None:
+        raise PreventUpdate
+    return fig
+
+
+@app.callback(
+    Output('variogram-scattergram', 'figure'),
+    Input('current-variogram-id', 'data'),
+    Input('diagnostics-collapse', 'is_open')
+)
+def update_scattergram(variogram_name, is_open):
+    return diagnostic_plot(variogram_name, is_open, 'scattergram', scattergram)
+
+
+@app.callback(
+    Output('distance-difference', 'figure'),
+    Input('current-variogram-id', 'data'),
+    Input('diagnostics-collapse', 'is_open')
+)
+def update_distance_difference(variogram_name, is_open):
+    return diagnostic_plot(variogram_name, is_open, 'distance_difference', distance_difference_plot)
+
+
+@app.callback(
+    Output('location-trend', 'figure'),
+    Input('current-variogram-id', 'data'),
+    Input('diagnostics-collapse', 'is_open')
+)
+def update_location_trend(variogram_name, is_open):
+    return diagnostic_plot(variogram_name, is_open, 'location_trend', location_trend)
+
+
+@timed('plotly')
+def sweep_figure(result):
+    fig = go.Figure()
+    colors = plotly.colors.qualitative.Plotly
+    dashes = ['solid', 'dash', 'dot', 'dashdot', 'longdash', 'longdashdot']
+    estimators = list(result['experimental'])
+
+    # experimental variograms as markers
+    for i, (estimator, exp) in enumerate(result['experimental'].items()):
+        fig.add_trace(go.Scatter(
+            x=exp['x'], y=exp['y'], mode='markers',
+            marker=dict(color='black', symbol=i),
+            name='%s experimental' % settings.ESTIMATORS.get(estimator, estimator)
+        ))
+
+    # model curves, colored by model and dashed by estimator
+    models = list(dict.fromkeys(f['model'] for f in result['fits']))
+    for f in result['fits']:
+        if 'error' in f:
+            continue
+        fig.add_trace(go.Scatter(
+            x=f['curve']['x'], y=f['curve']['y'], mode='lines',
+            line=dict(color=colors[models.index(f['model']) % len(colors)], dash=dashes[estimators.index(f['estimator']) % len(dashes)]),
+            name='%s (%s)' % (settings.MODELS.get(f['model'], f['model']), f['estimator'])
+        ))
+
+    fig.update_layout(
+        template='plotly_white',
+        xaxis_title='Lag',
+        yaxis_title='Semi-variance',
+        legend=dict(orientation='h', yanchor='top', y=-0.2)
+    )
+    return fig
+
+
+def sweep_table(result):
+    rows = []
+    for f in result['fits']:
+        if 'error' in f:
+            values = [html.Td(f['error'], colSpan=4, className='text-danger')]
+        else:
+            values = [html.Td('%.2f' % f[k]) for k in ('rmse', 'range', 'sill', 'nugget')]
+        rows.append(html.Tr([html.Td(settings.MODELS.get(f['model'], f['model'])), html.Td(f['estimator'])] + values))
+
+    return dbc.Table([
+        html.Thead(html.Tr([html.Th(c) for c in ('Model', 'Estimator', 'RMSE', 'Range', 'Sill', 'Nugget')])),
+        html.Tbody(rows)
+    ], striped=True, hover=True, size='sm')
+
+
+@app.callback(
+    Output('sweep-plot', 'figure'),
+    Output('sweep-table', 'children'),
+    Input('sweep-button', 'n_clicks'),
+    State('current-variogram-id', 'data'),
+    State('sweep-models', 'value'),
+    State('sweep-estimators', 'value')
+)
+def update_sweep(n_clicks, variogram_name, models, estimators):
+    if n_clicks is None or not models or not estimators:
+        raise PreventUpdate
+
+    # all fits share the lag classes of the current variogram
+    result = DATAMANAGER.sweep(variogram_name, models=models, estimators=estimators)
+    if result is None:
+        raise PreventUpdate
 
-    return scat, diff, trend, current_variogram, True
+    return sweep_figure(result), sweep_table(result)
@@ -1,6 +1,7 @@
 import json
 import numpy as np
-from dash.dependencies import Input, Output, State
+import dash
+from dash.dependencies import Input, Output, State, ClientsideFunction
 from dash.exceptions import PreventUpdate
 import dash_html_components as html
 import dash_bootstrap_components as dbc 
@@ -10,11 +11,15 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
 from gstat_classroom.app import app
+from gstat_classroom import settings
 from gstat_classroom.datasets import DATAMANAGER
+from gstat_classroom.fingerprint import kriging_params_fingerprint
+from gstat_classroom.jobs import JOBMANAGER, DONE, ERROR
+from gstat_classroom.kriging import krige, preview_levels, nests
+from gstat_classroom.transport import figure_payload
+from gstat_classroom.metrics import phase, timed
 from gstat_classroom import components
 
-from skgstat import OrdinaryKriging
-
 
 # ----------------------------------------------
 #                   LAYOUT
@@ -78,7 +83,7 @@ kriging_settings = html.Div([
                 dcc.RangeSlider(
                     id='points',
                     min=2,
-                    max=35,
+                    max=settings.NEIGHBOR_CACHE['max_points'],
                     step=1,
                     value=[5, 15],
                     allowCross=False,
@@ -107,22 +112,27 @@ kriging_settings = html.Div([
         dbc.Col(
             children=[
                 html.H5('Result Grid'),
-                html.P('Specify the size of the result grid. Due to calculation limitation, the grid size to limited to 100x100.'),
+                html.P('Specify the size of the result grid. The grid is interpolated in tiles by a pool of worker processes shared by all users, so large grids may wait for other krigings. Finished grids are kept and load at once for everyone using the same settings.'),
                 html.P([
                     html.Span('current size: '),
                     html.Code(id='grid-size-label')
                 ]),
+                dcc.Checklist(
+                    id='progressive-select',
+                    options=[{'label': 'Show coarse previews while kriging', 'value': 'progressive'}],
+                    value=['progressive']
+                ),
                 dcc.Slider(
                     id='grid-size',
                     min=25,
-                    max=100,
-                    step=1,
+                    max=settings.KRIGING_MAX_GRID_SIZE,
+                    step=5,
                     value=25,
                     marks={
                         25: {'label': '25x25', 'style': {'color': 'green'}},
-                        50: {'label': '50x50', 'style': {'color': 'green'}},
-                        75: {'label': '75x75', 'style': {'color': 'orange'}},
-                        100: {'label': '100x100', 'style': {'color': 'red'}}
+                        100: {'label': '100x100', 'style': {'color': 'green'}},
+                        250: {'label': '250x250', 'style': {'color': 'orange'}},
+                        500: {'label': '500x500', 'style': {'color': 'red'}}
                     }
                 )
             ],
@@ -151,6 +161,11 @@ output_graph = dbc.Row([
     dbc.Col(
         children=[
             html.H3('Kriging result'),
+            dbc.Progress(id='kriging-progress', value=0, striped=True, className='mb-1'),
+            html.Small(id='kriging-job-status', className='text-muted'),
+            dcc.Interval(id='kriging-job-interval', interval=500, disabled=True),
+            dcc.Store(id='kriging-job-id'),
+            dcc.Store(id='kriging-surfaces'),
             dcc.Loading(
                 id='kriging-plot-loading',
                 children=dcc.Graph(id='kriging-plot'), 
@@ -161,6 +176,36 @@ output_graph = dbc.Row([
     ),
 ])
 
+crossval = html.Div([
+    html.H3('Cross-validation'),
+    html.P('Predict every observation by kriging from the others, with the neighbor and calculation settings above. The errors show how well the variogram predicts the data.'),
+    dbc.Row([
+        dbc.Col([
+            dcc.Dropdown(
+                id='crossval-folds',
+                options=[
+                    {'label': 'Leave-one-out', 'value': 'loo'},
+                    {'label': '5-fold', 'value': 5},
+                    {'label': '10-fold', 'value': 10}
+                ],
+                value='loo',
+                clearable=False
+            )
+        ], width=12, md=4),
+        dbc.Col([
+            dbc.Button('CROSS-VALIDATE', id='crossval-button', color='secondary', block=True)
+        ], width=12, md=3)
+    ], className='mb-3'),
+    dbc.Progress(id='crossval-progress', value=0, striped=True, className='mb-1'),
+    html.Small(id='crossval-job-status', className='text-muted'),
+    dcc.Interval(id='crossval-job-interval', interval=500, disabled=True),
+    dcc.Store(id='crossval-job-id'),
+    dbc.Row([
+        dbc.Col(dcc.Graph(id='crossval-plot'), width=12, lg=9),
+        dbc.Col(html.Div(id='crossval-stats'), width=12, lg=3)
+    ])
+])
+
 LAYOUT = html.Div([
     # page header
     header,
@@ -183,6 +228,12 @@ LAYOUT = html.Div([
         className='p-5'
     ),
 
+    dbc.Container(
+        children=crossval,
+        fluid=True,
+        className='p-5'
+    ),
+
     html.Code(id='dummy')
 ])
 
@@ -223,73 +274,131 @@ def update_grid_size_label(size):
     return f'{size}x{size}'
 
 
+def run_kriging(variogram_name, grid_size, min_points, max_points, mode, progressive=False, progress=None):
+    """Kriging job, returns the hash of the field in the DataManager
+
+    In progressive mode, the grid is kriged in levels of growing size and
+    the hash of each finished level is reported as ``preview``.
+    """
+    key = kriging_params_fingerprint(variogram_name, grid_size, min_points, max_points, mode)
+
+    # another session or worker may have finished the same kriging
+    if DATAMANAGER.get_kriging(key) is not None:
+        return key
+
+    tup = DATAMANAGER.get_variogram(variogram_name)
+    if tup is None:
+        raise RuntimeError('The Variogram is not available anymore. Please estimate it again.')
+
+    levels = preview_levels(grid_size) if progressive else [grid_size]
+
+    # the progress is weighted by the number of grid points per level
+    total = sum(size**2 for size in levels)
+    done = 0
+    coarse = None
+    for size in levels:
+        level_key = kriging_params_fingerprint(variogram_name, size, min_points, max_points, mode)
+
+        def level_progress(fraction):
+            if progress is not None:
+                progress((done + fraction * size**2) / total)
+
+        # every level is a kriging of its own, stored like any other
+        level = DATAMANAGER.get_kriging(level_key)
+        if level is not None:
+            field, sigma = level['data']['field'], level['data']['sigma']
+        else:
+            # the neighbor search of the grid is shared by all kriging settings
+            v_settings = tup.get('settings') or {}
+            neighbors = None
+            if v_settings.get('data') is not None:
+                neighbors = DATAMANAGER.get_grid_neighbors(v_settings['data'], size, metric=v_settings.get('dist_func', 'euclidean'), max_points=max_points)
+
+            field, sigma = krige(
+                tup['v'],
+                grid_size=size,
+                min_points=min_points,
+                max_points=max_points,
+                mode=mode,
+                progress=level_progress,
+                coarse=coarse if coarse is not None and nests(coarse[0].shape[0], size) else None,
+                neighbors=neighbors
+            )
+            # add the field to the datastore
+            DATAMANAGER.add_kriging(field=field, sigma=sigma, key=level_key)
+
+        done += size**2
+        coarse = (field, sigma)
+        if progress is not None and size != grid_size:
+            progress(done / total, preview=level_key, preview_size=size)
+
+    return key
+
+
 # MAIN Kriging application
+# submits the kriging job and polls its progress, as both need to
+# enable or disable the interval
 @app.callback(
+    Output('kriging-job-id', 'data'),
+    Output('kriging-job-interval', 'disabled'),
+    Output('kriging-progress', 'value'),
+    Output('kriging-job-status', 'children'),
     Output('current-kriging-id', 'data'),
-    Output('kriging-plot-loading', 'is_loading'),
     Input('start-button', 'n_clicks'),
+    Input('kriging-job-interval', 'n_intervals'),
+    State('kriging-job-id', 'data'),
+    State('current-kriging-id', 'data'),
     State('current-variogram-id', 'data'),
     State('grid-size', 'value'),
     State('points', 'value'),
-    State('mode-select', 'value')
+    State('mode-select', 'value'),
+    State('progressive-select', 'value')
 )
-def kriging(n_clicks, variogram_name, grid_size, points_range, mode):
-    # get the current Variogram
-    tup = DATAMANAGER.get_variogram(variogram_name)
-    if tup is None:
-        raise PreventUpdate
-    else:
-        V = tup['v']
-
-    # parse the points
-    min_points, max_points = points_range
+def kriging(n_clicks, n_intervals, job_id, kriging_id, variogram_name, grid_size, points_range, mode, progressive):
+    triggered = [t['prop_id'] for t in dash.callback_context.triggered]
+
+    # submit a new job
+    if 'start-button.n_clicks' in triggered:
+        if n_clicks is None or DATAMANAGER.get_variogram(variogram_name) is None:
+            raise PreventUpdate
+
+        # parse the points
+        min_points, max_points = points_range
+
+        # kriging results are shared by all sessions
+        key = kriging_params_fingerprint(variogram_name, grid_size, min_points, max_points, mode)
+        if DATAMANAGER.get_kriging(key) is not None:
+            return dash.no_update, True, 100, 'Kriging loaded from cache', key
+
+        job_id = JOBMANAGER.submit(
+            run_kriging, variogram_name, grid_size, min_points, max_points, mode,
+            progressive='progressive' in (progressive or []),
+            key=key
+        )
+        return job_id, False, 0, 'Kriging job submitted', dash.no_update
 
-    dummy = dict(
-        min_points=min_points,
-        max_points=max_points,
-        variogram=variogram_name,
-        grid_size=grid_size,
-        mode=mode
-    )
+    # poll the current job
+    job = JOBMANAGER.status(job_id)
+    if job is None:
+        return dash.no_update, True, 0, 'Kriging job not found', dash.no_update
 
-    # build the grid
-    min_x = np.min(V.coordinates[:,0])
-    max_x = np.max(V.coordinates[:,0])
-    min_y = np.min(V.coordinates[:,1])
-    max_y = np.max(V.coordinates[:,1])
-    xx,yy = np.mgrid[min_x:max_x:grid_size*1j, min_y:max_y:grid_size*1j]
-
-    # instantiate the kriging algorithm
-    ok = OrdinaryKriging(
-        V,
-        min_points=min_points,
-        max_points=max_points,
-        mode=mode,
-        perf=True
-    )
+    percent = int(round(100 * job['progress']))
+    if job['status'] == DONE:
+        return dash.no_update, True, 100, 'Kriging finished', job['result']
+    elif job['status'] == ERROR:
+        return dash.no_update, True, percent, 'Kriging failed: %s' % job['error'], dash.no_update
 
-    # start interpolation
-    field = ok.transform(xx.flatten(), yy.flatten()).reshape(xx.shape)
-    sigma = ok.sigma.reshape(xx.shape)
+    # show the latest preview level, if it is not shown yet
+    preview = job.get('preview')
+    if preview is None:
+        return dash.no_update, False, percent, 'Kriging %s: %d%%' % (job['status'], percent), dash.no_update
 
-    # add the field to the datastore
-    field_hash = DATAMANAGER.add_kriging(field=field, sigma=sigma)
+    label = 'Kriging %d%%, showing %dx%d preview' % (percent, job['preview_size'], job['preview_size'])
+    return dash.no_update, False, percent, label, preview if preview != kriging_id else dash.no_update
 
-    return field_hash, True
-
-
-@app.callback(
-    Output('kriging-plot', 'figure'),
-    Input('current-kriging-id', 'data')
-)
-def update_fields_figure(field_hash):
-    if field_hash is None:
-        raise PreventUpdate
-
-    data = DATAMANAGER.get_kriging(field_hash)
-    field = data['data']['field']
-    sigma = data['data'].get('sigma')
 
+@timed('plotly')
+def fields_figure(field, sigma=None):
     # create the figure
     if sigma is not None:
         fig = make_subplots(rows=1, cols=2, specs=[[{'type': 'surface'}, {'type': 'surface'}]])
@@ -329,3 +438,130 @@ def update_fields_figure(field_hash):
     fig.update_layout(**layout)
 
     return fig
+
+
+# the surfaces are sent as encoded arrays and the figure is built
+# in the browser, see assets/transport.js
+@app.callback(
+    Output('kriging-surfaces', 'data'),
+    Input('current-kriging-id', 'data')
+)
+def update_fields_figure(field_hash):
+    if field_hash is None:
+        raise PreventUpdate
+
+    # the field may have been evicted or never been stored by this worker
+    data = DATAMANAGER.get_kriging(field_hash)
+    if data is None:
+        raise PreventUpdate
+
+    fig = fields_figure(data['data']['field'], data['data'].get('sigma'))
+
+    with phase('serialization'):
+        return figure_payload(fig, encoding=settings.SURFACE_ENCODING)
+
+
+app.clientside_callback(
+    ClientsideFunction(namespace='transport', function_name='decodeFigure'),
+    Output('kriging-plot', 'figure'),
+    Input('kriging-surfaces', 'data')
+)
+
+
+@timed('plotly')
+def crossval_figure(result):
+    fig = make_subplots(rows=1, cols=2, subplot_titles=('Error map', 'Observed vs. predicted'))
+    coords, error = result['coordinates'], result['error']
+    valid = np.isfinite(error)
+
+    # errors at the observation locations, centered at zero
+    limit = np.max(np.abs(error[valid])) if valid.any() else 1
+    fig.add_trace(go.Scatter(
+        x=coords[valid, 0], y=coords[valid, 1], mode='markers',
+        marker=dict(color=error[valid], colorscale='RdBu_r', cmin=-limit, cmax=limit, colorbar=dict(title='Error', x=0.45)),
+        name='Error'
+    ), row=1, col=1)
+    if not valid.all():
+        fig.add_trace(go.Scatter(
+            x=coords[~valid, 0], y=coords[~valid, 1], mode='markers',
+            marker=dict(color='grey', symbol='x'),
+            name='Not enough neighbors'
+        ), row=1, col=1)
+
+    observed, predicted = result['observed'][valid], result['predicted'][valid]
+    fig.add_trace(go.Scatter(x=observed, y=predicted, mode='markers', marker=dict(color='#1f77b4', opacity=0.6), name='Prediction'), row=1, col=2)
+    if valid.any():
+        lim = [min(observed.min(), predicted.min()), max(observed.max(), predicted.max())]
+        fig.add_trace(go.Scatter(x=lim, y=lim, mode='lines', line=dict(color='black', dash='dash'), name='1:1'), row=1, col=2)
+
+    fig.update_xaxes(title_text='Observed', row=1, col=2)
+    fig.update_yaxes(title_text='Predicted', row=1, col=2)
+    fig.update_layout(template='plotly_white', showlegend=False)
+    return fig
+
+
+def crossval_table(stats):
+    rows = [('Observations', '%d' % stats['n']), ('Predicted', '%d' % stats['valid'])]
+    if stats['valid'] > 0:
+        rows += [
+            ('Mean error', '%.3f' % stats['me']),
+            ('Mean absolute error', '%.3f' % stats['mae']),
+            ('RMSE', '%.3f' % stats['rmse']),
+            ('R²', '%.3f' % stats['r2']),
+            ('Mean standardized squared error', '%.3f' % stats['msse'])
+        ]
+
+    return dbc.Table(html.Tbody([html.Tr([html.Td(k), html.Td(v)]) for k, v in rows]), striped=True, size='sm')
+
+
+def run_crossval(variogram_name, min_points, max_points, mode, k, progress=None):
+    """Cross-validation job, returns the result of DataManager.cross_validate"""
+    result = DATAMANAGER.cross_validate(variogram_name, min_points, max_points, mode=mode, k=k, progress=progress)
+    if result is None:
+        raise RuntimeError('The Variogram is not available anymore. Please estimate it again.')
+
+    return result
+
+
+# submits the cross-validation job and polls its progress, like the kriging
+@app.callback(
+    Output('crossval-job-id', 'data'),
+    Output('crossval-job-interval', 'disabled'),
+    Output('crossval-progress', 'value'),
+    Output('crossval-job-status', 'children'),
+    Output('crossval-plot', 'figure'),
+    Output('crossval-stats', 'children'),
+    Input('crossval-button', 'n_clicks'),
+    Input('crossval-job-interval', 'n_intervals'),
+    State('crossval-job-id', 'data'),
+    State('current-variogram-id', 'data'),
+    State('points', 'value'),
+    State('mode-select', 'value'),
+    State('crossval-folds', 'value')
+)
+def update_crossval(n_clicks, n_intervals, job_id, variogram_name, points_range, mode, folds):
+    triggered = [t['prop_id'] for t in dash.callback_context.triggered]
+
+    # submit a new job
+    if 'crossval-button.n_clicks' in triggered:
+        if n_clicks is None or DATAMANAGER.get_variogram(variogram_name) is None:
+            raise PreventUpdate
+
+        min_points, max_points = points_range
+        k = None if folds == 'loo' else int(folds)
+        job_id = JOBMANAGER.submit(run_crossval, variogram_name, min_points, max_points, mode, k)
+        return job_id, False, 0, 'Cross-validation job submitted', dash.no_update, dash.no_update
+
+    # poll the current job
+    job = JOBMANAGER.status(job_id)
+    if job is None:
+        return dash.no_update, True, 0, 'Cross-validation job not found', dash.no_update, dash.no_update
+
+    percent = int(round(100 * job['progress']))
+    if job['status'] == DONE:
+        result = job['result']
+        return dash.no_update, True, 100, 'Cross-validation finished', crossval_figure(result), crossval_table(result['stats'])
+    elif job['status'] == ERROR:
+        return dash.no_update, True, percent, 'Cross-validation failed: %s' % job['error'], dash.no_update, dash.no_update
+
+    return dash.no_update, False, percent, 'Cross-validation %s: %d%%' % (job['status'], percent), dash.no_update, dash.no_update
@@ -15,6 +15,15 @@ LAYOUT = html.Div([
     )
 ])
 
+# datasets may be added while the app is running
+@app.callback(
+    Output('data-select', 'options'),
+    Input('data-select', 'value')
+)
+def update_options(dataset_name):
+    return [{'label': v, 'value': h} for h,v in DATAMANAGER.get_names().items()]
+
+
 @app.callback(
     Output('data-store', 'data'),
     Input('data-select', 'value')
@@ -10,6 +10,7 @@ import dash_bootstrap_components as dbc
 
 from gstat_classroom.app import app
 from gstat_classroom.datasets import DATAMANAGER
+from gstat_classroom.metrics import timed
 
 LAYOUT = html.Div([
     html.H3([
@@ -30,20 +31,8 @@ LAYOUT = html.Div([
     )
 ])
 
-@app.callback(
-    Output('variogram-description', 'children'),
-    Input('current-variogram-id', 'data')
-)
-def update_variogram_description(variogram_name):
-    # load the variogram from the datastore
-    tup = DATAMANAGER.get_variogram(variogram_name)
-
-    # if no variogram estimated, print a message
-    if tup is None:
-        return '{\n\t"message": "No Variogram estimated"\n}'
-    
-    # extract and return
-    V = tup['v']
+@timed('skgstat')
+def describe_variogram(V):
     desc = V.describe(flat=True)
 
     # turn any numpy array to a list and round floats
@@ -59,3 +48,18 @@ def update_variogram_description(variogram_name):
                 desc[key] = np.round(value, decimals=4)
     
     return json.dumps(desc, indent=4)
+
+
+@app.callback(
+    Output('variogram-description', 'children'),
+    Input('current-variogram-id', 'data')
+)
+def update_variogram_description(variogram_name):
+    # the description is only built once per variogram
+    desc = DATAMANAGER.get_figure(variogram_name, 'describe', describe_variogram)
+
+    # if no variogram estimated, print a message
+    if desc is None:
+        return '{\n\t"message": "No Variogram estimated"\n}'
+
+    return desc
@@ -10,6 +10,7 @@ from skgstat.plotting import backend
 
 from gstat_classroom.app import app
 from gstat_classroom.datasets import DATAMANAGER
+from gstat_classroom.metrics import timed
 
 # set scikit-gstat backend to plotly
 backend('plotly')
@@ -27,22 +28,8 @@ LAYOUT = html.Div(
 )
 
 
-# Component callbacks
-@app.callback(
-    Output('variogram-plot', 'figure'),
-    Input('current-variogram-id', 'data')
-)
-def update_main_variogram_plot(variogram_name):
-    # get the current variogram
-    tup = DATAMANAGER.get_variogram(variogram_name)
-
-    # if no Variogram estimated, return
-    if tup is None:
-        raise PreventUpdate
-    
-    # extract the variogram
-    V = tup['v']
-
+@timed('plotly')
+def plot_variogram(V):
     # plot and update the layout
     fig = V.plot(show=False)
     fig.update_layout(
@@ -57,4 +44,20 @@ def update_main_variogram_plot(variogram_name):
         )
     )
 
-    return fig
\ No newline at end of file
+    return fig
+
+
+# Component callbacks
+@app.callback(
+    Output('variogram-plot', 'figure'),
+    Input('current-variogram-id', 'data')
+)
+def update_main_variogram_plot(variogram_name):
+    # the figure is only built once per variogram
+    fig = DATAMANAGER.get_figure(variogram_name, 'plot', plot_variogram)
+
+    # if no Variogram estimated, return
+    if fig is None:
+        raise PreventUpdate
+
+    return fig
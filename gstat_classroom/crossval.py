@@ -0,0 +1,179 @@
+"""
+Cross-validation of a Variogram by ordinary kriging of its own observations.
+
+Every observation is predicted from the observations of the other folds,
+with the kriging settings of skgstat.OrdinaryKriging: the neighbors are
+the up to ``max_points`` closest observations within the effective range,
+and predictions with less than ``min_points`` neighbors are missing. With
+one fold per observation, this is leave-one-out cross-validation.
+
+Instead of one kriging system per observation, the neighbors of a chunk
+of observations are selected at once from the pairwise distances the
+Variogram already holds, and all systems with the same number of
+neighbors are solved in one batched call. With more than one job, the
+chunks are cross-validated in the shared pool of
+:mod:`gstat_classroom.workers`.
+
+"""
+import numpy as np
+
+from gstat_classroom import settings
+from gstat_classroom.kriging import kriging_state, krige_neighbors
+from gstat_classroom.workers import run_tasks
+
+
+def folds(n: int, k=None, seed=42) -> np.ndarray:
+    """Random fold number of n observations, one fold each if k is None"""
+    if k is None or k >= n:
+        return np.arange(n)
+    return np.random.default_rng(seed).permutation(n) % k
+
+
+def _condensed(i, j, n):
+    # index of the pair i, j in a condensed distance vector, i != j
+    i, j = np.minimum(i, j), np.maximum(i, j)
+    return n * i - i * (i + 1) // 2 + (j - i - 1)
+
+
+def _prepare(variogram, min_points, max_points, mode, k, seed) -> dict:
+    """Everything the chunks of one cross-validation share"""
+    coordinates = np.asarray(variogram.coordinates)
+
+    # like OrdinaryKriging, only the first of duplicated locations is used
+    _, keep = np.unique(coordinates, axis=0, return_index=True)
+    keep.sort()
+
+    # leave-one-out neighbor sets hardly repeat, grouping would not pay off
+    state = kriging_state(variogram, min_points, max_points, mode=mode, engine='batched')
+    state.update(
+        n=len(coordinates),
+        keep=keep,
+        fold=folds(len(keep), k=k, seed=seed),
+        distance=variogram.distance
+    )
+    return state
+
+
+def _cross_validate(state, start, end):
+    """Predictions and kriging variances of the observations start to end"""
+    keep, n, distance = state['keep'], state['n'], state['distance']
+    rows = np.arange(start, end)
+
+    # distances of the chunk to all observations
+    dist = np.asarray(distance[_condensed(keep[rows, None], keep[None, :], n)], dtype=float)
+
+    # observations of the same fold are no neighbors
+    dist[state['fold'][rows, None] == state['fold'][None, :]] = np.inf
+
+    # the max_points closest neighbors, sorted by distance
+    kk = min(state['max_points'], dist.shape[1])
+    nb = np.argpartition(dist, kk - 1, axis=1)[:, :kk]
+    nb_dist = np.take_along_axis(dist, nb, axis=1)
+    order = np.argsort(nb_dist, axis=1)
+    nb, nb_dist = np.take_along_axis(keep[nb], order, axis=1), np.take_along_axis(nb_dist, order, axis=1)
+
+    # the distances between the neighbors are looked up as well
+    def pair_distances(idx):
+        return distance[_condensed(idx[:, :, None], idx[:, None, :], n)]
+
+    z, sigma = krige_neighbors(state, nb, nb_dist, pair_distances)
+    return start, end, z, sigma
+
+
+def _cross_validate_tile(worker, args, start, end):
+    # the shared state is kept per worker, Variogram and settings
+    key = ('crossval', ) + args
+    if key not in worker:
+        worker[key] = _prepare(worker['variogram'], *args)
+    return _cross_validate(worker[key], start, end)
+
+
+def statistics(observed, predicted, sigma) -> dict:
+    """Summary of the cross-validation errors
+
+    The mean standardized squared error compares the errors to the kriging
+    variance, it is close to 1 if the variogram describes the errors well.
+    """
+    valid = np.isfinite(predicted)
+    error = predicted[valid] - observed[valid]
+    s = sigma[valid]
+
+    stats = dict(n=int(observed.size), valid=int(valid.sum()))
+    if error.size == 0:
+        return stats
+
+    stats.update(
+        me=float(np.mean(error)),
+        mae=float(np.mean(np.abs(error))),
+        rmse=float(np.sqrt(np.mean(error**2))),
+        r2=float(1 - np.sum(error**2) / np.sum((observed[valid] - np.mean(observed[valid]))**2)) if error.size > 1 else np.nan,
+        msse=float(np.mean(error[s > 0]**2 / s[s > 0])) if np.any(s > 0) else np.nan
+    )
+    return stats
+
+
+def cross_validate(variogram, min_points: int, max_points: int, mode='exact', k=None, seed=42,
+                   chunk_size=settings.CROSSVAL_CHUNK_SIZE, n_jobs=settings.CROSSVAL_N_JOBS, progress=None) -> dict:
+    """Cross-validate the Variogram's observations
+
+    Parameters
+    ----------
+    variogram : skgstat.Variogram
+        Fitted Variogram
+    min_points : int
+        Minimum number of neighbors used for each kriging matrix
+    max_points : int
+        Maximum number of neighbors used for each kriging matrix
+    mode : str
+        ``'exact'`` or ``'estimate'``, see skgstat.OrdinaryKriging
+    k : int
+        Number of folds, None for leave-one-out
+    seed : int
+        Seed of the random fold assignment
+    chunk_size : int
+        Number of observations predicted at once
+    n_jobs : int
+        Number of chunks cross-validated at the same time in the worker
+        pool. With 1, all chunks are cross-validated in the calling process.
+    progress : callable
+        Called with the completed fraction in [0, 1] after every chunk
+
+    Returns
+    -------
+    result : dict
+        ``coordinates``, ``observed``, ``predicted``, the kriging variance
+        ``sigma``, ``error`` as predicted minus observed and the ``fold`` of
+        each observation, as arrays. Duplicated locations are only included
+        once. ``stats`` are the :func:`statistics` of the errors.
+
+    """
+    args = (min_points, max_points, mode, k, seed)
+    state = _prepare(variogram, *args)
+    m = len(state['keep'])
+
+    z = np.empty(m)
+    sigma = np.empty(m)
+    bounds = [(start, min(start + chunk_size, m)) for start in range(0, m, chunk_size)]
+    n_jobs = min(n_jobs or 1, len(bounds))
+
+    if n_jobs > 1:
+        tiles = run_tasks(_cross_validate_tile, variogram, [(args, start, end) for start, end in bounds], n_jobs=n_jobs)
+    else:
+        tiles = (_cross_validate(state, start, end) for start, end in bounds)
+
+    for done, (start, end, tz, ts) in enumerate(tiles, start=1):
+        z[start:end] = tz
+        sigma[start:end] = ts
+        if progress is not None:
+            progress(done / len(bounds))
+
+    observed = state['values'][state['keep']]
+    return dict(
+        coordinates=np.asarray(variogram.coordinates)[state['keep']],
+        observed=observed,
+        predicted=z,
+        sigma=sigma,
+        error=z - observed,
+        fold=state['fold'],
+        stats=statistics(observed, z, sigma)
+    )
@@ -1,15 +1,37 @@
 """
 """
 import os
+import json
+import inspect
+import hashlib
 import numpy as np
+import plotly
 from imageio import imread
+from scipy.spatial.distance import pdist
 import base64
-import hashlib
+import shutil
+import threading
 from datetime import datetime as dt
 from datetime import timedelta as td
+from functools import lru_cache
+
+from gstat_classroom import settings
+from gstat_classroom import ingest
+from gstat_classroom import sweep
+from gstat_classroom import crossval
+from gstat_classroom.backends import create_backend
+from gstat_classroom.cache import CacheStore
+from gstat_classroom.estimation import shallow_copy
+from gstat_classroom.kriging import NeighborIndex, TREE_METRICS, MATRICES, kriging_grid
+from gstat_classroom.metrics import phase
+from gstat_classroom.fingerprint import fingerprint, dataset_fingerprint, variogram_fingerprint, kriging_fingerprint
 
 DATAPATH = os.path.abspath(os.path.join(os.path.dirname(__file__), 'data'))
 
+# version of the built-in datasets stored in settings.DATASET_DIR, has to
+# be increased whenever a creator or the functions it calls change
+DATASET_VERSION = 1
+
 
 def create_random_3d(seed=42) -> dict:
     """Random dummy 3D data"""
@@ -24,42 +46,131 @@ def create_random_3d(seed=42) -> dict:
     )
 
 
+@lru_cache(maxsize=8)
+def load_image_channel(fname, channel=0) -> np.ndarray:
+    """Decode an image in DATAPATH once and return one channel, read-only"""
+    img = imread(os.path.join(DATAPATH, fname))
+    data = np.ascontiguousarray(img[:, :, channel])
+    data.flags.writeable = False
+    return data
+
+
 def pancake(fname='pancake1.png', seed=None, n=600) -> dict:
     """Delicious Pancake"""
-    # load the image
-    img = imread(os.path.join(DATAPATH, fname))
+    return pancake_batch([seed], fname=fname, n=n)[0]
+
+
+def pancake_batch(seeds, fname='pancake1.png', n=600) -> list:
+    """Sample the pancake once per seed
 
+    Each dataset equals ``pancake(fname, seed, n)``. All datasets share
+    the decoded image as ``original2D``.
+    """
     # use only red channel
-    data = img[:,:,0]
+    data = load_image_channel(fname, 0)
 
-    # sample the pancake
-    np.random.seed(seed=seed)
-    coords = np.random.randint([0,0], data.shape, size=(n, 2))
-    vals = np.fromiter((data[c[0], c[1]] for c in coords), dtype=int)
+    # sample the pancake, one random stream per seed
+    coords = np.stack([np.random.RandomState(seed).randint([0, 0], data.shape, size=(n, 2)) for seed in seeds])
+    vals = data[coords[..., 0], coords[..., 1]].astype(int)
+
+    return [dict(coordinates=c, values=v, original2D=data) for c, v in zip(coords, vals)]
 
-    return dict(
-        coordinates=coords,
-        values=vals,
-        original2D=data
-    )
+
+def creator_fingerprint(func, kwargs: dict) -> str:
+    """Fingerprint of a dataset creator, its arguments and source files
+
+    Besides DATASET_VERSION and the source code of the creator, the
+    content hashes of all files in DATAPATH passed by name, like the image
+    of :func:`pancake`, are included.
+    """
+    args = inspect.signature(func).bind_partial(**kwargs)
+    args.apply_defaults()
+
+    sources = {}
+    for value in args.arguments.values():
+        if isinstance(value, str) and os.path.isfile(os.path.join(DATAPATH, value)):
+            with open(os.path.join(DATAPATH, value), 'rb') as f:
+                sources[value] = hashlib.sha256(f.read()).hexdigest()
+
+    try:
+        code = inspect.getsource(func)
+    except (OSError, TypeError):
+        code = None
+
+    return fingerprint('dataset-creator', DATASET_VERSION, func, kwargs, code, sources)
 
 
 class DataManager:
-    CREATORS = [create_random_3d, pancake]
+    # built-in datasets by stable name, generated on first use
+    CREATORS = {
+        'random_3d': create_random_3d,
+        'pancake': pancake
+    }
     DATA = {}
     DATANAMES = {}
-    VARIOGRAM = {}
-    KRIGING = {}
 
-    def __init__(self, seed=42):
-        self.DATA = {k: v for k,v in [self.__create_dataset(create_func, seed=seed) for create_func in self.CREATORS]}
-        self.DATANAMES = {k:func.__doc__.split('\n')[0] for k, func in [(h, f) for h,f in zip(self.DATA.keys(), self.CREATORS)]}
+    def __init__(self, seed=42, backend=settings.CACHE_BACKEND, variogram_cache=settings.VARIOGRAM_CACHE, kriging_cache=settings.KRIGING_CACHE, figure_cache=settings.FIGURE_CACHE, distance_cache=settings.DISTANCE_CACHE, neighbor_cache=settings.NEIGHBOR_CACHE, dataset_dir=settings.DATASET_DIR):
+        # only the names are known until a dataset is requested
+        self.DATA = {}
+        self.DATANAMES = {}
+        self.HASHES = {}
+        self._creators = {}
+        self._dataset_dir = dataset_dir
+        self._data_lock = threading.Lock()
+        for name, func in self.CREATORS.items():
+            self.register(name, func, seed=seed)
+
+        # uploads of earlier runs are opened on first use
+        for h, label in ingest.list_uploads().items():
+            self.DATANAMES[h] = label
+
+        # bounded, thread-safe stores for the results
+        self.VARIOGRAM = create_backend(backend, 'variogram', **variogram_cache)
+        self.KRIGING = create_backend(backend, 'kriging', **kriging_cache)
+        self.FIGURE = create_backend(backend, 'figure', **figure_cache)
+
+        # pairwise distances are only needed in this process
+        self.DISTANCES = CacheStore(max_bytes=distance_cache.get('max_bytes'))
+        self._mmap_dir = distance_cache.get('mmap_dir')
+        self._distance_lock = threading.Lock()
+
+        # neighbor searches of the kriging grids, only needed in this process
+        self.NEIGHBORS = CacheStore(max_bytes=neighbor_cache.get('max_bytes'))
+        self._max_neighbors = neighbor_cache.get('max_points', 35)
+        self._neighbor_lock = threading.Lock()
+
+    def register(self, name, func, label=None, **kwargs):
+        """Register a dataset creator under a stable name
+
+        The dataset is created by ``func(**kwargs)`` on the first
+        :meth:`get_data`. The label defaults to the first docstring line.
+        """
+        self._creators[name] = (func, kwargs)
+        self.DATANAMES[name] = label or func.__doc__.split('\n')[0]
 
     def get_names(self) -> dict:
         return self.DATANAMES
 
     def get_data(self, name) -> dict:
-        return self.DATA.get(name)
+        data = self.DATA.get(name)
+        if data is not None:
+            return data
+        if name not in self._creators:
+            return self.__load_upload(name)
+
+        # only one thread creates a dataset
+        with self._data_lock:
+            if name not in self.DATA:
+                func, kwargs = self._creators[name]
+                self.HASHES[name], self.DATA[name] = self.__load_dataset(name, func, kwargs)
+
+        return self.DATA[name]
+
+    def get_hash(self, name) -> str:
+        """Fingerprint of the dataset content, creates the dataset if needed"""
+        if self.get_data(name) is None:
+            return None
+        return self.HASHES[name]
     
     def get_variogram(self, name) -> dict:
         return self.VARIOGRAM.get(name)
@@ -67,76 +178,311 @@ class DataManager:
     def get_kriging(self, name) -> dict:
         return self.KRIGING.get(name)
 
+    def get_figure(self, name, kind, build):
+        """Figure of a Variogram, built at most once
+
+        Parameters
+        ----------
+        name : str
+            Variogram hash
+        kind : str
+            Name of the figure, ie. ``'plot'`` or ``'scattergram'``
+        build : callable
+            Called with the Variogram, if the figure is not stored yet.
+            Returns a plotly figure or any other JSON serializable output.
+
+        Returns
+        -------
+        figure : dict
+            The figure as plain JSON, which is returned by callbacks without
+            validation. None, if the Variogram is not known.
+
+        """
+        key = fingerprint('figure', name, kind)
+
+        # figures are stored serialized
+        fig_json = self.FIGURE.get(key)
+        if fig_json is None:
+            tup = self.get_variogram(name)
+            if tup is None:
+                return None
+
+            fig = build(tup['v'])
+            with phase('serialization'):
+                fig_json = json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+            self.FIGURE.set(key, fig_json)
+
+        with phase('serialization'):
+            return json.loads(fig_json)
+
+    def sweep(self, name, models=None, estimators=None, n_jobs=settings.SWEEP_N_JOBS) -> dict:
+        """Fit all combinations of models and estimators to a Variogram
+
+        The combinations share the distances and lag classes of the stored
+        Variogram. Results are stored like figures, see
+        :func:`gstat_classroom.sweep.sweep` for the arguments and the result.
+        Returns None, if the Variogram is not known.
+        """
+        tup = self.get_variogram(name)
+        if tup is None:
+            return None
+
+        models = list(settings.MODELS) if models is None else list(models)
+        estimators = [tup['v'].estimator.__name__] if estimators is None else list(estimators)
+        key = fingerprint('sweep', name, models, estimators)
+
+        result = self.FIGURE.get(key)
+        if result is None:
+            result = sweep.sweep(tup['v'], models=models, estimators=estimators, n_jobs=n_jobs)
+            self.FIGURE.set(key, result)
+
+        return result
+
+    def cross_validate(self, name, min_points, max_points, mode='exact', k=None, n_jobs=settings.CROSSVAL_N_JOBS, progress=None) -> dict:
+        """Cross-validate the kriging of a Variogram's observations
+
+        Results are stored like figures, see
+        :func:`gstat_classroom.crossval.cross_validate` for the arguments
+        and the result. progress is only called, if the result is not
+        stored yet. Returns None, if the Variogram is not known.
+        """
+        key = fingerprint('crossval', name, min_points, max_points, mode, k)
+
+        result = self.FIGURE.get(key)
+        if result is None:
+            tup = self.get_variogram(name)
+            if tup is None:
+                return None
+
+            result = crossval.cross_validate(tup['v'], min_points, max_points, mode=mode, k=k, n_jobs=n_jobs, progress=progress)
+            self.FIGURE.set(key, result)
+
+        return result
+
     def add_data(self, name=None, **kwargs):
         h, result_dict = self.__create_dataset(**kwargs)
 
         # set the new data
         self.DATA[h] = result_dict
+        self.HASHES[h] = h
 
         if name is None:
             name = f'Custom dataset added {dt.utcnow()}'
         self.DATANAMES[h] = name
 
-    def add_variogram(self, variogram):
-        # remove variograms which are too old
-        self._check_old_variogram()
-        
+        return h
+
+    def get_distance_index(self, name, metric='euclidean') -> dict:
+        """Pairwise distances of a dataset
+
+        The distances are calculated once per dataset and metric. Returns a
+        dict of the condensed float32 ``distance`` vector, the int32 ``order``
+        sorting it and the ``sorted`` distances. Returns None, if the dataset
+        is unknown or the arrays exceed the memory limit. The Variogram has
+        to calculate the distances then.
+        """
+        data = self.get_data(name)
+        if data is None or not isinstance(metric, str):
+            return None
+
+        # the hash, as persisted distances have to match the content
+        key = f'{self.get_hash(name)}-{metric}'
+        index = self.DISTANCES.get(key)
+        if index is not None:
+            return index
+
+        # check the size before calculating anything: 3 arrays of 4 bytes
+        n = len(data['coordinates'])
+        size = (n * (n - 1) // 2) * 3 * 4
+        max_bytes = self.DISTANCES.max_bytes
+        if self._mmap_dir is None and max_bytes is not None and size > max_bytes:
+            return None
+
+        # only one thread calculates the same distances
+        with self._distance_lock:
+            index = self.DISTANCES.get(key)
+            if index is None:
+                index = self.__create_distance_index(data['coordinates'], metric, key)
+                self.DISTANCES.set(key, index)
+
+        return index
+
+    def get_neighbor_index(self, name, metric='euclidean') -> NeighborIndex:
+        """KD-tree over the locations of a dataset, built once per metric
+
+        Returns None, if the dataset is unknown or the metric is not
+        supported by the tree.
+        """
+        data = self.get_data(name)
+        if data is None or metric not in TREE_METRICS:
+            return None
+
+        key = f'{self.get_hash(name)}-{metric}-tree'
+        index = self.NEIGHBORS.get(key)
+        if index is None:
+            with self._neighbor_lock:
+                index = self.NEIGHBORS.get(key)
+                if index is None:
+                    index = NeighborIndex(data['coordinates'], metric=metric)
+                    self.NEIGHBORS.set(key, index)
+
+        return index
+
+    def get_grid_neighbors(self, name, grid_size, metric='euclidean', max_points=None) -> tuple:
+        """Nearest observations of every point of a kriging grid
+
+        The grid is queried once for the largest number of neighbors
+        offered, so that other neighbor settings slice the same arrays.
+        Returns the (dist, idx) of :meth:`NeighborIndex.query`, shaped
+        (grid_size**2, k), or None, if there is no neighbor index for the
+        dataset and metric.
+        """
+        # the kriging grid covers the first two coordinate dimensions
+        index = self.get_neighbor_index(name, metric)
+        if index is None or index.coordinates.shape[1] != 2:
+            return None
+
+        k = max(self._max_neighbors, max_points or 0)
+        key = f'{self.get_hash(name)}-{metric}-grid-{grid_size}'
+        neighbors = self.NEIGHBORS.get(key)
+        if neighbors is None or neighbors[0].shape[1] < min(k, len(index.keep)):
+            with self._neighbor_lock:
+                neighbors = self.NEIGHBORS.get(key)
+                if neighbors is None or neighbors[0].shape[1] < min(k, len(index.keep)):
+                    xx, yy = kriging_grid(index, grid_size)
+                    neighbors = index.query(np.column_stack((xx.flatten(), yy.flatten())), k)
+                    self.NEIGHBORS.set(key, neighbors)
+
+        return neighbors
+
+    def cache_stats(self) -> dict:
+        return dict(
+            variogram=self.VARIOGRAM.stats(),
+            kriging=self.KRIGING.stats(),
+            figure=self.FIGURE.stats(),
+            distance=self.DISTANCES.stats(),
+            neighbors=self.NEIGHBORS.stats(),
+            kriging_matrices=MATRICES.stats()
+        )
+
+    def add_variogram(self, variogram, settings=None):
         # build the needed hash
-        d = dict(c=variogram.coordinates, v=variogram.values, p=variogram.describe(flat=True))
-        h = hashlib.sha256(str(d).encode()).hexdigest()
+        h = variogram_fingerprint(variogram)
 
-        # store the variogram
-        self.VARIOGRAM[h] = dict(dtime=dt.utcnow(), v=variogram.clone())
+        # store the variogram and the settings used to estimate it.
+        # skgstat never changes its arrays in place, they can be shared
+        self.VARIOGRAM.set(h, dict(dtime=dt.utcnow(), v=shallow_copy(variogram), settings=settings))
 
         return h
 
-    def add_kriging(self, field, sigma=None):
-        # remove krigings which are too old
-        self._check_old_kriging()
-
-        # build the needed hash
+    def add_kriging(self, field, sigma=None, key=None):
+        # use the fingerprint of the kriging parameters, if known.
+        # Otherwise, build the hash from the result
         d = dict(field=field, sigma=sigma)
-        h = hashlib.sha256(str(d).encode()).hexdigest()
+        h = kriging_fingerprint(field, sigma) if key is None else key
 
         # store the field
-        self.KRIGING[h] = dict(dtime=dt.utcnow(), data=d)
+        self.KRIGING.set(h, dict(dtime=dt.utcnow(), data=d))
 
         return h
 
     def remove_variogram(self, h):
-        if h in self.VARIOGRAM.keys():
-            del self.VARIOGRAM[h]
+        self.VARIOGRAM.remove(h)
 
     def remove_kriging(self, h):
-        if h in self.KRIGING.keys():
-            del self.KRIGING[h]
+        self.KRIGING.remove(h)
 
     def _check_old_variogram(self, since_hours=2):
-        # create the timestamp
-        since = dt.utcnow() - td(hours=since_hours)
-        
-        # remove everything older than since
-        for h, data in self.VARIOGRAM.items():
-            dtime = data['dtime']
-            if dtime < since:
-                self.remove_variogram(h)
+        # remove everything older than since_hours
+        return self.VARIOGRAM.expire(max_age=td(hours=since_hours).total_seconds())
 
     def _check_old_kriging(self, since_hours=1):
-        # create the timestamp
-        since = dt.utcnow() - td(hours=since_hours)
-
-        # remove everything older than since
-        for h, data in self.KRIGING.items():
-            dtime = data['dtime']
-            if dtime < since:
-                self.remove_kriging(h)
+        # remove everything older than since_hours
+        return self.KRIGING.expire(max_age=td(hours=since_hours).total_seconds())
+
+    def __create_distance_index(self, coordinates, metric, key):
+        # memory-mapped arrays are only calculated once per dataset
+        if self._mmap_dir is not None:
+            path = os.path.join(self._mmap_dir, key)
+            if os.path.exists(path):
+                return {n: np.load(os.path.join(path, f'{n}.npy'), mmap_mode='r') for n in ('distance', 'order', 'sorted')}
+
+        # like skgstat, 1D coordinates get a second column of zeros
+        coordinates = np.asarray(coordinates)
+        if coordinates.ndim == 1:
+            coordinates = np.column_stack((coordinates, np.zeros(len(coordinates))))
+
+        dist = pdist(coordinates, metric=metric).astype(np.float32)
+        order = np.argsort(dist).astype(np.int32)
+        index = dict(distance=dist, order=order, sorted=dist[order])
+
+        if self._mmap_dir is not None:
+            # write to a temporary folder first, other workers may read the path
+            tmp = f'{path}.{os.getpid()}.tmp'
+            os.makedirs(tmp, exist_ok=True)
+            for n, arr in index.items():
+                np.save(os.path.join(tmp, f'{n}.npy'), arr)
+            try:
+                os.rename(tmp, path)
+            except OSError:
+                # another worker was faster
+                shutil.rmtree(tmp, ignore_errors=True)
+            index = {n: np.load(os.path.join(path, f'{n}.npy'), mmap_mode='r') for n in index.keys()}
+
+        return index
+
+    def __load_upload(self, h):
+        path = ingest.upload_path(h)
+        if path is None:
+            return None
+
+        with self._data_lock:
+            if h not in self.DATA:
+                self.DATA[h] = ingest.load_dataset(path)
+                self.HASHES[h] = h
+                self.DATANAMES.setdefault(h, ingest.read_label(path))
+
+        return self.DATA[h]
+
+    def __load_dataset(self, name, func, kwargs):
+        if self._dataset_dir is None:
+            return self.__create_dataset(func, **kwargs)
+
+        # one folder per creator, arguments and source files
+        path = os.path.join(self._dataset_dir, '%s-%s' % (name, creator_fingerprint(func, kwargs)[:16]))
+        if os.path.exists(path):
+            with open(os.path.join(path, 'meta.json')) as f:
+                h = json.load(f)['hash']
+            data = {n[:-4]: np.load(os.path.join(path, n), mmap_mode='r') for n in os.listdir(path) if n.endswith('.npy')}
+            return h, data
+
+        h, data = self.__create_dataset(func, **kwargs)
+
+        # only datasets of arrays can be stored
+        if not all(isinstance(v, np.ndarray) for v in data.values()):
+            return h, data
+
+        # write to a temporary folder first, other workers may read the path
+        tmp = f'{path}.{os.getpid()}.tmp'
+        os.makedirs(tmp, exist_ok=True)
+        for n, arr in data.items():
+            np.save(os.path.join(tmp, f'{n}.npy'), arr)
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump(dict(hash=h, name=name, label=self.DATANAMES.get(name)), f)
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # another worker was faster
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        return h, data
 
     def __create_dataset(self, func, *args, **kwargs):
         # run the dataset creator
         result_dict = func(*args, **kwargs)
 
         # hash the result
-        h = hashlib.sha256(str(result_dict).encode()).hexdigest()
+        h = dataset_fingerprint(result_dict)
 
         return h, result_dict
 
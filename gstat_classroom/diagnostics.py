@@ -0,0 +1,221 @@
+"""
+Scattergram and distance-difference plots for large datasets.
+
+skgstat plots every point pair, which is n * (n - 1) / 2 markers. Above
+``max_pairs`` pairs, these plots either show a sample of the pairs, which
+is stratified by lag class, or a 2D histogram of all pairs. Either way,
+the size of the figure does not depend on n. The title states what is
+shown. Below the threshold, the plots show all pairs like skgstat does.
+
+"""
+import numpy as np
+import plotly.graph_objects as go
+
+from gstat_classroom import settings
+
+# pairs processed at once by the histograms
+CHUNK_SIZE = 1 << 20
+
+
+def pair_index(k, n):
+    """Row and column index of the condensed distance matrix indices k"""
+    k = np.asarray(k, dtype=np.int64)
+    i = n - 2 - np.floor(np.sqrt(-8 * k + 4 * n * (n - 1) - 7) / 2 - 0.5).astype(np.int64)
+    j = k + i + 1 - n * (n - 1) // 2 + (n - i) * (n - i - 1) // 2
+    return i, j
+
+
+def lag_strata(variogram):
+    """Condensed pair indices sorted by distance and the slices of each lag class
+
+    The pairs beyond the last bin form the last stratum. Uses the sorted
+    pairs of :class:`gstat_classroom.estimation.Variogram`, if available.
+    """
+    if hasattr(variogram, '_sorted_pairs'):
+        order, _, _ = variogram._sorted_pairs()
+        lower, upper = variogram._lag_class_bounds()
+    else:
+        order = np.argsort(variogram.distance)
+        sorted_dist = variogram.distance[order]
+        upper = np.searchsorted(sorted_dist, variogram.bins, side='left')
+        lower = np.concatenate(([0], upper[:-1]))
+
+    bounds = list(zip(lower, upper)) + [(upper[-1], len(order))]
+    return order, bounds
+
+
+def sample_pairs(variogram, max_pairs: int, seed=42):
+    """Sample of condensed pair indices, stratified by lag class
+
+    Every lag class is sampled in proportion to its size, but with at
+    least min(size, 100) pairs, so that sparse lag classes are visible.
+
+    Returns
+    -------
+    strata : list
+        Array of condensed pair indices per lag class, the last one holds
+        the pairs beyond the last bin
+
+    """
+    rng = np.random.default_rng(seed)
+    order, bounds = lag_strata(variogram)
+    fraction = min(1.0, max_pairs / max(len(order), 1))
+
+    strata = []
+    for lo, up in bounds:
+        size = up - lo
+        k = min(size, max(int(round(size * fraction)), 100))
+        pos = lo + rng.choice(size, size=k, replace=False) if k < size else np.arange(lo, up)
+        strata.append(np.sort(order[pos]))
+
+    return strata
+
+
+def _title(name, shown, n_pairs, mode):
+    if mode == 'all':
+        return '%s (all %d pairs)' % (name, n_pairs)
+    elif mode == 'sample':
+        return '%s (stratified sample of %d of %d pairs)' % (name, shown, n_pairs)
+    else:
+        return '%s (2D histogram of all %d pairs)' % (name, n_pairs)
+
+
+def _mode(n_pairs, max_pairs, mode):
+    return 'all' if n_pairs <= max_pairs else mode
+
+
+def _histogram_figure(H, xedges, yedges):
+    # empty cells are not colored
+    z = np.where(H > 0, H, np.nan).T
+    fig = go.Figure(go.Heatmap(
+        x=(xedges[:-1] + xedges[1:]) / 2,
+        y=(yedges[:-1] + yedges[1:]) / 2,
+        z=z,
+        colorscale='Viridis',
+        colorbar=dict(title='pairs')
+    ))
+    return fig
+
+
+def scattergram(variogram, max_pairs=settings.DIAGNOSTICS['max_pairs'], mode=settings.DIAGNOSTICS['mode'],
+                bins=settings.DIAGNOSTICS['bins'], seed=settings.DIAGNOSTICS['seed']):
+    """Head and tail values of the point pairs, grouped by lag class
+
+    Parameters
+    ----------
+    variogram : skgstat.Variogram
+    max_pairs : int
+        Largest number of pairs plotted as markers
+    mode : str
+        ``'sample'`` or ``'histogram'``, used above max_pairs
+    bins : int
+        Number of histogram bins along each axis
+    seed : int
+        Seed of the pair sample
+
+    """
+    values = variogram.values
+    n = len(values)
+    n_pairs = n * (n - 1) // 2
+    mode = _mode(n_pairs, max_pairs, mode)
+
+    if mode == 'histogram':
+        # both directions of every pair, like skgstat
+        edges = np.linspace(np.nanmin(values), np.nanmax(values), bins + 1)
+        H = np.zeros((bins, bins))
+        for start in range(0, n_pairs, CHUNK_SIZE):
+            i, j = pair_index(np.arange(start, min(start + CHUNK_SIZE, n_pairs)), n)
+            H += np.histogram2d(values[i], values[j], bins=(edges, edges))[0]
+        H = H + H.T
+
+        fig = _histogram_figure(H, edges, edges)
+        t, h = values, values
+        shown = n_pairs
+    else:
+        if mode == 'all':
+            order, bounds = lag_strata(variogram)
+            strata = [order[lo:up] for lo, up in bounds]
+        else:
+            strata = sample_pairs(variogram, max_pairs, seed=seed)
+
+        fig = go.Figure()
+        tails, heads = [], []
+        for idx, k in enumerate(strata):
+            if len(k) == 0:
+                continue
+            i, j = pair_index(k, n)
+            # both directions of every pair, like skgstat
+            tail = np.concatenate((values[i], values[j]))
+            head = np.concatenate((values[j], values[i]))
+            tails.append(tail)
+            heads.append(head)
+
+            name = 'Lag #%d' % idx if idx < len(strata) - 1 else 'beyond maxlag'
+            fig.add_trace(go.Scattergl(x=tail, y=head, mode='markers', marker=dict(size=4), name=name))
+
+        t = np.concatenate(tails) if tails else values
+        h = np.concatenate(heads) if heads else values
+        shown = sum(len(k) for k in strata)
+
+    # mean of tail and head values
+    fig.add_vline(x=np.nanmean(t), line_dash='dash', line_width=1.5, line_color='red')
+    fig.add_hline(y=np.nanmean(h), line_dash='dash', line_width=1.5, line_color='red')
+
+    fig.update_layout(
+        title=_title('Scattergram', shown, n_pairs, mode),
+        xaxis_title='Tail',
+        yaxis_title='Head'
+    )
+
+    return fig
+
+
+def distance_difference_plot(variogram, max_pairs=settings.DIAGNOSTICS['max_pairs'], mode=settings.DIAGNOSTICS['mode'],
+                             bins=settings.DIAGNOSTICS['bins'], seed=settings.DIAGNOSTICS['seed']):
+    """Pairwise differences over separating distance, with the bin edges
+
+    Same parameters as :func:`scattergram`.
+
+    """
+    dist = variogram.distance
+    if variogram._diff is None:
+        variogram._calc_diff()
+    diff = variogram._diff
+
+    n_pairs = len(dist)
+    mode = _mode(n_pairs, max_pairs, mode)
+
+    if mode == 'histogram':
+        xedges = np.linspace(0, np.nanmax(dist), bins + 1)
+        yedges = np.linspace(0, np.nanmax(diff), bins + 1)
+        H = np.zeros((bins, bins))
+        for start in range(0, n_pairs, CHUNK_SIZE):
+            end = start + CHUNK_SIZE
+            H += np.histogram2d(dist[start:end], diff[start:end], bins=(xedges, yedges))[0]
+
+        fig = _histogram_figure(H, xedges, yedges)
+        shown = n_pairs
+    else:
+        if mode == 'all':
+            k = slice(None)
+            shown = n_pairs
+        else:
+            k = np.concatenate(sample_pairs(variogram, max_pairs, seed=seed))
+            shown = len(k)
+
+        fig = go.Figure(go.Scattergl(
+            x=dist[k], y=diff[k],
+            mode='markers', marker=dict(color='blue', opacity=0.5)
+        ))
+
+    # plot the bins
+    for _bin in variogram.bins:
+        fig.add_vline(x=_bin, line_dash='dash', line_color='red')
+
+    fig.update_layout(
+        title=_title('Pairwise distance ~ difference', shown, n_pairs, mode),
+        xaxis_title='separating distance',
+        yaxis_title='pairwise difference'
+    )
+
+    return fig
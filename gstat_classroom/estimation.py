@@ -0,0 +1,261 @@
+"""
+Variogram estimation shared by the chapter callbacks.
+
+A new Variogram is only built if the dataset or the distance function
+changes. Otherwise, the previous Variogram of the session is copied and
+only the stages affected by the changed settings are recalculated:
+
+* ``model``, ``fit_method``, ``fit_sigma``: refit the model
+* ``estimator``: re-estimate the experimental variogram and refit
+* ``bin_func``, ``n_lags``, ``maxlag``: rebin, re-estimate and refit
+
+The copy shares the coordinates, values, pairwise distances and differences
+with the previous Variogram. This is safe, as skgstat replaces these arrays
+instead of changing them in place.
+
+"""
+import copy
+
+import numpy as np
+import skgstat
+
+from gstat_classroom.metrics import timed
+
+
+# keyword arguments passed to skgstat.Variogram
+VARIOGRAM_ARGS = ('model', 'estimator', 'dist_func', 'bin_func', 'n_lags', 'maxlag', 'fit_method', 'fit_sigma')
+
+# settings which need a new Variogram
+REBUILD = {'data', 'dist_func'}
+
+# settings which need new lag classes
+REBIN = {'bin_func', 'n_lags', 'maxlag'}
+
+
+class Variogram(skgstat.Variogram):
+    """skgstat.Variogram with vectorized binning and a cached experimental variogram
+
+    skgstat scans all point pairs once per lag class, to build the lag groups
+    and again every time the experimental variogram is accessed. Here, the
+    pairs are sorted by distance once, so that every lag class is a slice
+    of the sorted pairs, whatever the binning. The lag groups are only built
+    if requested. The experimental variogram is only estimated again if the
+    bins, the pairwise differences or the estimator changed. Results are
+    equal up to floating point rounding, as the pairs within a lag class
+    are summed up in a different order.
+
+    Parameters
+    ----------
+    distance_index : dict
+        Optional, precomputed pairwise distances of the coordinates for the
+        distance function, as returned by DataManager.get_distance_index.
+        ``distance`` is the condensed distance vector, ``order`` the indices
+        sorting it and ``sorted`` the sorted distances. The arrays are used
+        instead of calculating them and are shared between Variograms.
+
+    All other arguments are passed to skgstat.Variogram.
+
+    Variograms loaded from a storage backend or sent to a worker process
+    are restored without their pairwise differences. These are only built
+    on first access, as the kriging never needs them.
+
+    """
+    def __init__(self, *args, distance_index=None, **kwargs):
+        self._distance_index = distance_index
+        super().__init__(*args, **kwargs)
+
+    @property
+    def _diff(self):
+        if self.__dict__.get('_diff_pending'):
+            self.__dict__['_diff_pending'] = False
+            self._calc_diff(force=True)
+        return self.__dict__.get('_diff')
+
+    @_diff.setter
+    def _diff(self, diff):
+        self.__dict__['_diff'] = diff
+
+    def set_dist_function(self, func):
+        # the index is only valid for the distance function it was built for
+        if getattr(self, '_dist_func_name', None) not in (None, func):
+            self._distance_index = None
+        super().set_dist_function(func)
+
+    def _calc_distances(self, force=False):
+        index = getattr(self, '_distance_index', None)
+        if index is not None:
+            self._dist = index['distance']
+        else:
+            super()._calc_distances(force=force)
+
+    def _sorted_pairs(self):
+        d = self.distance
+
+        cache = getattr(self, '_sorted_pairs_cache', None)
+        if cache is None or cache[0] is not d or cache[1] is not self._diff:
+            index = getattr(self, '_distance_index', None)
+            if index is not None and index['distance'] is d:
+                order, sorted_dist = index['order'], index['sorted']
+            else:
+                # the order of the distances does not depend on the binning
+                order = np.argsort(d)
+                if order.size < np.iinfo(np.int32).max:
+                    order = order.astype(np.int32)
+                sorted_dist = d[order]
+            cache = (d, self._diff, order, sorted_dist, self._diff[order])
+            self._sorted_pairs_cache = cache
+
+        return cache[2:]
+
+    def _lag_class_bounds(self):
+        _, sorted_dist, _ = self._sorted_pairs()
+
+        # bins are the upper edges, the first class starts at 0
+        upper = np.searchsorted(sorted_dist, self.bins, side='left')
+        lower = np.concatenate(([0], upper[:-1]))
+
+        return lower, upper
+
+    def _calc_groups(self, force=False):
+        # the lag classes are slices of the sorted pairs, the group
+        # array is only built when requested by lag_groups
+        if force:
+            self._groups = None
+
+    def lag_groups(self):
+        if self._groups is None:
+            order, _, _ = self._sorted_pairs()
+            lower, upper = self._lag_class_bounds()
+
+            # -1 is the group for distances outside maxlag
+            groups = np.ones(len(order), dtype=int) * -1
+            groups[order[:upper[-1]]] = np.repeat(np.arange(len(upper)), upper - lower)
+            self._groups = groups
+
+        return self._groups
+
+    def lag_classes(self):
+        _, _, sorted_diff = self._sorted_pairs()
+
+        for lo, up in zip(*self._lag_class_bounds()):
+            yield sorted_diff[lo:up]
+
+    @property
+    def experimental(self):
+        bins = self.bins
+
+        cache = getattr(self, '_experimental_cache', None)
+        if cache is None or not np.array_equal(cache[0], bins) or cache[1] is not self._diff \
+                or cache[2] is not self._estimator or cache[3] != self._kwargs:
+            cache = (bins, self._diff, self._estimator, dict(self._kwargs), super().experimental)
+            self._experimental_cache = cache
+
+        return cache[4].copy()
+
+
+def variogram_settings(data, model='spherical', estimator='matheron', bin_func='even', dist_func='euclidean',
+                       n_lags=10, fit_method='trf', fit_sigma=None, maxlag=None) -> dict:
+    """Collect the settings of a Variogram, as passed by the user"""
+    # fit_sigma string 'none' has to be converted to Python None
+    if fit_sigma == 'none':
+        fit_sigma = None
+
+    return dict(
+        data=data,
+        model=model,
+        estimator=estimator,
+        bin_func=bin_func,
+        dist_func=dist_func,
+        n_lags=n_lags,
+        fit_method=fit_method,
+        fit_sigma=fit_sigma,
+        maxlag=maxlag
+    )
+
+
+def changed_settings(settings: dict, previous_settings: dict = None) -> set:
+    """Names of all settings which differ from the previous settings"""
+    if previous_settings is None:
+        return set(settings.keys()) | REBUILD
+    return {k for k, v in settings.items() if previous_settings.get(k) != v}
+
+
+def shallow_copy(variogram: Variogram) -> Variogram:
+    """Copy a Variogram without copying its arrays"""
+    # pending differences are built once and shared with the copy
+    variogram._calc_diff()
+    V = copy.copy(variogram)
+    V._kwargs = dict(variogram._kwargs)
+    return V
+
+
+@timed('skgstat')
+def estimate(coordinates, values, settings: dict, previous: Variogram = None, previous_settings: dict = None,
+             distance_index=None, check=None) -> Variogram:
+    """Estimate a Variogram, reusing the previous one where possible
+
+    Parameters
+    ----------
+    coordinates : numpy.ndarray
+        Observation coordinates
+    values : numpy.ndarray
+        Observation values
+    settings : dict
+        Settings as returned by :func:`variogram_settings`
+    previous : Variogram
+        Previous Variogram of this session. It is never changed.
+    previous_settings : dict
+        Settings used to estimate ``previous``
+    distance_index : dict, callable
+        Precomputed distances for the coordinates and the distance function
+        in settings, as returned by DataManager.get_distance_index, or a
+        function returning them. Only used if a new Variogram is built.
+    check : callable
+        Called between the stages of the estimation. It may raise an
+        exception to cancel the estimation, ie. if its result is not
+        needed anymore.
+
+    Returns
+    -------
+    variogram : Variogram
+
+    """
+    changed = changed_settings(settings, previous_settings)
+    check = check or (lambda: None)
+
+    # new data or distances, build from scratch
+    if previous is None or not isinstance(previous, Variogram) or changed & REBUILD:
+        if callable(distance_index):
+            distance_index = distance_index()
+        check()
+        return Variogram(coordinates, values, distance_index=distance_index, **{k: settings[k] for k in VARIOGRAM_ARGS})
+
+    V = shallow_copy(previous)
+    if not changed:
+        return V
+
+    # same order as in Variogram.__init__, as the binning function
+    # may overwrite n_lags
+    if changed & REBIN:
+        V.n_lags = settings['n_lags']
+        V.maxlag = settings['maxlag']
+        V.set_bin_func(settings['bin_func'])
+        check()
+
+    if 'estimator' in changed:
+        V.set_estimator(settings['estimator'])
+
+    if 'model' in changed:
+        V.set_model(settings['model'])
+
+    if 'fit_method' in changed:
+        V.fit_method = settings['fit_method']
+
+    if 'fit_sigma' in changed:
+        V.fit_sigma = settings['fit_sigma']
+
+    # reuses distances and differences, recalculates what was reset above
+    check()
+    V.fit(force=False)
+
+    return V
@@ -0,0 +1,106 @@
+"""
+Content-addressed fingerprints for datasets, variograms and kriging fields.
+
+NumPy arrays are hashed from their raw buffers (dtype, shape and bytes),
+which is fast and, unlike ``str(array)``, never collides on the summarized
+repr of large arrays. Everything else is hashed in a canonical form, so
+dict ordering does not change the fingerprint.
+
+"""
+import hashlib
+
+import numpy as np
+
+# arrays are fed to the hash in chunks of this many bytes
+CHUNK_SIZE = 1 << 24
+
+
+def _update_array(h, arr: np.ndarray):
+    # object arrays have no meaningful buffer, hash the elements instead
+    if arr.dtype.hasobject:
+        h.update(b'O' + repr(arr.shape).encode())
+        for item in arr.flat:
+            _update(h, item)
+        return
+
+    # hash the header: dtype and shape
+    h.update(b'A' + arr.dtype.str.encode() + repr(arr.shape).encode())
+
+    # this only copies if the array is not C-contiguous
+    buf = memoryview(np.ascontiguousarray(arr)).cast('B')
+
+    # stream the buffer without copying it
+    for start in range(0, buf.nbytes, CHUNK_SIZE):
+        h.update(buf[start:start + CHUNK_SIZE])
+
+
+def _update(h, obj):
+    if isinstance(obj, np.ndarray):
+        _update_array(h, obj)
+    elif isinstance(obj, np.generic):
+        _update(h, obj.item())
+    elif isinstance(obj, dict):
+        h.update(b'D%d' % len(obj))
+        for key in sorted(obj.keys(), key=str):
+            _update(h, str(key))
+            _update(h, obj[key])
+    elif isinstance(obj, (list, tuple)):
+        h.update(b'L%d' % len(obj))
+        for item in obj:
+            _update(h, item)
+    elif obj is None or isinstance(obj, (bool, int, float, str)):
+        # repr keeps the type distinguishable, ie. 1 vs 1.0 vs '1'
+        h.update(b'S' + repr(obj).encode())
+    elif callable(obj):
+        name = '%s.%s' % (getattr(obj, '__module__', ''), getattr(obj, '__qualname__', repr(obj)))
+        h.update(b'F' + name.encode())
+    else:
+        h.update(b'R' + repr(obj).encode())
+
+
+def fingerprint(*objs) -> str:
+    """Return the SHA-256 hex digest of the passed objects"""
+    h = hashlib.sha256()
+    for obj in objs:
+        _update(h, obj)
+
+    return h.hexdigest()
+
+
+def variogram_params(variogram) -> dict:
+    """Canonical estimation parameters of a skgstat.Variogram"""
+    desc = variogram.describe()
+
+    params = dict(desc.get('params', {}))
+    params.update(desc.get('kwargs', {}))
+
+    return params
+
+
+def dataset_fingerprint(data: dict) -> str:
+    """Fingerprint of a dataset dict as returned by a dataset creator"""
+    return fingerprint('dataset', data)
+
+
+def variogram_fingerprint(variogram) -> str:
+    """Fingerprint of the input data and estimation parameters of a Variogram"""
+    return fingerprint(
+        'variogram',
+        variogram.coordinates,
+        variogram.values,
+        variogram_params(variogram)
+    )
+
+
+def kriging_fingerprint(field, sigma=None) -> str:
+    """Fingerprint of a kriging result"""
+    return fingerprint('kriging', dict(field=field, sigma=sigma))
+
+
+def kriging_params_fingerprint(variogram_hash: str, grid_size: int, min_points: int, max_points: int, mode: str) -> str:
+    """Fingerprint of a kriging request, known before the field is calculated"""
+    return fingerprint(
+        'kriging-params',
+        variogram_hash,
+        dict(grid_size=int(grid_size), min_points=int(min_points), max_points=int(max_points), mode=mode)
+    )
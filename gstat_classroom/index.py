@@ -1,7 +1,9 @@
 import dash_html_components as html 
 import dash_bootstrap_components as dbc 
 import dash_core_components as dcc
-from dash.dependencies import Output, Input
+import dash
+from dash.dependencies import Output, Input, State
+import uuid
 
 from gstat_classroom.app import app
 from gstat_classroom.chapters import home, chapter1, chapter2, chapter3
@@ -79,6 +81,7 @@ LAYOUT = dbc.Container(
         dcc.Store(id='data-store', storage_type='session'),
         dcc.Store(id='current-variogram-id', storage_type='session'),
         dcc.Store(id='current-kriging-id', storage_type='session'),
+        dcc.Store(id='session-id', storage_type='session'),
 
         dcc.Location(id='url', refresh=False),
         navbar,
@@ -99,6 +102,9 @@ LAYOUT = dbc.Container(
 
 app.layout = LAYOUT
 
+# the flask server, including all page callbacks, for WSGI servers
+server = app.server
+
 # validation layout
 app.validation_layout = html.Div([
     LAYOUT,
@@ -126,5 +132,17 @@ def display_page(pathname):
         return '404'
 
 
+# identifies the browser session, ie. to drop its outdated requests
+@app.callback(
+    Output('session-id', 'data'),
+    Input('url', 'pathname'),
+    State('session-id', 'data')
+)
+def assign_session_id(pathname, session_id):
+    if session_id is not None:
+        return dash.no_update
+    return uuid.uuid4().hex
+
+
 if __name__=='__main__':
     app.run_server(debug=True)
\ No newline at end of file
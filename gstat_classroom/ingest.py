@@ -0,0 +1,244 @@
+"""
+Chunked ingestion of user datasets into memory-mapped arrays.
+
+A point cloud file has one row per observation. All columns but the last
+are coordinates, the last column holds the values. Supported files are
+
+    .csv  comma separated text, an optional header line is skipped
+    .npy  2D NumPy array
+
+Files of more than settings.MAX_OBSERVATIONS rows are rejected before
+they are parsed. The file is read and validated in chunks of rows, and
+written into
+float64 ``coordinates.npy`` and ``values.npy`` under
+``DATAPATH/uploads/<fingerprint>``. The arrays are opened memory-mapped,
+so a dataset is never held in memory as a whole. Identical files end up
+in the same folder. The label of the dataset is kept in ``meta.json``,
+so that uploads are listed again after a restart.
+
+"""
+import os
+import re
+import json
+import base64
+import shutil
+import itertools
+import uuid
+
+import numpy as np
+
+from gstat_classroom import settings
+from gstat_classroom.fingerprint import dataset_fingerprint
+
+
+def upload_dir() -> str:
+    from gstat_classroom.datasets import DATAPATH
+    return os.path.join(DATAPATH, 'uploads')
+
+
+def _is_header(line: str, delimiter: str) -> bool:
+    try:
+        [float(v) for v in line.split(delimiter)]
+        return False
+    except ValueError:
+        return True
+
+
+def _validate(chunk: np.ndarray, n_cols: int, first_row: int):
+    if chunk.ndim != 2 or chunk.shape[1] != n_cols:
+        raise ValueError('Row %d: expected %d columns' % (first_row + 1, n_cols))
+
+    bad = ~np.isfinite(chunk).all(axis=1)
+    if bad.any():
+        raise ValueError('Row %d: coordinates and values have to be finite numbers' % (first_row + np.argmax(bad) + 1))
+
+
+def _check_size(n_rows: int, max_observations: int):
+    if max_observations is not None and n_rows > max_observations:
+        raise ValueError('The dataset has %d observations, at most %d are supported. Please upload a sample of it.' % (n_rows, max_observations))
+
+
+def _open(dest: str, n_rows: int, n_cols: int):
+    coords = np.lib.format.open_memmap(os.path.join(dest, 'coordinates.npy'), mode='w+', dtype=float, shape=(n_rows, n_cols - 1))
+    values = np.lib.format.open_memmap(os.path.join(dest, 'values.npy'), mode='w+', dtype=float, shape=(n_rows, ))
+    return coords, values
+
+
+def _write_csv(path, dest, chunk_rows, delimiter, max_observations):
+    # first pass: count the rows and columns, without parsing
+    with open(path) as f:
+        first = f.readline()
+        header = _is_header(first, delimiter)
+        n_cols = len(first.split(delimiter))
+        n_rows = sum(1 for line in f if line.strip()) + (0 if header else 1)
+
+    if n_cols < 2:
+        raise ValueError('A dataset needs at least one coordinate and one value column')
+    _check_size(n_rows, max_observations)
+
+    coords, values = _open(dest, n_rows, n_cols)
+
+    # second pass: parse and validate chunk by chunk
+    with open(path) as f:
+        lines = (line for line in f if line.strip())
+        if header:
+            next(lines)
+
+        row = 0
+        while row < n_rows:
+            block = list(itertools.islice(lines, chunk_rows))
+            if not block:
+                break
+            try:
+                chunk = np.loadtxt(block, delimiter=delimiter, ndmin=2)
+            except ValueError as e:
+                raise ValueError('Rows %d - %d: %s' % (row + 1, row + len(block), str(e)))
+
+            _validate(chunk, n_cols, row)
+            coords[row:row + len(chunk)] = chunk[:, :-1]
+            values[row:row + len(chunk)] = chunk[:, -1]
+            row += len(chunk)
+
+    return coords, values
+
+
+def _write_npy(path, dest, chunk_rows, max_observations):
+    src = np.load(path, mmap_mode='r')
+    if src.ndim != 2 or src.shape[1] < 2:
+        raise ValueError('Expected a 2D array with at least one coordinate and one value column')
+    _check_size(len(src), max_observations)
+
+    coords, values = _open(dest, *src.shape)
+    for row in range(0, len(src), chunk_rows):
+        chunk = np.asarray(src[row:row + chunk_rows], dtype=float)
+        _validate(chunk, src.shape[1], row)
+        coords[row:row + len(chunk)] = chunk[:, :-1]
+        values[row:row + len(chunk)] = chunk[:, -1]
+
+    return coords, values
+
+
+def ingest_file(path, chunk_rows=settings.INGEST_CHUNK_ROWS, delimiter=',', dest_dir=None,
+                max_observations=settings.MAX_OBSERVATIONS) -> dict:
+    """Read a point cloud file into memory-mapped arrays
+
+    Parameters
+    ----------
+    path : str
+        Path to a .csv or .npy file
+    chunk_rows : int
+        Number of rows read and validated at once
+    delimiter : str
+        Column delimiter of CSV files
+    dest_dir : str
+        Folder for the dataset folders, defaults to DATAPATH/uploads
+    max_observations : int
+        Largest number of rows accepted. None disables the limit.
+
+    Returns
+    -------
+    data : dict
+        Read-only memory-mapped ``coordinates`` and ``values``, like the
+        dataset creators in gstat_classroom.datasets
+
+    Raises
+    ------
+    ValueError
+        If the file type is not supported, a row is invalid or the file
+        has too many rows
+
+    """
+    dest_dir = upload_dir() if dest_dir is None else dest_dir
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in ('.csv', '.npy'):
+        raise ValueError("Only .csv and .npy files are supported, got '%s'" % ext)
+
+    # write to a temporary folder first
+    tmp = os.path.join(dest_dir, '.%s.tmp' % uuid.uuid4().hex)
+    os.makedirs(tmp)
+    try:
+        if ext == '.csv':
+            coords, values = _write_csv(path, tmp, chunk_rows, delimiter, max_observations)
+        else:
+            coords, values = _write_npy(path, tmp, chunk_rows, max_observations)
+
+        if len(values) < 3:
+            raise ValueError('A dataset needs at least 3 observations')
+
+        coords.flush()
+        values.flush()
+        h = dataset_fingerprint(dict(coordinates=coords, values=values))
+        del coords, values
+
+        # content addressed, an existing folder holds the same data
+        dest = os.path.join(dest_dir, h)
+        try:
+            os.rename(tmp, dest)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    return load_dataset(dest)
+
+
+def upload_path(h, dest_dir=None):
+    """Folder of the uploaded dataset h, None if there is none"""
+    # h may come from the browser, only fingerprints are valid folder names
+    if not isinstance(h, str) or not re.fullmatch(r'[0-9a-f]{64}', h):
+        return None
+    path = os.path.join(upload_dir() if dest_dir is None else dest_dir, h)
+    return path if os.path.isdir(path) else None
+
+
+def write_label(h, label, dest_dir=None):
+    """Store the label of the uploaded dataset h in its folder"""
+    path = upload_path(h, dest_dir=dest_dir)
+    if path is not None:
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(dict(hash=h, label=label), f)
+
+
+def read_label(path) -> str:
+    try:
+        with open(os.path.join(path, 'meta.json')) as f:
+            return json.load(f)['label']
+    except (OSError, ValueError, KeyError):
+        return 'Uploaded dataset %s' % os.path.basename(path)[:8]
+
+
+def list_uploads(dest_dir=None) -> dict:
+    """Labels of all uploaded datasets by fingerprint"""
+    dest_dir = upload_dir() if dest_dir is None else dest_dir
+    if not os.path.isdir(dest_dir):
+        return {}
+    return {h: read_label(os.path.join(dest_dir, h)) for h in sorted(os.listdir(dest_dir)) if upload_path(h, dest_dir)}
+
+
+def load_dataset(dest) -> dict:
+    """Open an ingested dataset folder memory-mapped"""
+    return dict(
+        coordinates=np.load(os.path.join(dest, 'coordinates.npy'), mmap_mode='r'),
+        values=np.load(os.path.join(dest, 'values.npy'), mmap_mode='r')
+    )
+
+
+def save_upload(contents: str, filename: str, dest_dir=None, chunk_size=1 << 22) -> str:
+    """Decode the contents of a dcc.Upload into a file, chunk by chunk
+
+    Returns the path of the file, which keeps the extension of filename.
+    """
+    dest_dir = upload_dir() if dest_dir is None else dest_dir
+    os.makedirs(dest_dir, exist_ok=True)
+
+    # contents is a data URL: 'data:<mime>;base64,<data>'
+    start = contents.index(',') + 1
+    path = os.path.join(dest_dir, '.%s%s' % (uuid.uuid4().hex, os.path.splitext(filename)[1].lower()))
+
+    # chunk_size is a multiple of 4, so that every chunk decodes on its own
+    with open(path, 'wb') as f:
+        for i in range(start, len(contents), chunk_size):
+            f.write(base64.b64decode(contents[i:i + chunk_size]))
+
+    return path
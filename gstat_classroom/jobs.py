@@ -0,0 +1,213 @@
+"""
+Background jobs for long running callbacks.
+
+A callback submits a job and immediately returns its id. The job runs in
+a local thread pool and reports its progress to a job store, which is
+polled by the browser. Job ids are derived from the job parameters, so a
+submission identical to a pending or running job is coalesced into it.
+
+The job store uses the same backend as the DataManager. With the
+``sqlite`` backend, the status of a job can be polled from any worker,
+while the job itself runs in the worker it was submitted to.
+
+Short callbacks, which run whenever a slider moves, are coalesced per
+browser session by the :class:`Coalescer`: a request is dropped or
+cancelled as soon as a newer one of the same session arrives.
+
+"""
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from gstat_classroom import settings
+from gstat_classroom.backends import create_backend
+from gstat_classroom.fingerprint import fingerprint
+
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+ERROR = 'error'
+
+
+class JobManager:
+    """Run functions in a thread pool and track their progress
+
+    Parameters
+    ----------
+    max_workers : int
+        Number of jobs run concurrently in this process.
+    backend : str
+        Job store backend URL, see :func:`gstat_classroom.backends.create_backend`.
+    job_cache : dict
+        max_entries and ttl of the job store.
+    stale_after : float
+        Seconds without progress after which a pending or running job is
+        considered dead, ie. because its worker was restarted. A new
+        submission with the same parameters starts the job again.
+
+    """
+    def __init__(self, max_workers=settings.JOB_WORKERS, backend=settings.CACHE_BACKEND,
+                 job_cache=settings.JOB_CACHE, stale_after=settings.JOB_STALE_AFTER):
+        # status entries change, never keep local copies of them
+        self.JOBS = create_backend(backend, 'jobs', local_entries=0, **job_cache)
+        self.stale_after = stale_after
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gstat-job')
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, key=None, **kwargs) -> str:
+        """Run func(*args, progress=callback, **kwargs) in the background
+
+        The job id is the fingerprint of the function and ``key``, which
+        defaults to the passed arguments. The return value of func is
+        stored as the job result and has to be serializable by the backend.
+        func reports its progress as ``progress(fraction, **info)``, the
+        info is added to the job status.
+
+        Returns
+        -------
+        job_id : str
+
+        """
+        job_id = fingerprint('job', func, (args, kwargs) if key is None else key)
+
+        with self._lock:
+            # coalesce with a job already in progress
+            if self.is_active(job_id):
+                return job_id
+
+            # start with a fresh status, the job may have run before
+            self.JOBS.set(job_id, dict(status=PENDING, progress=0.0, result=None, error=None, mtime=time.time()))
+
+        self._executor.submit(self._run, job_id, func, args, kwargs)
+
+        return job_id
+
+    def status(self, job_id) -> dict:
+        """Status of a job as dict or None, if the job is unknown"""
+        return self.JOBS.get(job_id)
+
+    def is_active(self, job_id) -> bool:
+        """True, if the job is pending or running and not stale"""
+        job = self.status(job_id)
+        if job is None or job['status'] not in (PENDING, RUNNING):
+            return False
+        return time.time() - job['mtime'] < self.stale_after
+
+    def stats(self) -> dict:
+        return self.JOBS.stats()
+
+    def _update(self, job_id, **status):
+        job = dict(self.status(job_id) or {})
+        job.update(status, mtime=time.time())
+        self.JOBS.set(job_id, job)
+
+    def _run(self, job_id, func, args, kwargs):
+        def progress(fraction, **info):
+            self._update(job_id, status=RUNNING, progress=float(fraction), **info)
+
+        self._update(job_id, status=RUNNING)
+        try:
+            result = func(*args, progress=progress, **kwargs)
+        except Exception as e:
+            self._update(job_id, status=ERROR, error='%s: %s' % (type(e).__name__, str(e)))
+        else:
+            self._update(job_id, status=DONE, progress=1.0, result=result)
+
+
+class Superseded(Exception):
+    """A newer request of the same session arrived"""
+    pass
+
+
+class Ticket:
+    """Handle of a request registered with the :class:`Coalescer`"""
+    def __init__(self, coalescer, key, token):
+        self._coalescer = coalescer
+        self.key = key
+        self.token = token
+
+    def is_latest(self) -> bool:
+        # requests without session are never superseded. If the entry
+        # expired, no newer request can be told apart
+        if self.key is None:
+            return True
+        latest = self._coalescer.LATEST.get(self.key)
+        return latest is None or latest == self.token
+
+    def check(self):
+        """Raise Superseded, if a newer request of the session arrived"""
+        if not self.is_latest():
+            self._coalescer.count('cancelled')
+            raise Superseded(self.key)
+
+
+class Coalescer:
+    """Drop all but the latest request of a browser session
+
+    Every request writes a new token as the latest of its session. Requests
+    of a moving slider wait ``delay`` seconds, if another request of the
+    session arrived meanwhile, it is dropped. Afterwards, :meth:`Ticket.check` cancels
+    the request at the next check, once a newer one arrives. As the last
+    written token wins, this works across worker processes sharing the
+    backend.
+
+    Parameters
+    ----------
+    backend : str
+        Store backend URL, see :func:`gstat_classroom.backends.create_backend`.
+    session_cache : dict
+        max_entries and ttl of the store of the latest requests.
+    delay : float
+        Debounce delay in seconds.
+
+    """
+    def __init__(self, backend=settings.CACHE_BACKEND, session_cache=settings.SESSION_CACHE, delay=settings.DEBOUNCE_DELAY):
+        # the latest token changes with every request
+        self.LATEST = create_backend(backend, 'sessions', local_entries=0, **session_cache)
+        self.delay = delay
+
+        self._lock = threading.Lock()
+        self.counts = dict(requests=0, dropped=0, cancelled=0)
+
+    def begin(self, session_id, name, debounce=True) -> Ticket:
+        """Register a request as the latest of the session and debounce it
+
+        Requests triggered by a single change, like a dropdown selection,
+        should not be debounced and are passed with ``debounce=False``.
+        The delay is slept in the calling thread, ie. the request thread
+        of the Dash callback.
+
+        Raises
+        ------
+        Superseded
+            If a newer request of the session arrived within the delay
+
+        """
+        self.count('requests')
+        if session_id is None:
+            return Ticket(self, None, None)
+
+        ticket = Ticket(self, '%s-%s' % (session_id, name), uuid.uuid4().hex)
+        self.LATEST.set(ticket.key, ticket.token)
+
+        if debounce and self.delay:
+            time.sleep(self.delay)
+            if not ticket.is_latest():
+                self.count('dropped')
+                raise Superseded(ticket.key)
+
+        return ticket
+
+    def count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def stats(self) -> dict:
+        return dict(self.LATEST.stats(), **self.counts)
+
+
+JOBMANAGER = JobManager()
+COALESCER = Coalescer()
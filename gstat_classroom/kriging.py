@@ -0,0 +1,522 @@
+"""
+Kriging on a regular grid covering a Variogram's observations.
+
+The grid is interpolated in chunks of target points, so that long running
+interpolations can report their progress. With more than one job, the
+chunks are interpolated as tiles in the shared pool of
+:mod:`gstat_classroom.workers`. Each worker builds the OrdinaryKriging
+instance once per Variogram and settings, so that only the target points
+of a tile are sent to the workers.
+
+For a progressive preview, the grid can be kriged in levels of growing
+size. The levels are chosen to nest into each other, so that the points
+of a coarser level are copied into the next one instead of interpolated.
+
+If the neighbors of the grid points are known, ie. from a
+:class:`NeighborIndex` cached per dataset, the grid is kriged without
+skgstat.OrdinaryKriging. The neighbors are queried once for the largest
+number of neighbors offered and sliced to max_points and the range of the
+Variogram, and all kriging systems of a chunk with the same number of
+neighbors are solved in one batched call. The ``'grouped'`` engine
+exploits, that adjacent grid points mostly share the same neighbors: each
+distinct kriging matrix is inverted once and kept in an LRU cache, the
+previews of a progressive kriging and other grid sizes reuse it. In the
+worker pool, only the neighbors of a tile are sent. Each worker keeps
+the kriging state per Variogram and an LRU cache of matrices of its own,
+keyed by the Variogram fingerprint like the one of the calling process.
+
+"""
+import threading
+
+import numpy as np
+from scipy.spatial import cKDTree
+from skgstat import OrdinaryKriging
+
+from gstat_classroom import settings
+from gstat_classroom.cache import CacheStore
+from gstat_classroom.fingerprint import fingerprint, variogram_fingerprint
+from gstat_classroom.workers import run_tasks
+
+# distance metrics supported by the KD-tree, as p of the Minkowski distance
+TREE_METRICS = {
+    'euclidean': 2,
+    'minkowski': 2,
+    'cityblock': 1,
+    'chebyshev': np.inf
+}
+
+
+# inverted kriging matrices of the 'grouped' engine, per process
+MATRICES = CacheStore(**settings.KRIGING_MATRIX_CACHE)
+
+# kriged points and distinct neighbor sets of the 'grouped' engine
+GROUPING = dict(points=0, groups=0)
+_grouping_lock = threading.Lock()
+
+
+def kriging_grid(variogram, grid_size: int):
+    """Regular grid_size x grid_size grid over the first two coordinate dimensions"""
+    coords = variogram.coordinates
+    min_x, max_x = np.min(coords[:, 0]), np.max(coords[:, 0])
+    min_y, max_y = np.min(coords[:, 1]), np.max(coords[:, 1])
+
+    return np.mgrid[min_x:max_x:grid_size * 1j, min_y:max_y:grid_size * 1j]
+
+
+def preview_levels(grid_size: int, coarsest=settings.KRIGING_PREVIEW_SIZE) -> list:
+    """Grid sizes of a progressive kriging, ending with grid_size
+
+    A grid of size c nests into a grid of size g, if (g - 1) is a multiple
+    of (c - 1). Each level is the largest nesting grid, which is a factor
+    of at least 2 coarser. If the nesting levels do not get down to about
+    coarsest, or grow by more than a factor of 8, non-nesting levels are
+    added, which have to be kriged in full.
+    """
+    levels = [grid_size]
+    while levels[0] > coarsest:
+        n = levels[0] - 1
+        # the smallest factor gives the finest coarser level
+        factor = next((p for p in range(2, int(n ** 0.5) + 1) if n % p == 0), n)
+        if n // factor + 1 < 5:
+            break
+        levels.insert(0, n // factor + 1)
+
+    if levels[0] > 2 * coarsest:
+        levels.insert(0, coarsest)
+
+    # fill large gaps
+    i = 1
+    while i < len(levels):
+        if levels[i] > 8 * levels[i - 1]:
+            levels.insert(i, 4 * levels[i - 1])
+        i += 1
+
+    return levels
+
+
+def nests(coarse_size: int, grid_size: int) -> bool:
+    """True, if all points of the coarse grid are points of the grid"""
+    return coarse_size > 1 and (grid_size - 1) % (coarse_size - 1) == 0
+
+
+def minkowski(a, b, p):
+    """Distances between a and b along the last axis"""
+    diff = np.abs(a - b)
+    if p == 1:
+        return diff.sum(axis=-1)
+    if p == 2:
+        return np.sqrt((diff**2).sum(axis=-1))
+    if p == np.inf:
+        return diff.max(axis=-1)
+    return (diff**p).sum(axis=-1) ** (1 / p)
+
+
+class NeighborIndex:
+    """KD-tree over the observation locations of a dataset
+
+    Like skgstat.OrdinaryKriging, only the first of duplicated locations is
+    used. Neighbors are returned as indices into the original coordinates.
+
+    Parameters
+    ----------
+    coordinates : numpy.ndarray
+        Observation coordinates
+    metric : str
+        Distance metric, one of TREE_METRICS
+
+    """
+    def __init__(self, coordinates, metric='euclidean'):
+        coordinates = np.asarray(coordinates, dtype=float)
+        if coordinates.ndim == 1:
+            coordinates = coordinates[:, None]
+
+        _, keep = np.unique(coordinates, axis=0, return_index=True)
+        keep.sort()
+
+        self.coordinates = coordinates
+        self.metric = metric
+        self.p = TREE_METRICS[metric]
+        self.keep = keep
+        self.tree = cKDTree(coordinates[keep])
+
+    def query(self, points, k: int, chunk_size=50_000):
+        """The k nearest observations of each point, sorted by distance
+
+        Returns
+        -------
+        dist, idx : numpy.ndarray
+            float32 distances and int32 indices shaped (len(points), k).
+            Missing neighbors have an infinite distance and index -1.
+
+        """
+        points = np.asarray(points, dtype=float)
+        k = max(1, min(k, len(self.keep)))
+        dist = np.empty((len(points), k), dtype=np.float32)
+        idx = np.empty((len(points), k), dtype=np.int32)
+
+        for start in range(0, len(points), chunk_size):
+            d, i = self.tree.query(points[start:start + chunk_size], k=k, p=self.p)
+            d, i = d.reshape(-1, k), i.reshape(-1, k)
+
+            # the tree pads missing neighbors with its size
+            found = i < len(self.keep)
+            dist[start:start + chunk_size] = np.where(found, d, np.inf)
+            idx[start:start + chunk_size] = np.where(found, self.keep[np.where(found, i, 0)], -1)
+
+        return dist, idx
+
+
+def kriging_state(variogram, min_points: int, max_points: int, mode='exact', precision=100,
+                  engine=settings.KRIGING_ENGINE) -> dict:
+    """Model and neighbor settings of batched ordinary kriging
+
+    The settings and the lookup table of mode ``'estimate'`` follow
+    skgstat.OrdinaryKriging. The engine is ``'batched'`` or ``'grouped'``,
+    see :func:`krige_neighbors`.
+    """
+    if engine not in ('batched', 'grouped'):
+        raise ValueError("engine has to be 'batched' or 'grouped'")
+
+    desc = variogram.describe()
+    state = dict(
+        values=np.asarray(variogram.values, dtype=float),
+        gamma=variogram.fitted_model,
+        range=desc['effective_range'],
+        sill=desc['sill'],
+        min_points=min_points,
+        max_points=max_points,
+        mode=mode,
+        engine=engine
+    )
+
+    # cached kriging matrices are only valid for the same observations and model
+    if engine == 'grouped':
+        state['key'] = fingerprint('kriging-matrix', variogram_fingerprint(variogram), mode, desc['effective_range'], desc['sill'], desc['nugget'])
+
+    if mode == 'estimate':
+        state['precision'] = precision
+        state['table'] = state['gamma'](np.linspace(0, state['range'], precision))
+
+    return state
+
+
+def _gamma(state, dist):
+    # skgstat evaluates the model per element, neighborhoods share most pairs
+    u, inverse = np.unique(dist, return_inverse=True)
+    return state['gamma'](u)[inverse].reshape(dist.shape)
+
+
+def _semivariance(state, dist):
+    if state['mode'] != 'estimate':
+        return _gamma(state, dist)
+
+    idx = (dist / state['range'] * state['precision']).astype(int)
+    inside = idx < state['precision']
+    return np.where(inside, state['table'][np.where(inside, idx, 0)], state['sill'])
+
+
+def _solve(a, b):
+    # one singular system would fail the whole batch
+    try:
+        return np.linalg.solve(a, b[..., None])[..., 0]
+    except np.linalg.LinAlgError:
+        pass
+
+    result = np.full(b.shape, np.nan)
+    for i in range(len(a)):
+        try:
+            result[i] = np.linalg.solve(a[i], b[i])
+        except np.linalg.LinAlgError:
+            pass
+    return result
+
+
+def _invert(a):
+    # like _solve, singular matrices give NaN
+    try:
+        return np.linalg.inv(a)
+    except np.linalg.LinAlgError:
+        pass
+
+    result = np.full(a.shape, np.nan)
+    for i in range(len(a)):
+        try:
+            result[i] = np.linalg.inv(a[i])
+        except np.linalg.LinAlgError:
+            pass
+    return result
+
+
+def _kriging_matrices(state, idx, pair_distances):
+    # kriging matrices with the Lagrange row and column, like OrdinaryKriging
+    m, c = idx.shape
+    a = np.ones((m, c + 1, c + 1))
+    a[:, :c, :c] = _semivariance(state, np.asarray(pair_distances(idx), dtype=float))
+    a[:, np.arange(c), np.arange(c)] = 0
+    a[:, c, c] = 0
+    return a
+
+
+def _grouped_solve(state, idx, b, pair_distances, cache=MATRICES):
+    """Solve the kriging systems of sorted neighbor sets, grouped by set"""
+    sets, inverse = np.unique(idx, axis=0, return_inverse=True)
+    with _grouping_lock:
+        GROUPING['points'] += len(idx)
+        GROUPING['groups'] += len(sets)
+
+    c = idx.shape[1]
+    inv = np.empty((len(sets), c + 1, c + 1))
+    keys = [(state['key'], s.tobytes()) for s in sets]
+    missing = []
+    for i, key in enumerate(keys):
+        matrix = cache.get(key)
+        if matrix is None:
+            missing.append(i)
+        else:
+            inv[i] = matrix
+
+    if missing:
+        inv[missing] = _invert(_kriging_matrices(state, sets[missing], pair_distances))
+        for i in missing:
+            cache.set(keys[i], inv[i].copy())
+
+    # the kriging matrices are symmetric, so are their inverses
+    return np.einsum('ij,ijk->ik', b, inv[inverse.reshape(-1)])
+
+
+def krige_neighbors(state, nb, nb_dist, pair_distances):
+    """Ordinary kriging of points from their sorted neighbors
+
+    Neighbors beyond the range of the Variogram are dropped, points with
+    less than min_points neighbors left are NaN. All kriging systems with
+    the same number of neighbors are solved at once. The ``'grouped'``
+    engine of the state builds one kriging matrix per distinct neighbor
+    set, inverts it once and keeps the inverse in the MATRICES cache.
+
+    Parameters
+    ----------
+    state : dict
+        Settings as returned by :func:`kriging_state`
+    nb : numpy.ndarray
+        Indices of the up to max_points nearest observations of each point,
+        sorted by distance
+    nb_dist : numpy.ndarray
+        Distances to the neighbors, infinite for missing neighbors
+    pair_distances : callable
+        Returns the (m, c, c) distances between the observations of an
+        (m, c) index array
+
+    Returns
+    -------
+    z, sigma : numpy.ndarray
+        Estimates and kriging variance of each point
+
+    """
+    nb_dist = np.where(nb_dist <= state['range'], nb_dist, np.inf)
+    count = np.isfinite(nb_dist).sum(axis=1)
+
+    z = np.full(len(nb), np.nan)
+    sigma = np.full(len(nb), np.nan)
+
+    for c in np.unique(count[count >= max(state['min_points'], 1)]):
+        sel = np.flatnonzero(count == c)
+        idx, dist = nb[sel, :c], nb_dist[sel, :c]
+
+        b = np.ones((len(sel), c + 1))
+        if state['engine'] == 'grouped':
+            # the same neighbors in any order share one kriging matrix
+            order = np.argsort(idx, axis=1)
+            idx, dist = np.take_along_axis(idx, order, axis=1), np.take_along_axis(dist, order, axis=1)
+            b[:, :c] = _gamma(state, np.asarray(dist, dtype=float))
+            weights = _grouped_solve(state, idx, b, pair_distances)
+        else:
+            b[:, :c] = _gamma(state, np.asarray(dist, dtype=float))
+            weights = _solve(_kriging_matrices(state, idx, pair_distances), b)
+        z[sel] = np.einsum('ij,ij->i', weights[:, :c], state['values'][idx])
+        sigma[sel] = np.einsum('ij,ij->i', weights[:, :c], b[:, :c]) + weights[:, c]
+
+    return z, sigma
+
+
+def _coordinate_distances(coordinates, p):
+    # pairwise distances of the neighbors, from their coordinates
+    def pair_distances(idx):
+        c = coordinates[idx]
+        return minkowski(c[:, :, None, :], c[:, None, :, :], p)
+    return pair_distances
+
+
+def _krige_tile(worker, start, end, x, y, min_points, max_points, mode):
+    # the OrdinaryKriging instances are kept per worker and Variogram
+    key = ('ok', min_points, max_points, mode)
+    if key not in worker:
+        worker[key] = OrdinaryKriging(
+            worker['variogram'],
+            min_points=min_points,
+            max_points=max_points,
+            mode=mode,
+            perf=True
+        )
+
+    ok = worker[key]
+    z = ok.transform(x, y)
+    return start, end, z, ok.sigma
+
+
+def _krige_neighbor_tile(worker, start, end, nb, nb_dist, min_points, max_points, mode, engine):
+    # the kriging state and pair distances are kept per worker and Variogram
+    key = ('neighbors', min_points, max_points, mode, engine)
+    if key not in worker:
+        variogram = worker['variogram']
+        worker[key] = (
+            kriging_state(variogram, min_points, max_points, mode=mode, engine=engine),
+            _coordinate_distances(np.asarray(variogram.coordinates, dtype=float), TREE_METRICS[variogram.dist_function])
+        )
+    state, pairs = worker[key]
+
+    # a worker runs one task at a time, the counters only change by this tile
+    hits, misses = MATRICES.hits, MATRICES.misses
+    points, groups = GROUPING['points'], GROUPING['groups']
+    z, s = krige_neighbors(state, nb, nb_dist, pairs)
+
+    counts = dict(
+        hits=MATRICES.hits - hits,
+        misses=MATRICES.misses - misses,
+        points=GROUPING['points'] - points,
+        groups=GROUPING['groups'] - groups
+    )
+    return start, end, z, s, counts
+
+
+def krige(variogram, grid_size: int, min_points: int, max_points: int, mode='exact',
+          chunk_size=settings.KRIGING_CHUNK_SIZE, n_jobs=settings.KRIGING_N_JOBS, progress=None, coarse=None,
+          neighbors=None, engine=settings.KRIGING_ENGINE):
+    """Interpolate the Variogram's observations on a regular grid
+
+    Parameters
+    ----------
+    variogram : skgstat.Variogram
+        Fitted Variogram
+    grid_size : int
+        Number of grid cells along each axis
+    min_points : int
+        Minimum number of neighbors used for each kriging matrix
+    max_points : int
+        Maximum number of neighbors used for each kriging matrix
+    mode : str
+        ``'exact'`` or ``'estimate'``, see skgstat.OrdinaryKriging
+    chunk_size : int
+        Number of grid points interpolated at once, this is the tile size
+        if n_jobs is larger than one
+    n_jobs : int
+        Number of tiles interpolated at the same time in the worker pool.
+        With 1, the grid is interpolated in the calling process.
+    progress : callable
+        Called with the completed fraction in [0, 1] after every chunk
+    coarse : tuple
+        Optional (field, sigma) of a coarser kriging with the same settings.
+        (grid_size - 1) has to be a multiple of its size - 1, see
+        :func:`preview_levels`. Its points are copied, not interpolated.
+    neighbors : tuple
+        Optional (dist, idx) of the nearest observations of every grid
+        point, as returned by :meth:`NeighborIndex.query` for at least
+        max_points neighbors and the distance metric of the Variogram.
+        The grid is kriged without skgstat.OrdinaryKriging then.
+    engine : str
+        ``'grouped'`` or ``'batched'``, see :func:`krige_neighbors`. Only
+        used with neighbors.
+
+    Returns
+    -------
+    field, sigma : numpy.ndarray
+        Estimates and kriging variance, shaped (grid_size, grid_size)
+
+    """
+    xx, yy = kriging_grid(variogram, grid_size)
+    x, y = xx.flatten(), yy.flatten()
+
+    field = np.empty(x.size)
+    sigma = np.empty(x.size)
+
+    # grid points to interpolate
+    targets = np.arange(x.size)
+    if coarse is not None:
+        if not nests(coarse[0].shape[0], grid_size):
+            raise ValueError('The coarse grid does not nest into a %dx%d grid' % (grid_size, grid_size))
+
+        step = (grid_size - 1) // (coarse[0].shape[0] - 1)
+        known = np.zeros(xx.shape, dtype=bool)
+        known[::step, ::step] = True
+        field.reshape(xx.shape)[::step, ::step] = coarse[0]
+        sigma.reshape(xx.shape)[::step, ::step] = coarse[1]
+        targets = np.flatnonzero(~known)
+
+    if neighbors is not None and (neighbors[0].shape[0] != x.size or neighbors[0].shape[1] < min(max_points, len(variogram.values))):
+        raise ValueError('The neighbors do not cover a %dx%d grid with %d neighbors' % (grid_size, grid_size, max_points))
+
+    bounds = [(start, min(start + chunk_size, targets.size)) for start in range(0, targets.size, chunk_size)]
+    n_jobs = min(n_jobs or 1, len(bounds))
+
+    if n_jobs > 1 and neighbors is None:
+        tasks = [(start, end, x[targets[start:end]], y[targets[start:end]], min_points, max_points, mode) for start, end in bounds]
+
+        # stitch the tiles in order of completion
+        for done, (start, end, z, s) in enumerate(run_tasks(_krige_tile, variogram, tasks, n_jobs=n_jobs), start=1):
+            field[targets[start:end]] = z
+            sigma[targets[start:end]] = s
+
+            if progress is not None:
+                progress(done / len(bounds))
+
+        return field.reshape(xx.shape), sigma.reshape(xx.shape)
+
+    if n_jobs > 1:
+        dist, idx = neighbors
+        tasks = [(start, end, idx[targets[start:end], :max_points], dist[targets[start:end], :max_points], min_points, max_points, mode, engine) for start, end in bounds]
+
+        # the matrix cache lookups of the workers are counted here as well
+        for done, (start, end, z, s, counts) in enumerate(run_tasks(_krige_neighbor_tile, variogram, tasks, n_jobs=n_jobs), start=1):
+            field[targets[start:end]] = z
+            sigma[targets[start:end]] = s
+            MATRICES.count(hits=counts['hits'], misses=counts['misses'])
+            with _grouping_lock:
+                GROUPING['points'] += counts['points']
+                GROUPING['groups'] += counts['groups']
+
+            if progress is not None:
+                progress(done / len(bounds))
+
+        return field.reshape(xx.shape), sigma.reshape(xx.shape)
+
+    if neighbors is not None:
+        dist, idx = neighbors
+        state = kriging_state(variogram, min_points, max_points, mode=mode, engine=engine)
+        pairs = _coordinate_distances(np.asarray(variogram.coordinates, dtype=float), TREE_METRICS[variogram.dist_function])
+
+        for done, (start, end) in enumerate(bounds, start=1):
+            t = targets[start:end]
+            field[t], sigma[t] = krige_neighbors(state, idx[t, :max_points], dist[t, :max_points], pairs)
+
+            if progress is not None:
+                progress(done / len(bounds))
+
+        return field.reshape(xx.shape), sigma.reshape(xx.shape)
+
+    ok = OrdinaryKriging(
+        variogram,
+        min_points=min_points,
+        max_points=max_points,
+        mode=mode,
+        perf=True
+    )
+
+    for done, (start, end) in enumerate(bounds, start=1):
+        idx = targets[start:end]
+        field[idx] = ok.transform(x[idx], y[idx])
+        # sigma is replaced by every transform
+        sigma[idx] = ok.sigma
+
+        if progress is not None:
+            progress(done / len(bounds))
+
+    return field.reshape(xx.shape), sigma.reshape(xx.shape)
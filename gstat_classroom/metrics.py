@@ -0,0 +1,261 @@
+"""
+Performance metrics of the Dash callbacks.
+
+:func:`instrument` wraps every ``app.callback`` registration. Per callback
+and process, it records the wall and CPU time, the size of the JSON
+response and how the wall time splits into phases:
+
+    skgstat        estimating and describing variograms
+    plotly         building figures
+    serialization  JSON encoding, including the Dash response
+    other          everything else
+
+Library code marks its phases with :func:`phase` or :func:`timed`. Outside
+of a callback, both do nothing. The metrics are served in the Prometheus
+text format, callbacks slower than a threshold are logged.
+
+"""
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+
+from dash.exceptions import PreventUpdate
+
+from gstat_classroom import settings
+
+logger = logging.getLogger(__name__)
+
+PHASES = ('skgstat', 'plotly', 'serialization', 'other')
+
+# phases of the callback running in the current thread
+_RECORD = contextvars.ContextVar('callback_record', default=None)
+
+
+class Histogram:
+    """Cumulative Prometheus histogram"""
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, le in enumerate(self.buckets):
+            if value <= le:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+class CallbackMetrics:
+    """Thread-safe metrics of all callbacks of one process
+
+    Parameters
+    ----------
+    time_buckets : tuple
+        Upper bounds of the wall time histogram in seconds
+    size_buckets : tuple
+        Upper bounds of the payload size histogram in bytes
+    slow_callback : float
+        Callbacks taking longer are logged as warning. None disables the log.
+
+    """
+    def __init__(self, time_buckets=settings.METRICS['time_buckets'], size_buckets=settings.METRICS['size_buckets'],
+                 slow_callback=settings.METRICS['slow_callback']):
+        self.time_buckets = time_buckets
+        self.size_buckets = size_buckets
+        self.slow_callback = slow_callback
+        self._lock = threading.Lock()
+        self.callbacks = {}
+
+    def _get(self, name) -> dict:
+        m = self.callbacks.get(name)
+        if m is None:
+            m = self.callbacks[name] = dict(
+                calls={'ok': 0, 'prevented': 0, 'error': 0},
+                wall=Histogram(self.time_buckets),
+                cpu=0.0,
+                payload=Histogram(self.size_buckets),
+                phases={p: 0.0 for p in PHASES}
+            )
+        return m
+
+    def observe(self, name, outcome, wall, cpu, payload, phases):
+        with self._lock:
+            m = self._get(name)
+            m['calls'][outcome] += 1
+            m['wall'].observe(wall)
+            m['cpu'] += cpu
+            if payload is not None:
+                m['payload'].observe(payload)
+            for p, seconds in phases.items():
+                m['phases'][p] += seconds
+
+        if self.slow_callback is not None and wall > self.slow_callback:
+            logger.warning(
+                'slow callback %s (%s): %.3f s wall, %.3f s cpu, %s bytes, %s',
+                name, outcome, wall, cpu, payload if payload is not None else '-',
+                ', '.join('%s %.3f s' % (p, s) for p, s in phases.items() if s > 0)
+            )
+
+    def clear(self):
+        with self._lock:
+            self.callbacks = {}
+
+    def prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+
+        def header(metric, kind, help):
+            lines.append('# HELP %s %s' % (metric, help))
+            lines.append('# TYPE %s %s' % (metric, kind))
+
+        def histogram(metric, name, h):
+            for le, count in zip(h.buckets, h.counts):
+                lines.append('%s_bucket{callback="%s",le="%g"} %d' % (metric, name, le, count))
+            lines.append('%s_bucket{callback="%s",le="+Inf"} %d' % (metric, name, h.count))
+            lines.append('%s_sum{callback="%s"} %r' % (metric, name, h.sum))
+            lines.append('%s_count{callback="%s"} %d' % (metric, name, h.count))
+
+        with self._lock:
+            items = sorted(self.callbacks.items())
+
+            header('gstat_callback_calls_total', 'counter', 'Callback invocations by outcome')
+            for name, m in items:
+                for outcome, n in m['calls'].items():
+                    lines.append('gstat_callback_calls_total{callback="%s",outcome="%s"} %d' % (name, outcome, n))
+
+            header('gstat_callback_wall_seconds', 'histogram', 'Wall time of the callbacks, including the response serialization')
+            for name, m in items:
+                histogram('gstat_callback_wall_seconds', name, m['wall'])
+
+            header('gstat_callback_cpu_seconds_total', 'counter', 'CPU time of the callbacks in the serving thread')
+            for name, m in items:
+                lines.append('gstat_callback_cpu_seconds_total{callback="%s"} %r' % (name, m['cpu']))
+
+            header('gstat_callback_phase_seconds_total', 'counter', 'Wall time of the callbacks by phase')
+            for name, m in items:
+                for p, seconds in m['phases'].items():
+                    lines.append('gstat_callback_phase_seconds_total{callback="%s",phase="%s"} %r' % (name, p, seconds))
+
+            header('gstat_callback_payload_bytes', 'histogram', 'Size of the JSON responses of the callbacks')
+            for name, m in items:
+                histogram('gstat_callback_payload_bytes', name, m['payload'])
+
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = CallbackMetrics()
+
+
+def _switch(record):
+    # book the time since the last switch to the running phase
+    now = time.perf_counter()
+    running = record['stack'][-1] if record['stack'] else 'other'
+    record['phases'][running] += now - record['since']
+    record['since'] = now
+
+
+@contextmanager
+def phase(name):
+    """Book the wall time of the block to a phase of the running callback
+
+    Phases nest, the time of an inner phase is not booked to the outer one.
+    """
+    record = _RECORD.get()
+    if record is None:
+        yield
+        return
+
+    _switch(record)
+    record['stack'].append(name)
+    try:
+        yield
+    finally:
+        _switch(record)
+        record['stack'].pop()
+
+
+def timed(name):
+    """Decorator booking the calls of a function to a phase"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrument(app, metrics=METRICS, path=settings.METRICS['path']):
+    """Record metrics of all callbacks registered with ``app.callback``
+
+    Has to be called before any callback is registered. The metrics are
+    served at ``path`` on ``app.server``, None disables the endpoint.
+    """
+    register = app.callback
+
+    @wraps(register)
+    def callback(*args, **kwargs):
+        decorator = register(*args, **kwargs)
+
+        def wrap_func(func):
+            name = func.__name__
+
+            # the callback function itself, Dash serializes its output
+            @wraps(func)
+            def run(*a, **kw):
+                output = func(*a, **kw)
+
+                # from here on, Dash serializes the output
+                record = _RECORD.get()
+                if record is not None:
+                    _switch(record)
+                    record['stack'].append('serialization')
+                return output
+
+            add_context = decorator(run)
+
+            # the response, as sent by Dash
+            @wraps(add_context)
+            def measured(*a, **kw):
+                record = dict(phases={p: 0.0 for p in PHASES}, stack=[], since=time.perf_counter())
+                token = _RECORD.set(record)
+                outcome, payload = 'error', None
+                t0, c0 = record['since'], time.thread_time()
+                try:
+                    response = add_context(*a, **kw)
+                    outcome, payload = 'ok', len(response)
+                    return response
+                except PreventUpdate:
+                    outcome = 'prevented'
+                    raise
+                finally:
+                    _switch(record)
+                    wall, cpu = time.perf_counter() - t0, time.thread_time() - c0
+                    _RECORD.reset(token)
+                    metrics.observe(name, outcome, wall, cpu, payload, record['phases'])
+
+            # Dash calls the function stored in the callback map
+            for spec in app.callback_map.values():
+                if spec.get('callback') is add_context:
+                    spec['callback'] = measured
+
+            return measured
+
+        return wrap_func
+
+    app.callback = callback
+
+    if path is not None:
+        from flask import Response
+
+        def serve_metrics():
+            return Response(metrics.prometheus(), mimetype='text/plain; version=0.0.4')
+
+        app.server.add_url_rule(path, 'gstat_metrics', serve_metrics)
+
+    return app
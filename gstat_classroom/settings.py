@@ -1,3 +1,5 @@
+import os
+
 # settings
 MODELS = {
     'spherical': 'Spherical',
@@ -43,3 +45,154 @@ FITTING_WEIGHTS = {
     'exp': 'Decrease by exp(distance)',
     'entropy': 'Weighted by Shannon Entropy (uncertainty)'
 }
+
+# Built-in datasets are created on first use. If a directory is given,
+# they are stored there and memory-mapped after a restart.
+DATASET_DIR = os.environ.get('GSTAT_CLASSROOM_DATASET_DIR')
+
+# Uploaded datasets are read in chunks of rows, the upload size is
+# limited in bytes. Uploads are sent base64 encoded in the JSON body of a
+# callback, the server rejects larger requests.
+INGEST_CHUNK_ROWS = 100_000
+UPLOAD_MAX_BYTES = 200 * 2**20
+REQUEST_MAX_BYTES = UPLOAD_MAX_BYTES * 4 // 3 + 2**20
+
+# Largest number of observations of an uploaded dataset. A Variogram
+# holds n * (n - 1) / 2 point pairs, some 50 million at 10,000
+# observations. Larger uploads are rejected before they are read.
+MAX_OBSERVATIONS = int(os.environ.get('GSTAT_CLASSROOM_MAX_OBSERVATIONS', 10_000))
+
+# DataManager storage backend, 'memory', 'sqlite:///path/to/cache.db' or
+# 'disk:///path/to/directory'. Use sqlite or disk, if the app is served by
+# more than one worker process. Both keep variograms and kriging fields
+# over restarts, disk writes one compressed file per entry. The limits
+# below apply, max_bytes is the disk quota then.
+CACHE_BACKEND = os.environ.get('GSTAT_CLASSROOM_CACHE', 'memory')
+
+# Scattergram and distance-difference plots of more than max_pairs point
+# pairs show a stratified 'sample' of max_pairs pairs, or a 2D 'histogram'
+# of bins x bins cells
+DIAGNOSTICS = dict(
+    max_pairs=50_000,
+    mode='sample',
+    bins=100,
+    seed=42
+)
+
+# DataManager cache limits, ttl in seconds
+VARIOGRAM_CACHE = dict(
+    max_entries=500,
+    max_bytes=512 * 2**20,
+    ttl=2 * 3600
+)
+
+# Largest kriging grid offered in the UI. A field and its kriging
+# variance take 16 bytes per grid point, 4 MB at 500x500, and the preview
+# levels of a progressive kriging add up to a third of that. The kriging
+# cache holds KRIGING_CACHE_FIELDS krigings of the largest grid, or many
+# more of smaller ones.
+KRIGING_MAX_GRID_SIZE = 500
+KRIGING_CACHE_FIELDS = 64
+KRIGING_CACHE = dict(
+    max_entries=500,
+    max_bytes=KRIGING_CACHE_FIELDS * 16 * KRIGING_MAX_GRID_SIZE**2 * 4 // 3,
+    ttl=3600
+)
+
+# serialized figures and descriptions of Variograms
+FIGURE_CACHE = dict(
+    max_entries=5000,
+    max_bytes=256 * 2**20,
+    ttl=2 * 3600
+)
+
+# Pairwise distances computed once per dataset and distance metric.
+# Stored as float32 along with their sort order, this takes 12 bytes per
+# point pair. Larger datasets are recalculated by every Variogram.
+# If a directory is given, the arrays are memory-mapped from there and
+# do not count against max_bytes.
+DISTANCE_CACHE = dict(
+    max_bytes=256 * 2**20,
+    mmap_dir=os.environ.get('GSTAT_CLASSROOM_MMAP_DIR')
+)
+
+# KD-trees over the observation locations, and the nearest observations
+# of kriging grids, per dataset and distance metric. The grids are queried
+# once for max_points neighbors, the largest number offered in chapter3,
+# which takes 8 bytes per neighbor and grid point.
+NEIGHBOR_CACHE = dict(
+    max_bytes=256 * 2**20,
+    max_points=35
+)
+
+# Kriging runs as background job. Number of jobs run at the same time
+# per worker process, and the number of grid points interpolated between
+# two progress updates.
+JOB_WORKERS = int(os.environ.get('GSTAT_CLASSROOM_JOB_WORKERS', 2))
+KRIGING_CHUNK_SIZE = 250
+
+# Long-lived pool of worker processes shared by kriging, sweeps and
+# cross-validations, started on first use. Each worker keeps the last
+# POOL_VARIOGRAMS Variograms it was sent.
+POOL_PROCESSES = int(os.environ.get('GSTAT_CLASSROOM_KRIGING_JOBS', os.cpu_count() or 1))
+POOL_VARIOGRAMS = 4
+
+# Tiles of KRIGING_CHUNK_SIZE points interpolated at the same time in the
+# worker pool, by skgstat.OrdinaryKriging or the KRIGING_ENGINE
+KRIGING_N_JOBS = POOL_PROCESSES
+
+# Engine kriging the grid from the cached neighbors. 'grouped' inverts
+# the kriging matrix of each distinct neighbor set once and keeps it in
+# an LRU cache per process, 'batched' solves one system per grid point.
+KRIGING_ENGINE = os.environ.get('GSTAT_CLASSROOM_KRIGING_ENGINE', 'grouped')
+KRIGING_MATRIX_CACHE = dict(
+    max_entries=50_000,
+    max_bytes=128 * 2**20
+)
+
+# size of the first grid of a progressive kriging preview
+KRIGING_PREVIEW_SIZE = 16
+
+# encoding of the kriging surfaces sent to the browser,
+# 'float32', or quantized 'uint16' or 'uint8'
+SURFACE_ENCODING = 'float32'
+
+# Variogram estimations of a browser session triggered by a slider are
+# delayed by DEBOUNCE_DELAY seconds and dropped, if a newer one arrives
+# meanwhile. The delay is slept in the request thread, which is held
+# meanwhile, so serve the app with enough threads for all students moving
+# sliders at once, ie. gunicorn --threads. 0 disables the debouncing.
+# Latest request per session, ttl in seconds.
+DEBOUNCE_DELAY = float(os.environ.get('GSTAT_CLASSROOM_DEBOUNCE_DELAY', 0.15))
+SESSION_CACHE = dict(
+    max_entries=10000,
+    ttl=3600
+)
+
+# Combinations of a model and estimator sweep fitted at the same time in
+# the worker pool
+SWEEP_N_JOBS = KRIGING_N_JOBS
+
+# Chunks of a cross-validation predicted at the same time in the worker
+# pool, and the number of observations predicted at once. Each chunk holds
+# its distances to all observations.
+CROSSVAL_N_JOBS = KRIGING_N_JOBS
+CROSSVAL_CHUNK_SIZE = 500
+
+# Callback metrics served in the Prometheus text format at path, None
+# disables the endpoint. Callbacks slower than slow_callback seconds are
+# logged, None disables the log.
+METRICS = dict(
+    path='/metrics',
+    slow_callback=float(os.environ['GSTAT_CLASSROOM_SLOW_CALLBACK']) if os.environ.get('GSTAT_CLASSROOM_SLOW_CALLBACK') else None,
+    time_buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    size_buckets=(1e3, 1e4, 1e5, 1e6, 1e7)
+)
+
+# Job status store, ttl in seconds. Jobs without progress for
+# JOB_STALE_AFTER seconds are considered dead.
+JOB_CACHE = dict(
+    max_entries=1000,
+    ttl=3600
+)
+JOB_STALE_AFTER = 120
@@ -0,0 +1,119 @@
+"""
+Fit many models and estimators to the lag classes of one Variogram.
+
+All combinations share the pairwise distances, differences and lag classes
+of the Variogram. The experimental variogram is estimated once per
+estimator, and every model is fitted to it. With more than one job, the
+combinations are fitted in the shared pool of :mod:`gstat_classroom.workers`.
+Each worker keeps the experimental variograms it estimated per Variogram.
+
+"""
+import numpy as np
+
+from gstat_classroom import settings
+from gstat_classroom.estimation import shallow_copy
+from gstat_classroom.workers import run_tasks
+
+
+def _estimated(variogram, estimator, cache):
+    # one copy per estimator, the experimental variogram is cached in it
+    if estimator not in cache:
+        V = shallow_copy(variogram)
+        V.set_estimator(estimator)
+        cache[estimator] = V
+    return cache[estimator]
+
+
+def fit(variogram, estimator: str, model: str, n_points=100, cache=None) -> dict:
+    """Fit a model to the experimental variogram of an estimator
+
+    Variograms estimated for an estimator are kept in the cache dict, to
+    fit further models to them.
+
+    Returns
+    -------
+    result : dict
+        ``estimator``, ``model``, ``rmse``, ``range``, ``sill``, ``nugget``,
+        the ``curve`` of the model as ``x`` and ``y`` lists, and the
+        ``experimental`` variogram. On failure, the ``error`` message
+        instead of the fit.
+
+    """
+    result = dict(estimator=estimator, model=model)
+    try:
+        E = _estimated(variogram, estimator, {} if cache is None else cache)
+        experimental = np.asarray(E.experimental, dtype=float)
+        result['experimental'] = experimental.tolist()
+
+        # skgstat fits unfitted Variograms with force=True, which
+        # recalculates the differences and the experimental variogram
+        V = shallow_copy(E)
+        V.set_model(model)
+        V.fit()
+
+        # skgstat's rmse property fails with recent numpy versions
+        fitted = np.asarray(V.fitted_model(V.bins), dtype=float)
+        desc = V.describe()
+        x = np.linspace(0, V.bins[-1], n_points)
+        result.update(
+            rmse=float(np.sqrt(np.nanmean((fitted - experimental)**2))),
+            range=float(desc['effective_range']),
+            sill=float(desc['sill']),
+            nugget=float(desc['nugget']),
+            curve=dict(x=x.tolist(), y=np.asarray(V.fitted_model(x), dtype=float).tolist())
+        )
+    except Exception as e:
+        result['error'] = '%s: %s' % (type(e).__name__, str(e))
+
+    return result
+
+
+def _fit_task(worker, estimator, model, n_points):
+    return fit(worker['variogram'], estimator, model, n_points=n_points, cache=worker.setdefault('estimators', {}))
+
+
+def sweep(variogram, models=None, estimators=None, n_jobs=settings.SWEEP_N_JOBS, n_points=100) -> dict:
+    """Fit all combinations of models and estimators
+
+    Parameters
+    ----------
+    variogram : gstat_classroom.estimation.Variogram
+        Variogram providing the distances, differences and lag classes
+    models : list
+        Model names, defaults to all of settings.MODELS
+    estimators : list
+        Estimator names, defaults to the estimator of the Variogram
+    n_jobs : int
+        Number of fits running at the same time in the worker pool. With 1,
+        all fits run in the calling process.
+    n_points : int
+        Number of points of each model curve
+
+    Returns
+    -------
+    result : dict
+        ``fits``, the results of :func:`fit` sorted by RMSE, failed fits
+        last, and ``experimental``, the ``x`` and ``y`` lists of the
+        experimental variogram of each estimator.
+
+    """
+    models = list(settings.MODELS) if models is None else list(models)
+    estimators = [variogram.estimator.__name__] if estimators is None else list(estimators)
+    combinations = [(e, m) for e in estimators for m in models]
+
+    n_jobs = min(n_jobs or 1, len(combinations))
+    if n_jobs > 1:
+        fits = list(run_tasks(_fit_task, variogram, [(e, m, n_points) for e, m in combinations], n_jobs=n_jobs))
+    else:
+        cache = {}
+        fits = [fit(variogram, e, m, n_points=n_points, cache=cache) for e, m in combinations]
+
+    # the experimental variograms are part of every fit
+    experimental = {}
+    for f in fits:
+        y = f.pop('experimental', None)
+        if y is not None:
+            experimental[f['estimator']] = dict(x=np.asarray(variogram.bins, dtype=float).tolist(), y=y)
+
+    fits.sort(key=lambda f: (('error' in f), f.get('rmse', np.inf)))
+    return dict(fits=fits, experimental=experimental)
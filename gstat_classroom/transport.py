@@ -0,0 +1,106 @@
+"""
+Compact transport of large arrays to the browser.
+
+Dash serializes NumPy arrays in figures as JSON lists of Python floats,
+which takes about 19 bytes per value. Here, arrays are sent as base64
+encoded little-endian float32, optionally quantized to uint16 or uint8,
+and decoded by ``assets/transport.js`` in the browser:
+
+    float32: 4 bytes per value, ~7 significant digits
+    uint16:  2 bytes per value, max. error (max - min) / 131070
+    uint8:   1 byte per value, max. error (max - min) / 510
+
+NaN is preserved. Quantized arrays reserve the largest integer for it.
+
+"""
+import base64
+
+import numpy as np
+
+
+ENCODINGS = ('float32', 'uint16', 'uint8')
+
+
+def encode_array(arr, encoding='float32') -> dict:
+    """Encode an array for assets/transport.js
+
+    Parameters
+    ----------
+    arr : numpy.ndarray
+        Array of any shape, it is sent in C order.
+    encoding : str
+        One of ``'float32'``, ``'uint16'`` or ``'uint8'``
+
+    Returns
+    -------
+    encoded : dict
+        ``shape``, ``encoding``, base64 ``data`` and for quantized arrays
+        the ``offset`` and ``scale`` to restore the values.
+
+    """
+    if encoding not in ENCODINGS:
+        raise ValueError("encoding has to be one of %s" % str(ENCODINGS))
+
+    arr = np.asarray(arr, dtype=float)
+    result = dict(shape=list(arr.shape), encoding=encoding)
+
+    if encoding == 'float32':
+        buf = arr.astype('<f4')
+    else:
+        dtype = np.dtype('<u2' if encoding == 'uint16' else 'u1')
+        # the largest integer marks NaN
+        levels = np.iinfo(dtype).max - 1
+
+        finite = np.isfinite(arr)
+        offset = float(np.min(arr[finite])) if finite.any() else 0.0
+        span = float(np.max(arr[finite])) - offset if finite.any() else 0.0
+        scale = span / levels if span > 0 else 1.0
+
+        buf = np.full(arr.shape, levels + 1, dtype=dtype)
+        buf[finite] = np.round((arr[finite] - offset) / scale)
+        result.update(offset=offset, scale=scale)
+
+    result['data'] = base64.b64encode(np.ascontiguousarray(buf).tobytes()).decode('ascii')
+    return result
+
+
+def decode_array(encoded: dict) -> np.ndarray:
+    """Inverse of encode_array, as done by assets/transport.js"""
+    encoding = encoded['encoding']
+    dtype = {'float32': '<f4', 'uint16': '<u2', 'uint8': 'u1'}[encoding]
+    buf = np.frombuffer(base64.b64decode(encoded['data']), dtype=dtype)
+
+    if encoding == 'float32':
+        arr = buf.astype(float)
+    else:
+        arr = encoded['offset'] + buf * encoded['scale']
+        arr[buf == np.iinfo(buf.dtype).max] = np.nan
+
+    return arr.reshape(encoded['shape'])
+
+
+def figure_payload(fig, encoding='float32', attrs=('z', )) -> dict:
+    """Split a figure into its JSON and encoded array attributes
+
+    The NumPy arrays of the given trace attributes are removed from the
+    figure and encoded. ``transport.decodeFigure`` in assets/transport.js
+    puts them back in the browser.
+
+    Returns
+    -------
+    payload : dict
+        ``figure`` without the arrays and ``encoded``, a dict of encoded
+        attributes for every trace
+
+    """
+    figure = fig.to_plotly_json()
+
+    encoded = []
+    for trace in figure['data']:
+        enc = {}
+        for name in attrs:
+            if isinstance(trace.get(name), np.ndarray):
+                enc[name] = encode_array(trace.pop(name), encoding=encoding)
+        encoded.append(enc)
+
+    return dict(figure=figure, encoded=encoded)
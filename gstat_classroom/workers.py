@@ -0,0 +1,110 @@
+"""
+Long-lived pool of worker processes, shared by kriging, sweeps and
+cross-validations.
+
+The pool is started on first use and kept for the lifetime of the
+process. Its workers are started by a forkserver, or spawned where that is
+not available, so that they do not inherit the threads and held locks of
+the app process. Each task names the Variogram it works on by its
+fingerprint. A worker deserializes a Variogram once and keeps the last
+settings.POOL_VARIOGRAMS of them, along with anything the tasks derived
+from it. Tasks are sent without the Variogram first, and sent again along
+with the serialized Variogram, if the worker does not know it yet.
+
+"""
+import threading
+import multiprocessing as mp
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from gstat_classroom import settings
+from gstat_classroom.backends import dumps, loads
+from gstat_classroom.fingerprint import variogram_fingerprint
+
+
+_POOL = None
+_pool_lock = threading.Lock()
+
+# Variograms of a worker process and the state derived from them, by fingerprint
+_VARIOGRAMS = OrderedDict()
+
+
+class UnknownVariogram(Exception):
+    """The worker does not hold the Variogram of a task"""
+    pass
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """The shared pool of settings.POOL_PROCESSES worker processes"""
+    global _POOL
+    with _pool_lock:
+        # a crashed worker breaks the pool for good
+        if _POOL is None or getattr(_POOL, '_broken', False):
+            if 'forkserver' in mp.get_all_start_methods():
+                ctx = mp.get_context('forkserver')
+                ctx.set_forkserver_preload(['gstat_classroom.kriging', 'gstat_classroom.sweep', 'gstat_classroom.crossval'])
+            else:
+                ctx = mp.get_context('spawn')
+            _POOL = ProcessPoolExecutor(max_workers=settings.POOL_PROCESSES, mp_context=ctx)
+        return _POOL
+
+
+def _run(func, key, blob, *args):
+    if key not in _VARIOGRAMS:
+        if blob is None:
+            raise UnknownVariogram(key)
+        _VARIOGRAMS[key] = dict(variogram=loads(blob))
+        while len(_VARIOGRAMS) > settings.POOL_VARIOGRAMS:
+            _VARIOGRAMS.popitem(last=False)
+
+    _VARIOGRAMS.move_to_end(key)
+    return func(_VARIOGRAMS[key], *args)
+
+
+def run_tasks(func, variogram, tasks, n_jobs=settings.POOL_PROCESSES):
+    """Run func(worker, *task) for all tasks in the pool
+
+    func has to be a module-level function. ``worker`` is a dict kept per
+    worker process and Variogram, ``worker['variogram']`` holds the
+    Variogram, further keys can be used to keep derived state.
+
+    Parameters
+    ----------
+    func : callable
+        Task function
+    variogram : skgstat.Variogram
+        Variogram shared by all tasks
+    tasks : list
+        Argument tuples of the tasks
+    n_jobs : int
+        Number of tasks running at the same time, at most the pool size
+
+    Yields
+    ------
+    result
+        The return value of each task, in order of completion
+
+    """
+    key = variogram_fingerprint(variogram)
+    blob = None
+    pool = get_pool()
+    tasks = list(tasks)[::-1]
+    pending = {}
+
+    while tasks or pending:
+        while tasks and len(pending) < max(n_jobs, 1):
+            task = tasks.pop()
+            pending[pool.submit(_run, func, key, None, *task)] = task
+
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            task = pending.pop(future)
+            try:
+                result = future.result()
+            except UnknownVariogram:
+                # only the task which missed is sent the Variogram
+                if blob is None:
+                    blob = dumps(variogram)
+                pending[pool.submit(_run, func, key, blob, *task)] = task
+                continue
+            yield result
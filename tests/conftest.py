@@ -0,0 +1,13 @@
+import numpy as np
+import pytest
+import skgstat
+
+
+@pytest.fixture(scope='session')
+def variogram():
+    # continuous coordinates, so that no two neighbors are equally distant
+    rng = np.random.default_rng(42)
+    coords = rng.uniform(0, 100, size=(150, 2))
+    values = np.sin(coords[:, 0] / 15) + np.cos(coords[:, 1] / 20) + rng.normal(0, 0.1, size=150)
+
+    return skgstat.Variogram(coords, values, n_lags=12, model='spherical', maxlag='median')
@@ -0,0 +1,93 @@
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+from gstat_classroom.backends import create_backend, dumps, loads
+from gstat_classroom.estimation import Variogram, shallow_copy
+
+
+@pytest.fixture(params=['sqlite', 'disk'])
+def url(request, tmp_path):
+    if request.param == 'sqlite':
+        return 'sqlite:///%s' % (tmp_path / 'cache.db')
+    return 'disk:///%s' % tmp_path
+
+
+@pytest.fixture(scope='module')
+def process():
+    # a fresh interpreter, which shares nothing but the files with the test
+    with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context('spawn')) as pool:
+        yield pool
+
+
+def _set(url, key, value, limits):
+    create_backend(url, 'test', local_entries=0, **limits).set(key, value)
+
+
+def _get(url, key):
+    return create_backend(url, 'test', local_entries=0).get(key)
+
+
+def test_round_trip_across_processes(url, process):
+    store = create_backend(url, 'test')
+    value = dict(field=np.arange(12.).reshape(3, 4), label='pancake')
+
+    # set in this process, read in the other one
+    store.set('mine', value)
+    theirs = process.submit(_get, url, 'mine').result()
+    np.testing.assert_array_equal(theirs['field'], value['field'])
+    assert theirs['label'] == 'pancake'
+
+    # and the other way round
+    process.submit(_set, url, 'theirs', [1, 2.5, None], {}).result()
+    assert store.get('theirs') == [1, 2.5, None]
+    assert store.get('missing') is None
+
+
+def test_limits_apply_to_entries_of_all_processes(url, process):
+    limits = dict(max_entries=2)
+    if url.startswith('disk'):
+        # rescan the directory on every set to see the entries of the other process
+        limits['scan_interval'] = 0
+    store = create_backend(url, 'test', local_entries=0, **limits)
+    store.set('a', 1)
+    process.submit(_set, url, 'b', 2, limits).result()
+    store.set('c', 3)
+
+    # the oldest entry makes room, down to EVICT_TO of the limits
+    assert len(store) <= 2
+    assert 'a' not in store
+    assert store.get('c') == 3
+
+
+def test_loaded_variograms_build_their_differences_on_first_use(variogram):
+    V = Variogram(variogram.coordinates, variogram.values, n_lags=12, maxlag='median')
+    loaded = loads(dumps(V))
+    assert loaded.__dict__['_diff'] is None
+
+    # kriging only needs the fitted model
+    np.testing.assert_array_equal(loaded.parameters, V.parameters)
+    assert loaded.__dict__['_diff'] is None
+
+    np.testing.assert_array_equal(loaded.experimental, V.experimental)
+    np.testing.assert_array_equal(loaded._diff, V._diff)
+
+    # a copy shares the differences built for the loaded Variogram
+    loaded = loads(dumps(V))
+    assert shallow_copy(loaded)._diff is loaded.__dict__['_diff'] is not None
+
+
+def test_sqlite_evicts_below_the_limits_at_once(tmp_path):
+    store = create_backend('sqlite:///%s' % (tmp_path / 'cache.db'), 'test', local_entries=0, max_entries=10)
+    for i in range(10):
+        store.set(i, i)
+    assert len(store) == 10 and store.evictions == 0
+
+    # EVICT_TO of max_entries are kept, the next set does not evict
+    store.set(10, 10)
+    assert len(store) == 9 and store.evictions == 2
+    assert 0 not in store and 1 not in store and 10 in store
+    store.set(11, 11)
+    assert len(store) == 10 and store.evictions == 2
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+from scipy.spatial.distance import pdist
+
+from gstat_classroom import cache
+from gstat_classroom.cache import CacheStore
+from gstat_classroom.estimation import Variogram
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_evicts_least_recently_used():
+    store = CacheStore(max_entries=2)
+    store.set('a', 1)
+    store.set('b', 2)
+
+    # a is used again, so b is the oldest
+    assert store.get('a') == 1
+    store.set('c', 3)
+
+    assert 'b' not in store
+    assert store.keys() == ['a', 'c']
+    assert store.evictions == 1
+
+
+def test_evicts_by_size_but_keeps_the_new_entry():
+    store = CacheStore(max_bytes=10, sizeof=len)
+    store.set('a', 'xxxx')
+    store.set('b', 'xxxx')
+    assert store.total_bytes == 8
+
+    store.set('c', 'xxxx')
+    assert store.keys() == ['b', 'c']
+
+    # an entry larger than the limit replaces all others
+    store.set('d', 'x' * 20)
+    assert store.keys() == ['d']
+    assert store.total_bytes == 20
+
+
+def test_replacing_an_entry_updates_its_size():
+    store = CacheStore(sizeof=len)
+    store.set('a', 'xxxx')
+    store.set('a', 'xx')
+    assert store.total_bytes == 2
+    assert len(store) == 1
+
+
+def test_expired_entries_are_misses(clock):
+    store = CacheStore(ttl=60)
+    store.set('a', 1)
+
+    clock[0] += 59
+    assert store.get('a') == 1
+
+    # the access does not extend the lifetime
+    clock[0] += 2
+    assert store.get('a') is None
+    assert 'a' not in store
+    assert store.stats()['expirations'] == 1
+    assert store.stats()['misses'] == 1
+
+
+def test_expire_removes_old_entries(clock):
+    store = CacheStore(ttl=60)
+    store.set('a', 1)
+    clock[0] += 30
+    store.set('b', 2)
+    clock[0] += 40
+
+    assert store.expire() == 1
+    assert store.keys() == ['b']
+    assert store.expire(max_age=10) == 1
+    assert len(store) == 0
+
+
+def test_shared_distance_index_is_not_counted(variogram, monkeypatch):
+    # built like DataManager.get_distance_index
+    dist = pdist(variogram.coordinates).astype(np.float32)
+    order = np.argsort(dist).astype(np.int32)
+    index = dict(distance=dist, order=order, sorted=dist[order])
+
+    V = Variogram(variogram.coordinates, variogram.values, n_lags=12, maxlag='median', distance_index=index)
+    V.experimental
+    assert V.distance is dist and V._sorted_pairs()[0] is order
+    size = cache.nbytes(V)
+
+    # the index is counted once in DISTANCES, not by every Variogram
+    monkeypatch.setattr(cache, 'SHARED_ATTRIBUTES', ())
+    shared = dist.nbytes + order.nbytes + index['sorted'].nbytes
+    assert cache.nbytes(V) - size == pytest.approx(shared, abs=1024)
+
+    # the sorted pairwise differences belong to the Variogram
+    assert size > V._diff.nbytes + V._sorted_pairs()[2].nbytes
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from skgstat import OrdinaryKriging
+
+from gstat_classroom.crossval import cross_validate, folds, statistics
+
+
+def naive_leave_one_out(variogram, min_points, max_points, mode):
+    # one OrdinaryKriging per observation, without the observation itself
+    ok = OrdinaryKriging(variogram, min_points=min_points, max_points=max_points, mode=mode)
+    coords, values = ok.coords.copy(), ok.values.copy()
+
+    z, sigma = np.empty(len(values)), np.empty(len(values))
+    for i in range(len(values)):
+        ok.coords, ok.values = np.delete(coords, i, axis=0), np.delete(values, i)
+        z[i] = ok.transform(*coords[i:i + 1].T)[0]
+        sigma[i] = ok.sigma[0]
+    return z, sigma
+
+
+@pytest.mark.parametrize('mode', ['exact', 'estimate'])
+def test_leave_one_out_matches_ordinary_kriging(variogram, mode):
+    z, sigma = naive_leave_one_out(variogram, 3, 10, mode)
+    assert np.isfinite(z).sum() > 0.9 * len(z)
+    result = cross_validate(variogram, 3, 10, mode=mode, chunk_size=40, n_jobs=1)
+
+    np.testing.assert_array_equal(result['observed'], variogram.values)
+    np.testing.assert_array_equal(np.isnan(result['predicted']), np.isnan(z))
+    np.testing.assert_allclose(result['predicted'], z, rtol=1e-6, atol=1e-6)
+    np.testing.assert_allclose(result['sigma'], sigma, rtol=1e-6, atol=1e-6)
+    np.testing.assert_allclose(result['error'], result['predicted'] - result['observed'])
+
+
+def test_pool_matches_calling_process(variogram):
+    steps = {1: [], 2: []}
+    serial = cross_validate(variogram, 3, 10, k=5, chunk_size=40, n_jobs=1, progress=steps[1].append)
+    pooled = cross_validate(variogram, 3, 10, k=5, chunk_size=40, n_jobs=2, progress=steps[2].append)
+    np.testing.assert_array_equal(pooled['predicted'], serial['predicted'])
+    np.testing.assert_array_equal(pooled['fold'], serial['fold'])
+
+    # the progress is reported after each of the 4 chunks
+    assert steps[1] == steps[2] == [0.25, 0.5, 0.75, 1.0]
+
+
+def test_folds():
+    assert np.array_equal(folds(5), np.arange(5))
+    f = folds(100, k=4)
+    assert np.array_equal(np.bincount(f), [25] * 4)
+    assert np.array_equal(f, folds(100, k=4))
+
+
+def test_statistics():
+    observed = np.array([1., 2., 3., 4.])
+    stats = statistics(observed, np.array([1.5, 2., np.nan, 3.5]), np.array([0.25, 1., 1., 0.25]))
+    assert stats['n'] == 4 and stats['valid'] == 3
+    assert stats['me'] == pytest.approx(0)
+    assert stats['rmse'] == pytest.approx(np.sqrt(0.5 / 3))
+    assert stats['msse'] == pytest.approx((1 + 0 + 1) / 3)
@@ -0,0 +1,115 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from imageio import imread, imwrite
+
+from gstat_classroom import datasets
+from gstat_classroom.fingerprint import dataset_fingerprint
+
+
+@pytest.fixture
+def datapath(tmp_path, monkeypatch):
+    # a small image in place of the pancake
+    rng = np.random.default_rng(7)
+    imwrite(str(tmp_path / 'cake.png'), rng.integers(0, 256, size=(40, 60, 3), dtype=np.uint8))
+    monkeypatch.setattr(datasets, 'DATAPATH', str(tmp_path))
+    datasets.load_image_channel.cache_clear()
+    yield tmp_path
+    datasets.load_image_channel.cache_clear()
+
+
+def pancake_loop(fname, seed, n):
+    # the sampling before the vectorization, one point at a time
+    data = imread(os.path.join(datasets.DATAPATH, fname))[:, :, 0]
+    np.random.seed(seed=seed)
+    coords = np.random.randint([0, 0], data.shape, size=(n, 2))
+    vals = np.fromiter((data[c[0], c[1]] for c in coords), dtype=int)
+    return dict(coordinates=coords, values=vals, original2D=data)
+
+
+def test_pancake_batch_samples_like_the_point_loop(datapath):
+    seeds = [0, 1, 42, 1234]
+    batch = datasets.pancake_batch(seeds, fname='cake.png', n=300)
+
+    for seed, data in zip(seeds, batch):
+        expected = pancake_loop('cake.png', seed, 300)
+        for key in ('coordinates', 'values', 'original2D'):
+            np.testing.assert_array_equal(data[key], expected[key])
+        assert data['values'].dtype == expected['values'].dtype
+
+    # the decoded image is shared and read-only
+    assert all(data['original2D'] is batch[0]['original2D'] for data in batch)
+    assert not batch[0]['original2D'].flags.writeable
+
+    single = datasets.pancake(fname='cake.png', seed=42, n=300)
+    np.testing.assert_array_equal(single['coordinates'], batch[2]['coordinates'])
+
+
+CALLS = []
+
+
+def counted(n=10, fname='cake.png'):
+    """Counted dataset"""
+    # slow enough for concurrent requests to meet
+    CALLS.append(n)
+    time.sleep(0.05)
+    rng = np.random.default_rng(n)
+    return dict(coordinates=rng.uniform(size=(n, 2)), values=rng.normal(size=n))
+
+
+def manager(dataset_dir=None):
+    return datasets.DataManager(backend='memory', dataset_dir=dataset_dir)
+
+
+@pytest.fixture(autouse=True)
+def calls():
+    CALLS.clear()
+    return CALLS
+
+
+def test_datasets_are_created_lazily_and_once(datapath, calls):
+    dm = manager()
+    dm.register('counted', counted, n=12)
+    assert dm.get_names()['counted'] == 'Counted dataset'
+    assert calls == []
+
+    # concurrent requests wait for a single creation
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: dm.get_data('counted'), range(8)))
+    assert calls == [12]
+    assert all(data is results[0] for data in results)
+    assert len(results[0]['values']) == 12
+
+    assert dm.get_hash('counted') == dataset_fingerprint(results[0])
+    assert dm.get_data('missing') is None
+
+
+def test_dataset_dir_is_keyed_by_the_creator(datapath, tmp_path, calls):
+    dm = manager(str(tmp_path / 'datasets'))
+    dm.register('counted', counted, n=12)
+    data = dm.get_data('counted')
+    assert calls == [12]
+
+    # a restart opens the stored arrays memory-mapped
+    dm = manager(str(tmp_path / 'datasets'))
+    dm.register('counted', counted, n=12)
+    stored = dm.get_data('counted')
+    assert calls == [12]
+    assert isinstance(stored['values'], np.memmap)
+    np.testing.assert_array_equal(stored['coordinates'], data['coordinates'])
+    assert dm.get_hash('counted') == dataset_fingerprint(data)
+
+    # other arguments or a changed data file create the dataset again
+    key = datasets.creator_fingerprint(counted, dict(n=12))
+    assert datasets.creator_fingerprint(counted, dict(n=13)) != key
+    imwrite(str(datapath / 'cake.png'), np.zeros((4, 4, 3), dtype=np.uint8))
+    assert datasets.creator_fingerprint(counted, dict(n=12)) != key
+
+    dm = manager(str(tmp_path / 'datasets'))
+    dm.register('counted', counted, n=12)
+    dm.get_data('counted')
+    assert calls == [12, 12]
+    assert len(os.listdir(tmp_path / 'datasets')) == 2
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+import skgstat
+
+from gstat_classroom.estimation import Variogram, REBUILD, estimate, variogram_settings, changed_settings, shallow_copy
+
+
+@pytest.fixture(scope='module')
+def data(variogram):
+    return variogram.coordinates, variogram.values
+
+
+def fresh(data, settings):
+    # skgstat's own estimation, without any reuse
+    return skgstat.Variogram(*data, **{k: v for k, v in settings.items() if k != 'data'})
+
+
+def snapshot(V):
+    return dict(bins=V.bins.copy(), experimental=V.experimental.copy(), parameters=list(V.parameters), model=V._model.__name__)
+
+
+def assert_equal_variograms(V, reference):
+    np.testing.assert_allclose(V.bins, reference.bins)
+    np.testing.assert_allclose(V.experimental, reference.experimental, rtol=1e-10, equal_nan=True)
+    np.testing.assert_allclose(V.parameters, reference.parameters, rtol=1e-6)
+    assert V._model.__name__ == reference._model.__name__
+
+
+def test_changed_settings():
+    settings = variogram_settings('pancake', n_lags=12)
+    assert changed_settings(settings) == set(settings) | REBUILD
+    assert changed_settings(settings, dict(settings)) == set()
+    assert changed_settings(dict(settings, n_lags=15, model='gaussian'), settings) == {'n_lags', 'model'}
+
+    # 'none' from the UI is no change to None
+    assert changed_settings(variogram_settings('pancake', n_lags=12, fit_sigma='none'), settings) == set()
+
+
+@pytest.mark.parametrize('base, changes', [
+    ({}, dict(model='gaussian')),
+    ({}, dict(estimator='cressie')),
+    ({}, dict(bin_func='uniform')),
+    ({}, dict(n_lags=15)),
+    ({}, dict(maxlag=60.)),
+    ({}, dict(fit_sigma='linear')),
+    ({}, dict(bin_func='sturges', n_lags=20)),
+    # sturges overwrote n_lags, which has to be set again
+    (dict(bin_func='sturges'), dict(bin_func='even')),
+    (dict(bin_func='sturges'), dict(maxlag=60.)),
+    ({}, dict(model='exponential', estimator='dowd', maxlag='mean'))
+])
+def test_reestimation_matches_new_variogram(data, base, changes):
+    settings = variogram_settings('test', **{'n_lags': 12, 'maxlag': 'median', **base})
+    previous = estimate(*data, settings)
+    before = snapshot(previous)
+
+    new_settings = dict(settings, **changes)
+    V = estimate(*data, new_settings, previous=previous, previous_settings=settings)
+
+    assert V is not previous
+    assert_equal_variograms(V, fresh(data, new_settings))
+
+    # the previous Variogram of the session is unchanged
+    after = snapshot(previous)
+    np.testing.assert_array_equal(after['bins'], before['bins'])
+    np.testing.assert_array_equal(after['experimental'], before['experimental'])
+    assert after['parameters'] == before['parameters'] and after['model'] == before['model']
+    assert_equal_variograms(previous, fresh(data, settings))
+
+
+def test_shallow_copy_does_not_change_the_original(data):
+    V = Variogram(*data, n_lags=12, maxlag='median')
+    before = snapshot(V)
+
+    copied = shallow_copy(V)
+    copied.n_lags = 20
+    copied.set_model('gaussian')
+    copied.fit(force=False)
+
+    assert len(copied.bins) == 20
+    np.testing.assert_array_equal(V.bins, before['bins'])
+    np.testing.assert_array_equal(V.experimental, before['experimental'])
+    assert list(V.parameters) == before['parameters'] and V._model.__name__ == 'spherical'
+    assert V._kwargs is not copied._kwargs
+
+
+@pytest.mark.parametrize('bin_func', ['even', 'uniform'])
+def test_sorted_pairs_binning_matches_skgstat(data, bin_func):
+    V = Variogram(*data, n_lags=12, maxlag='median', bin_func=bin_func)
+    reference = skgstat.Variogram(*data, n_lags=12, maxlag='median', bin_func=bin_func)
+
+    np.testing.assert_array_equal(V.lag_groups(), reference.lag_groups())
+
+    # the pairs of a lag class are in order of distance here
+    classes = list(V.lag_classes())
+    assert len(classes) == len(list(reference.lag_classes()))
+    for mine, theirs in zip(classes, reference.lag_classes()):
+        np.testing.assert_array_equal(np.sort(mine), np.sort(theirs))
+
+    np.testing.assert_allclose(V.experimental, reference.experimental, rtol=1e-10, equal_nan=True)
+
+    # the experimental variogram is cached, but follows the estimator
+    V.set_estimator('cressie')
+    reference.set_estimator('cressie')
+    np.testing.assert_allclose(V.experimental, reference.experimental, rtol=1e-10, equal_nan=True)
@@ -0,0 +1,48 @@
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import skgstat
+
+from gstat_classroom.fingerprint import fingerprint, variogram_fingerprint
+
+
+def _objects():
+    return ('stable', 1, 1.5, None, [True, 'x'], dict(b=2, a=1), np.arange(6, dtype='<i8').reshape(2, 3))
+
+
+def _fingerprint_objects():
+    return fingerprint(*_objects())
+
+
+def test_digest_is_stable():
+    # stored caches and datasets are keyed by these digests
+    assert fingerprint(*_objects()) == 'da4e983ced28a97a7c5a78ea6dec3fae9c9bd11b207c4c47df614c35e162d316'
+
+
+def test_digest_is_stable_across_processes():
+    # string hashing is randomized per interpreter, fingerprints must not be
+    with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context('spawn')) as pool:
+        assert pool.submit(_fingerprint_objects).result() == fingerprint(*_objects())
+
+
+def test_canonical_forms():
+    assert fingerprint(dict(a=1, b=2)) == fingerprint(dict(b=2, a=1))
+
+    # the memory layout of an array does not matter, its dtype and shape do
+    arr = np.arange(12.).reshape(3, 4)
+    assert fingerprint(arr.T) == fingerprint(np.ascontiguousarray(arr.T))
+    assert fingerprint(arr) != fingerprint(arr.astype(np.float32))
+    assert fingerprint(arr) != fingerprint(arr.reshape(4, 3))
+
+    # types are distinguished
+    assert len({fingerprint(1), fingerprint(1.0), fingerprint('1'), fingerprint(True)}) == 4
+    assert fingerprint([1, 2]) != fingerprint([[1, 2]])
+
+
+def test_variogram_fingerprint(variogram):
+    V = skgstat.Variogram(variogram.coordinates, variogram.values, n_lags=12, model='spherical', maxlag='median')
+    assert variogram_fingerprint(V) == variogram_fingerprint(variogram)
+
+    V.set_model('exponential')
+    assert variogram_fingerprint(V) != variogram_fingerprint(variogram)
@@ -0,0 +1,103 @@
+import os
+import base64
+
+import numpy as np
+import pytest
+
+from gstat_classroom import ingest
+
+
+@pytest.fixture
+def table():
+    rng = np.random.default_rng(1)
+    return np.column_stack((rng.uniform(0, 100, size=(20, 2)), rng.normal(size=20)))
+
+
+def write_csv(path, table, header=None, newline='\n'):
+    lines = ([header] if header else []) + [','.join(repr(v) for v in row) for row in table]
+    with open(path, 'w', newline='') as f:
+        f.write(newline.join(lines) + newline)
+    return str(path)
+
+
+def assert_dataset(data, table):
+    np.testing.assert_array_equal(data['coordinates'], table[:, :-1])
+    np.testing.assert_array_equal(data['values'], table[:, -1])
+    assert not data['coordinates'].flags.writeable
+
+
+@pytest.mark.parametrize('header', [None, 'x,y,value'])
+@pytest.mark.parametrize('newline', ['\n', '\r\n'])
+def test_csv(tmp_path, table, header, newline):
+    path = write_csv(tmp_path / 'points.csv', table, header=header, newline=newline)
+    data = ingest.ingest_file(path, chunk_rows=7, dest_dir=str(tmp_path / 'uploads'))
+    assert_dataset(data, table)
+
+
+def test_npy(tmp_path, table):
+    path = str(tmp_path / 'points.npy')
+    np.save(path, table)
+    data = ingest.ingest_file(path, chunk_rows=7, dest_dir=str(tmp_path / 'uploads'))
+    assert_dataset(data, table)
+
+    # identical data ends up in the same folder
+    again = ingest.ingest_file(write_csv(tmp_path / 'points.csv', table), dest_dir=str(tmp_path / 'uploads'))
+    assert_dataset(again, table)
+    assert len(ingest.list_uploads(str(tmp_path / 'uploads'))) == 1
+
+
+@pytest.mark.parametrize('row, message', [
+    ('1.0,2.0,nan', 'Row 13: coordinates and values have to be finite numbers'),
+    ('1.0,2.0', 'Rows 8 - 14'),
+    ('1.0,abc,3.0', 'Rows 8 - 14'),
+])
+def test_bad_rows(tmp_path, table, row, message):
+    path = write_csv(tmp_path / 'points.csv', table)
+    with open(path) as f:
+        lines = f.read().splitlines()
+    lines[12] = row
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines))
+
+    with pytest.raises(ValueError, match=message):
+        ingest.ingest_file(path, chunk_rows=7, dest_dir=str(tmp_path / 'uploads'))
+
+    # nothing is left behind
+    assert os.listdir(tmp_path / 'uploads') == []
+
+
+def test_unsupported_files(tmp_path, table):
+    with pytest.raises(ValueError, match="Only .csv and .npy"):
+        ingest.ingest_file(str(tmp_path / 'points.txt'), dest_dir=str(tmp_path))
+
+    path = str(tmp_path / 'points.npy')
+    np.save(path, table[:, 0])
+    with pytest.raises(ValueError, match='2D array'):
+        ingest.ingest_file(path, dest_dir=str(tmp_path))
+
+
+@pytest.mark.parametrize('ext', ['.csv', '.npy'])
+def test_max_observations(tmp_path, table, ext):
+    path = str(tmp_path / ('points' + ext))
+    if ext == '.csv':
+        write_csv(path, table, header='x,y,value')
+    else:
+        np.save(path, table)
+
+    with pytest.raises(ValueError, match='The dataset has 20 observations, at most 19 are supported'):
+        ingest.ingest_file(path, dest_dir=str(tmp_path / 'uploads'), max_observations=19)
+    assert os.listdir(tmp_path / 'uploads') == []
+
+    data = ingest.ingest_file(path, dest_dir=str(tmp_path / 'uploads'), max_observations=20)
+    assert_dataset(data, table)
+
+
+@pytest.mark.parametrize('size', [0, 1, 2, 3, 4, 11, 12, 13, 100])
+def test_save_upload_decodes_in_chunks(tmp_path, size):
+    raw = os.urandom(size)
+    contents = 'data:application/octet-stream;base64,' + base64.b64encode(raw).decode()
+
+    path = ingest.save_upload(contents, 'Points.NPY', dest_dir=str(tmp_path), chunk_size=8)
+    assert path.endswith('.npy')
+    with open(path, 'rb') as f:
+        assert f.read() == raw
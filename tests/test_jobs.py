@@ -0,0 +1,162 @@
+import time
+import threading
+
+import pytest
+
+from gstat_classroom import jobs
+from gstat_classroom.jobs import JobManager, Coalescer, Superseded, PENDING, RUNNING, DONE, ERROR
+from gstat_classroom.estimation import estimate, variogram_settings
+
+
+def wait_for(manager, job_id, *states, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.status(job_id)
+        if job is not None and job['status'] in states:
+            return job
+        time.sleep(0.005)
+    raise AssertionError('job %s did not reach %s' % (job_id, states))
+
+
+class Blocking:
+    """Job function, which reports half of its progress and waits to be released"""
+    def __init__(self):
+        self.calls = 0
+        self.halfway = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, x, progress=None):
+        self.calls += 1
+        progress(0.5, preview='half')
+        self.halfway.set()
+        assert self.release.wait(5)
+        if x < 0:
+            raise ValueError('negative')
+        return x * 2
+
+
+@pytest.fixture
+def manager():
+    return JobManager(max_workers=2, backend='memory', job_cache=dict(max_entries=100), stale_after=60)
+
+
+def test_submit_poll_and_progress(manager):
+    func = Blocking()
+    job_id = manager.submit(func, 21)
+    assert manager.status(job_id)['status'] in (PENDING, RUNNING)
+
+    assert func.halfway.wait(5)
+    job = manager.status(job_id)
+    assert job['status'] == RUNNING and job['progress'] == 0.5 and job['preview'] == 'half'
+    assert manager.is_active(job_id)
+
+    func.release.set()
+    job = wait_for(manager, job_id, DONE)
+    assert job['progress'] == 1.0 and job['result'] == 42 and job['error'] is None
+    assert not manager.is_active(job_id)
+    assert manager.status('unknown') is None
+
+
+def test_identical_submissions_are_coalesced(manager):
+    func = Blocking()
+    job_id = manager.submit(func, 1)
+    assert func.halfway.wait(5)
+
+    # the same arguments or key give the running job
+    assert manager.submit(func, 1) == job_id
+    other = Blocking()
+    other.release.set()
+    assert manager.submit(other, 2) != job_id
+    assert manager.submit(other, 3, key='k') == manager.submit(other, 4, key='k')
+
+    func.release.set()
+    wait_for(manager, job_id, DONE)
+
+    # a finished job is started again
+    calls = func.calls
+    assert manager.submit(func, 1) == job_id
+    wait_for(manager, job_id, DONE)
+    assert func.calls == calls + 1
+
+
+def test_failed_and_stale_jobs(manager):
+    func = Blocking()
+    func.release.set()
+    job = wait_for(manager, manager.submit(func, -1), ERROR)
+    assert job['error'] == 'ValueError: negative' and job['result'] is None
+
+    # a job without progress for stale_after seconds is started again
+    manager.stale_after = 0
+    func = Blocking()
+    job_id = manager.submit(func, 5)
+    assert func.halfway.wait(5)
+    assert not manager.is_active(job_id)
+    assert manager.submit(func, 5) == job_id
+
+    deadline = time.monotonic() + 5
+    while func.calls < 2 and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert func.calls == 2
+    func.release.set()
+    assert wait_for(manager, job_id, DONE)['result'] == 10
+
+
+@pytest.fixture
+def coalescer():
+    return Coalescer(backend='memory', session_cache=dict(max_entries=100), delay=0.01)
+
+
+def test_debounce_keeps_the_last_request(coalescer, monkeypatch):
+    # a newer request of the session arrives while the first one waits
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) == 1:
+            latest.append(coalescer.begin('session', 'estimate'))
+
+    latest = []
+    monkeypatch.setattr(jobs.time, 'sleep', sleep)
+
+    with pytest.raises(Superseded):
+        coalescer.begin('session', 'estimate')
+    assert sleeps == [0.01, 0.01]
+    assert latest[0].is_latest()
+    assert coalescer.counts == dict(requests=2, dropped=1, cancelled=0)
+
+    # other sessions and names are independent
+    assert coalescer.begin('other', 'estimate').is_latest()
+    assert coalescer.begin('session', 'sweep').is_latest()
+    assert latest[0].is_latest()
+
+
+def test_no_debounce_and_no_session(coalescer, monkeypatch):
+    monkeypatch.setattr(jobs.time, 'sleep', lambda seconds: pytest.fail('slept'))
+    ticket = coalescer.begin('session', 'estimate', debounce=False)
+    assert ticket.is_latest()
+
+    anonymous = coalescer.begin(None, 'estimate')
+    coalescer.begin(None, 'estimate')
+    anonymous.check()
+
+
+def test_check_cancels_superseded_estimations(coalescer, variogram):
+    ticket = coalescer.begin('session', 'estimate', debounce=False)
+    ticket.check()
+
+    # a newer request arrives between two stages of the estimation
+    calls = []
+
+    def check():
+        calls.append(1)
+        if len(calls) == 2:
+            coalescer.begin('session', 'estimate', debounce=False)
+        ticket.check()
+
+    settings = variogram_settings('test', n_lags=12)
+    previous = estimate(variogram.coordinates, variogram.values, settings)
+    with pytest.raises(Superseded):
+        estimate(variogram.coordinates, variogram.values, dict(settings, n_lags=15, model='gaussian'),
+                 previous=previous, previous_settings=settings, check=check)
+    assert len(calls) == 2
+    assert coalescer.counts['cancelled'] == 1
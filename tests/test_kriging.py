@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from gstat_classroom import settings
+from gstat_classroom.cache import CacheStore
+from gstat_classroom import kriging
+from gstat_classroom.kriging import krige, kriging_grid, preview_levels, nests, NeighborIndex
+
+GRID_SIZE = 21
+
+
+@pytest.fixture(scope='module')
+def neighbors(variogram):
+    xx, yy = kriging_grid(variogram, GRID_SIZE)
+    index = NeighborIndex(variogram.coordinates, metric=variogram.dist_function)
+    return index.query(np.column_stack((xx.flatten(), yy.flatten())), settings.NEIGHBOR_CACHE['max_points'])
+
+
+@pytest.fixture(scope='module')
+def reference(variogram):
+    # skgstat.OrdinaryKriging, one system per grid point
+    return {mode: krige(variogram, GRID_SIZE, 3, 10, mode=mode, n_jobs=1) for mode in ('exact', 'estimate')}
+
+
+@pytest.mark.parametrize('engine', ['batched', 'grouped'])
+@pytest.mark.parametrize('mode', ['exact', 'estimate'])
+def test_engines_match_ordinary_kriging(variogram, neighbors, reference, engine, mode):
+    field, sigma = krige(variogram, GRID_SIZE, 3, 10, mode=mode, neighbors=neighbors, engine=engine)
+    ref_field, ref_sigma = reference[mode]
+
+    # grid points without enough neighbors are missing in both
+    np.testing.assert_array_equal(np.isnan(field), np.isnan(ref_field))
+    assert np.isfinite(field).sum() > 0.9 * field.size
+    np.testing.assert_allclose(field, ref_field, rtol=1e-6, atol=1e-6)
+    np.testing.assert_allclose(sigma, ref_sigma, rtol=1e-6, atol=1e-6)
+
+
+def test_grouped_engine_reuses_matrices(variogram, neighbors, monkeypatch):
+    cache = CacheStore()
+    monkeypatch.setattr(kriging._grouped_solve, '__defaults__', (cache, ))
+
+    first = krige(variogram, GRID_SIZE, 3, 10, n_jobs=1, neighbors=neighbors, engine='grouped')
+    assert len(cache) > 0 and cache.misses == len(cache)
+
+    # a second kriging, ie. of another session, inverts nothing
+    hits, misses = cache.hits, cache.misses
+    second = krige(variogram, GRID_SIZE, 3, 10, n_jobs=1, neighbors=neighbors, engine='grouped')
+    assert cache.misses == misses
+    assert cache.hits > hits
+    np.testing.assert_array_equal(second[0], first[0])
+
+
+def test_progressive_levels_match_full_grid(variogram, reference):
+    levels = preview_levels(GRID_SIZE, coarsest=6)
+    assert levels[-1] == GRID_SIZE and nests(levels[-2], GRID_SIZE)
+
+    coarse = None
+    for size in levels:
+        coarse = krige(variogram, size, 3, 10, n_jobs=1, coarse=coarse if coarse is not None and nests(coarse[0].shape[0], size) else None)
+    np.testing.assert_allclose(coarse[0], reference['exact'][0], rtol=1e-10, atol=1e-10)
+
+
+def test_pool_matches_calling_process(variogram, reference):
+    field, sigma = krige(variogram, GRID_SIZE, 3, 10, chunk_size=100, n_jobs=2)
+    np.testing.assert_array_equal(field, reference['exact'][0])
+    np.testing.assert_array_equal(sigma, reference['exact'][1])
+
+
+def test_pool_krige_neighbors_and_counts_matrices(variogram, neighbors):
+    def run(n_jobs):
+        before = dict(kriging.GROUPING, lookups=kriging.MATRICES.hits + kriging.MATRICES.misses, entries=len(kriging.MATRICES))
+        result = krige(variogram, GRID_SIZE, 3, 10, neighbors=neighbors, engine='grouped', chunk_size=100, n_jobs=n_jobs)
+        counts = dict(kriging.GROUPING, lookups=kriging.MATRICES.hits + kriging.MATRICES.misses, entries=len(kriging.MATRICES))
+        return result, {k: counts[k] - before[k] for k in counts}
+
+    (field, sigma), in_process = run(1)
+    (pooled_field, pooled_sigma), pooled = run(2)
+    np.testing.assert_allclose(pooled_field, field, rtol=1e-10, atol=1e-10)
+    np.testing.assert_allclose(pooled_sigma, sigma, rtol=1e-10, atol=1e-10)
+
+    # the workers keep their matrices, their lookups are counted here
+    assert pooled['entries'] == 0
+    assert pooled['lookups'] == in_process['lookups'] > 0
+    assert pooled['points'] == in_process['points']
+    assert pooled['groups'] == in_process['groups']
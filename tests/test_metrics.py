@@ -0,0 +1,80 @@
+import re
+import time
+
+import dash
+import pytest
+import dash_html_components as html
+from dash.dependencies import Input, Output
+from dash.exceptions import PreventUpdate
+
+from gstat_classroom.metrics import CallbackMetrics, instrument, phase, timed
+from benchmarks.load_test import payload
+
+
+@timed('skgstat')
+def slow_estimate(n):
+    time.sleep(0.02)
+    return n * 2
+
+
+@pytest.fixture
+def client():
+    app = dash.Dash(__name__)
+    metrics = CallbackMetrics(time_buckets=(0.01, 1, 10), size_buckets=(10, 10_000), slow_callback=None)
+    instrument(app, metrics=metrics, path='/metrics')
+    app.layout = html.Div([html.Div(id='n'), html.Div(id='double'), html.Div(id='label')])
+
+    @app.callback(Output('double', 'children'), Output('label', 'children'), Input('n', 'children'))
+    def double(n):
+        if n is None:
+            raise PreventUpdate
+        with phase('plotly'):
+            time.sleep(0.01)
+        return slow_estimate(n), 'n=%d' % n
+
+    return app.server.test_client()
+
+
+def update(client, n):
+    return client.post('/_dash-update-component', json=payload([('double', 'children'), ('label', 'children')], [('n', 'children', n)], changed=[('n', 'children')]))
+
+
+def samples(text) -> dict:
+    # metric{labels} value lines of the Prometheus text format
+    return {m.group(1): float(m.group(2)) for m in re.finditer(r'^(\S+\{[^}]*\}) (\S+)$', text, re.M)}
+
+
+def test_callbacks_are_measured_and_served(client):
+    response = update(client, 21)
+    assert response.status_code == 200
+    assert response.get_json()['response'] == {'double': {'children': 42}, 'label': {'children': 'n=21'}}
+
+    assert update(client, None).status_code == 204
+
+    response = client.get('/metrics')
+    assert response.status_code == 200 and response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert '# TYPE gstat_callback_wall_seconds histogram' in text
+    values = samples(text)
+
+    assert values['gstat_callback_calls_total{callback="double",outcome="ok"}'] == 1
+    assert values['gstat_callback_calls_total{callback="double",outcome="prevented"}'] == 1
+    assert values['gstat_callback_calls_total{callback="double",outcome="error"}'] == 0
+    assert values['gstat_callback_wall_seconds_count{callback="double"}'] == 2
+    assert values['gstat_callback_wall_seconds_bucket{callback="double",le="+Inf"}'] == 2
+    assert values['gstat_callback_wall_seconds_sum{callback="double"}'] >= 0.03
+
+    # the sleeps are booked to their phases
+    assert values['gstat_callback_phase_seconds_total{callback="double",phase="skgstat"}'] >= 0.02
+    assert values['gstat_callback_phase_seconds_total{callback="double",phase="plotly"}'] >= 0.01
+
+    # only the response is sized, the prevented update sends none
+    assert values['gstat_callback_payload_bytes_count{callback="double"}'] == 1
+    assert values['gstat_callback_payload_bytes_bucket{callback="double",le="10"}'] == 0
+    assert values['gstat_callback_payload_bytes_bucket{callback="double",le="10000"}'] == 1
+
+
+def test_phases_outside_of_callbacks_do_nothing():
+    assert slow_estimate(2) == 4
+    with phase('plotly'):
+        pass
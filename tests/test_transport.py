@@ -0,0 +1,91 @@
+import json
+import base64
+
+import numpy as np
+import pytest
+import plotly.graph_objects as go
+
+from gstat_classroom.transport import encode_array, decode_array, figure_payload
+
+
+def decode_like_js(encoded):
+    # step by step as transport.decodeArray in assets/transport.js,
+    # typed arrays of the browser are little-endian
+    raw = base64.b64decode(encoded['data'])
+    if encoded['encoding'] == 'float32':
+        values = [float(v) for v in np.frombuffer(raw, dtype='<f4')]
+    else:
+        quantized = np.frombuffer(raw, dtype='<u2' if encoded['encoding'] == 'uint16' else 'u1')
+        nan = 65535 if encoded['encoding'] == 'uint16' else 255
+        values = [float('nan') if int(q) == nan else encoded['offset'] + int(q) * encoded['scale'] for q in quantized]
+
+    if len(encoded['shape']) == 1:
+        return values
+    cols = encoded['shape'][1]
+    return [values[r * cols:(r + 1) * cols] for r in range(encoded['shape'][0])]
+
+
+@pytest.fixture
+def field():
+    rng = np.random.default_rng(3)
+    field = rng.normal(10, 5, size=(17, 23))
+    field[2, 5] = field[16, 0] = np.nan
+    return field
+
+
+@pytest.mark.parametrize('encoding, dtype, levels', [
+    ('float32', '<f4', None),
+    ('uint16', '<u2', 65534),
+    ('uint8', 'u1', 254)
+])
+def test_encoding_matches_transport_js(field, encoding, dtype, levels):
+    encoded = encode_array(field, encoding=encoding)
+
+    # the metadata survives the JSON of a Dash callback
+    encoded = json.loads(json.dumps(encoded))
+    assert encoded['shape'] == [17, 23] and encoded['encoding'] == encoding
+    assert len(base64.b64decode(encoded['data'])) == field.size * np.dtype(dtype).itemsize
+
+    finite = np.isfinite(field)
+    if levels is None:
+        assert 'offset' not in encoded and 'scale' not in encoded
+        tolerance = np.abs(field[finite]).max() * 2**-24
+    else:
+        assert encoded['offset'] == field[finite].min()
+        assert encoded['scale'] == pytest.approx((field[finite].max() - field[finite].min()) / levels)
+        tolerance = encoded['scale'] / 2
+
+    decoded = np.array(decode_like_js(encoded))
+    assert decoded.shape == field.shape
+    np.testing.assert_array_equal(np.isnan(decoded), ~finite)
+    assert np.abs(decoded[finite] - field[finite]).max() <= tolerance * (1 + 1e-9)
+    np.testing.assert_array_equal(decode_array(encoded), decoded)
+
+
+@pytest.mark.parametrize('encoding', ['uint16', 'uint8'])
+def test_quantized_edge_cases(encoding):
+    # constant and all-NaN arrays, one dimension
+    constant = np.array(decode_like_js(encode_array(np.full(5, 2.5), encoding=encoding)))
+    np.testing.assert_array_equal(constant, 2.5)
+    assert np.isnan(decode_like_js(encode_array(np.full(3, np.nan), encoding=encoding))).all()
+
+
+def test_unknown_encoding():
+    with pytest.raises(ValueError):
+        encode_array(np.zeros(3), encoding='float16')
+
+
+def test_figure_payload_restores_surfaces(field):
+    fig = go.Figure([go.Surface(z=field), go.Surface(z=np.log(np.abs(field)))])
+    payload = json.loads(json.dumps(figure_payload(fig, encoding='uint16')))
+
+    # as transport.decodeFigure puts the arrays back into the traces
+    assert all('z' not in trace for trace in payload['figure']['data'])
+    for trace, attrs in zip(payload['figure']['data'], payload['encoded']):
+        for name, encoded in attrs.items():
+            trace[name] = decode_like_js(encoded)
+
+    for trace, original in zip(payload['figure']['data'], fig.data):
+        z = np.array(trace['z'])
+        np.testing.assert_array_equal(np.isnan(z), np.isnan(original.z))
+        assert np.nanmax(np.abs(z - original.z)) <= (np.nanmax(original.z) - np.nanmin(original.z)) / 65534 / 2 * (1 + 1e-9)